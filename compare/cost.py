@@ -0,0 +1,161 @@
+"""
+Static query cost analysis.
+
+Runs before execution and rejects operations that would be too expensive:
+
+- depth: how deeply fields are nested (``GRAPHQL_MAX_DEPTH``);
+- joins: how many relations a ``filter`` or ``orderBy`` argument walks
+  through. ``RelatedFilter``/``RelatedOrder`` chains can cycle
+  (tool metrics -> tool -> tool metrics ...), so each argument is limited
+  separately (``GRAPHQL_MAX_JOINS``);
+- cost: an estimate of the rows the operation loads (``GRAPHQL_MAX_COST``).
+  Every object costs 1 plus 1 per join its connection's arguments make,
+  and a connection multiplies the cost of its children by its page size.
+  The page size is ``first``/``last``, or the connection limit if neither
+  is given.
+
+Introspection fields are free.
+"""
+
+import graphene
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError, GraphQLObjectType, get_named_type
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.language import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+)
+
+MAX_DEPTH = getattr(settings, "GRAPHQL_MAX_DEPTH", 15)
+MAX_JOINS = getattr(settings, "GRAPHQL_MAX_JOINS", 4)
+MAX_COST = getattr(settings, "GRAPHQL_MAX_COST", 50_000)
+
+# Arguments whose nesting is a chain of joins
+JOIN_ARGUMENTS = ("filter", "orderBy")
+# Filter combinators that nest without joining
+COMBINATORS = ("and", "or", "not")
+
+
+def nesting(value):
+    """How many levels of input objects ``value`` nests, ignoring combinators."""
+    if isinstance(value, (list, tuple)):
+        return max((nesting(item) for item in value), default=0)
+    if not isinstance(value, dict):
+        return 0
+    depth = 1
+    for key, item in value.items():
+        if key in COMBINATORS:
+            depth = max(depth, nesting(item))
+        else:
+            depth = max(depth, 1 + nesting(item))
+    return depth
+
+
+def joins(arguments):
+    """The most joins any filter or ordering in ``arguments`` makes."""
+    result = 0
+    for name in JOIN_ARGUMENTS:
+        value = arguments.get(name)
+        if value:
+            depth = nesting(value)
+            if name == "filter":
+                # The innermost level is the lookup: {"name": {"exact": ...}}
+                depth -= 1
+            # ...and the outermost is the argument itself
+            result = max(result, depth - 1)
+    return result
+
+
+def is_connection(graphql_type):
+    graphene_type = getattr(get_named_type(graphql_type), "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(
+        graphene_type, graphene.relay.Connection
+    )
+
+
+def page_size(arguments):
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    size = arguments.get("first") or arguments.get("last") or max_limit
+    return min(size, max_limit) if max_limit else size
+
+
+class Estimate:
+    def __init__(self, schema, fragments, variables):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables
+        self.depth = 0
+
+    def iter_fields(self, selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from self.iter_fields(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is not None:
+                    yield from self.iter_fields(fragment.selection_set)
+
+    def cost(self, parent_type, selection_set, depth=1):
+        """Cost of ``selection_set`` on ``parent_type``."""
+        if depth > self.depth:
+            self.depth = depth
+            if depth > MAX_DEPTH:
+                raise GraphQLError(
+                    f"Query is nested {depth} levels deep; the limit is {MAX_DEPTH}.",
+                    extensions={"code": "QUERY_TOO_DEEP"},
+                )
+
+        total = 0
+        for field_node in self.iter_fields(selection_set):
+            name = field_node.name.value
+            fields = getattr(parent_type, "fields", {})
+            if name.startswith("__") or name not in fields:
+                continue
+            field = fields[name]
+            field_type = get_named_type(field.type)
+            if not isinstance(field_type, GraphQLObjectType):
+                continue
+
+            arguments = get_argument_values(field, field_node, self.variables)
+            field_joins = joins(arguments)
+            if field_joins > MAX_JOINS:
+                raise GraphQLError(
+                    f"'{name}' filters or orders through {field_joins} "
+                    f"relations; the limit is {MAX_JOINS}.",
+                    extensions={"code": "QUERY_TOO_MANY_JOINS"},
+                    nodes=[field_node],
+                )
+
+            children = 0
+            if field_node.selection_set is not None:
+                children = self.cost(field_type, field_node.selection_set, depth + 1)
+            size = page_size(arguments) if is_connection(field.type) else 1
+            total += size * (1 + field_joins + children)
+        return total
+
+
+def check(schema, document, operation, variables):
+    """Raise ``GraphQLError`` if ``operation`` is over any of the limits."""
+    coerced = get_variable_values(
+        schema, operation.variable_definitions or (), variables or {}
+    )
+    if isinstance(coerced, list):
+        # Invalid variables; execution reports them
+        return
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root_type = schema.get_root_type(operation.operation)
+    cost = Estimate(schema, fragments, coerced).cost(root_type, operation.selection_set)
+    if cost > MAX_COST:
+        raise GraphQLError(
+            f"Query cost {cost} is over the limit of {MAX_COST}.",
+            extensions={"code": "QUERY_TOO_EXPENSIVE", "cost": cost},
+        )
@@ -0,0 +1,169 @@
+"""
+Sampling resolver profiler.
+
+``ProfilingMiddleware`` profiles a random ``GRAPHQL_PROFILE_SAMPLE_RATE``
+fraction of requests. On those it records, for every field
+(``Type.field``), the resolver's wall time and the number and time of the
+SQL queries run while it resolved. Unsampled requests only pay for one
+attribute lookup per resolver.
+
+The histograms live in the process that recorded them. ``profile_view``
+serves this process's to staff users as JSON.
+"""
+
+import inspect
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from tools import sql
+
+SAMPLE_RATE = getattr(settings, "GRAPHQL_PROFILE_SAMPLE_RATE", 0.01)
+
+# Upper bounds of the histogram buckets, in milliseconds
+TIME_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last count is everything over the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        n = sum(self.counts)
+        bounds = [str(bound) for bound in self.buckets] + ["inf"]
+        return {
+            "count": n,
+            "total": round(self.total, 3),
+            "mean": round(self.total / n, 3) if n else 0,
+            "max": round(self.max, 3),
+            "buckets": dict(zip(bounds, self.counts)),
+        }
+
+
+class FieldStats:
+    def __init__(self):
+        self.time = Histogram(TIME_BUCKETS)
+        self.sql_count = Histogram(COUNT_BUCKETS)
+        self.sql_time = Histogram(TIME_BUCKETS)
+
+    def as_dict(self):
+        return {
+            "time_ms": self.time.as_dict(),
+            "sql_count": self.sql_count.as_dict(),
+            "sql_time_ms": self.sql_time.as_dict(),
+        }
+
+
+_lock = threading.Lock()
+_stats = {}
+_requests = 0
+
+
+def record(field, elapsed, sql_count, sql_time):
+    with _lock:
+        stats = _stats.get(field)
+        if stats is None:
+            stats = _stats[field] = FieldStats()
+        stats.time.add(elapsed)
+        stats.sql_count.add(sql_count)
+        stats.sql_time.add(sql_time)
+
+
+def snapshot():
+    """Every field's histograms, slowest total time first."""
+    with _lock:
+        fields = sorted(_stats.items(), key=lambda item: -item[1].time.total)
+        return {
+            "sample_rate": SAMPLE_RATE,
+            "sampled_requests": _requests,
+            "fields": {field: stats.as_dict() for field, stats in fields},
+        }
+
+
+def reset():
+    global _requests
+    with _lock:
+        _stats.clear()
+        _requests = 0
+
+
+class SQLTimer:
+    """Execute wrapper counting and timing queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += (time.perf_counter() - started) * 1000
+
+
+def is_sampled(context):
+    sampled = getattr(context, "_profile_sampled", None)
+    if sampled is None:
+        global _requests
+        sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+        if sampled:
+            with _lock:
+                _requests += 1
+        try:
+            context._profile_sampled = sampled
+        except AttributeError:
+            return False
+    return sampled
+
+
+class ProfilingMiddleware:
+    def resolve(self, next, root, info, **args):
+        if not is_sampled(info.context):
+            return next(root, info, **args)
+
+        field = f"{info.parent_type.name}.{info.field_name}"
+        timer = SQLTimer()
+        started = time.perf_counter()
+        with sql.observe(timer):
+            result = next(root, info, **args)
+
+        if inspect.isawaitable(result):
+
+            async def timed():
+                # The queries run when the result is awaited
+                with sql.observe(timer):
+                    try:
+                        return await result
+                    finally:
+                        elapsed = (time.perf_counter() - started) * 1000
+                        record(field, elapsed, timer.count, timer.time)
+
+            return timed()
+
+        record(field, (time.perf_counter() - started) * 1000, timer.count, timer.time)
+        return result
+
+
+@staff_member_required
+def profile_view(request):
+    """This process's resolver histograms. ``?reset=1`` clears them after reading."""
+    data = snapshot()
+    if request.GET.get("reset"):
+        reset()
+    return JsonResponse(data)
@@ -10,6 +10,14 @@ class Query(
     debug = graphene.Field(DjangoDebug, name="_debug")
 
 
+class Mutation(
+    tools.schema.Mutation,
+    graphene.ObjectType,
+):
+    pass
+
+
 schema = graphene.Schema(
     query=Query,
+    mutation=Mutation,
 )
@@ -188,8 +188,79 @@ if not DEBUG:
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# How tools.scoring normalises metric values: "minmax" or "zscore"
+SCORE_NORMALIZATION = "minmax"
+
+# Seconds an exact connection `count` is cached for
+GRAPHQL_COUNT_TIMEOUT = 30
+
+# Seconds before a table's maintained row count (a connection's unfiltered
+# `approximateCount`) is counted again
+GRAPHQL_ROW_COUNT_TIMEOUT = 60 * 60
+
+# Seconds the tools connection's facet counts are cached for, per filter
+GRAPHQL_FACETS_TIMEOUT = 30
+
+# Upper bounds of the price ranges tools are faceted into
+FACET_PRICE_BUCKETS = (50, 100, 250, 500, 1000)
+
+# Parsed and validated GraphQL documents kept per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+
+# The default cache. Cached responses, and the generations that tell when
+# they're stale (see tools.generations), have to be shared by every worker
+# process, or a write in one leaves the others serving old responses.
+# REDIS_URL (e.g. a Render Key Value instance's internal URL; needs the
+# redis package) gives them Redis. Without it each process has its own
+# LocMemCache. Both are safe to call from the event loop; the database
+# cache isn't.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+
+# Seconds a query response is cached for; writes to the models it read
+# invalidate it sooner. 0 disables the response cache, as it is when
+# deployed without a shared cache. (runserver is a single process.)
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = 60 if REDIS_URL or DEBUG else 0
+
+# Limits on a single query, checked before it runs (see compare.cost)
+GRAPHQL_MAX_DEPTH = 15
+GRAPHQL_MAX_JOINS = 4
+GRAPHQL_MAX_COST = 50_000
+
+# Most operations one request may batch as a JSON array
+GRAPHQL_MAX_BATCH_SIZE = 10
+
+# Fraction of GraphQL requests profiled per resolver; served to staff at
+# /admin/graphql-profile/ (see compare.profiling)
+GRAPHQL_PROFILE_SAMPLE_RATE = 0.01
+
+# Pre-registered persisted queries: *.graphql files, addressed by their SHA-256
+GRAPHQL_PERSISTED_QUERIES_DIR = BASE_DIR / "persisted_queries"
+
+# Seconds a query registered by a client stays persisted
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = 60 * 60 * 24
+
+# Seconds before each process reloads its autocomplete index, to pick up
+# writes it didn't see (other processes, bulk writes)
+AUTOCOMPLETE_MAX_AGE = 300
+
+# Rows per database fetch (and per written chunk) in tools' streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Most rows one upsertTools/upsertToolMetrics/upsertMetrics mutation may write
+GRAPHQL_MAX_UPSERT_ROWS = 5000
+
 GRAPHENE = {
     "SCHEMA": "compare.schema.schema",
     "SCHEMA_INDENT": 2,
-    "MIDDLEWARE": ("graphene_django.debug.DjangoDebugMiddleware",),
+    "MIDDLEWARE": ("compare.profiling.ProfilingMiddleware",),
 }
+if DEBUG:
+    # Powers the `_debug` field; it captures every query, so not in production
+    GRAPHENE["MIDDLEWARE"] += ("graphene_django.debug.DjangoDebugMiddleware",)
@@ -16,12 +16,15 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from compare.profiling import profile_view
+from compare.views import AsyncGraphQLView
 
 urlpatterns = [
+    path("admin/graphql-profile/", profile_view),
     path("admin/", admin.site.urls),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
-    # path("", include("tools.urls")),
+    path("graphql/", csrf_exempt(AsyncGraphQLView.as_view(graphiql=True))),
+    path("", include("tools.urls")),
 ]
@@ -0,0 +1,653 @@
+"""
+GraphQL endpoint.
+
+Extends graphene-django's ``GraphQLView`` with:
+
+- a per-process LRU of parsed and validated documents, keyed by the
+  SHA-256 of the query, so repeated queries skip parse and validation;
+- persisted queries: the client can send just the SHA-256 of a query in
+  ``extensions.persistedQuery.sha256Hash`` (the Apollo convention). The
+  hash resolves to a ``*.graphql`` file in ``GRAPHQL_PERSISTED_QUERIES_DIR``,
+  or to a query the client registered earlier by sending it with its hash
+  (for ``GRAPHQL_PERSISTED_QUERY_TIMEOUT`` seconds);
+- a response cache for queries, keyed by the normalised document,
+  variables and operation name. Each response records the generations
+  (see ``tools.generations``) of the models it read, and is served until
+  a write to one of them;
+- static cost analysis (see ``compare.cost``) before execution;
+- a CSRF check on mutations: the URL is csrf_exempt, for queries;
+- batches: a JSON array of operations is executed in one request, with
+  one loader and cache scope, and answered with an array in the same order;
+- ``AsyncGraphQLView``, which executes queries on the event loop.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView as BaseGraphQLView
+from graphene_django.views import HttpError
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    TypeInfo,
+    TypeInfoVisitor,
+    Visitor,
+    execute,
+    get_named_type,
+    get_operation_ast,
+    parse,
+    print_ast,
+    validate_schema,
+    visit,
+)
+from graphql.validation import validate
+from tools import generations, sql
+
+from . import cost
+
+DOCUMENT_CACHE_SIZE = getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 500)
+PERSISTED_QUERIES_DIR = getattr(settings, "GRAPHQL_PERSISTED_QUERIES_DIR", None)
+PERSISTED_QUERY_TIMEOUT = getattr(settings, "GRAPHQL_PERSISTED_QUERY_TIMEOUT", 86400)
+RESPONSE_CACHE_TIMEOUT = getattr(settings, "GRAPHQL_RESPONSE_CACHE_TIMEOUT", 60)
+MAX_BATCH_SIZE = getattr(settings, "GRAPHQL_MAX_BATCH_SIZE", 10)
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class Document:
+    """A parsed query, its validation errors and what the response cache needs."""
+
+    def __init__(self, schema, query, rules):
+        self.document = parse(query)
+        self.errors = validate(
+            schema, self.document, rules, graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        # Whitespace and comments don't change the response
+        self.signature = query_hash(print_ast(self.document))
+        self.labels = set() if self.errors else selected_labels(schema, self.document)
+
+
+def selected_labels(schema, document):
+    """Labels of the models whose node types ``document`` selects."""
+    type_info = TypeInfo(schema)
+    labels = set()
+
+    class SelectedModels(Visitor):
+        def enter_field(self, *args):
+            graphene_type = getattr(
+                get_named_type(type_info.get_type()), "graphene_type", None
+            )
+            model = getattr(getattr(graphene_type, "_meta", None), "model", None)
+            if model is not None:
+                labels.add(model._meta.label_lower)
+
+    visit(document, TypeInfoVisitor(type_info, SelectedModels()))
+    return labels
+
+
+class DocumentCache:
+    """Thread-safe LRU of ``query hash -> Document``."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+documents = DocumentCache(DOCUMENT_CACHE_SIZE)
+
+
+"""
+Persisted queries
+"""
+
+_registered = None
+
+
+def registered_queries():
+    """``{sha256: query}`` for every ``*.graphql`` file in the persisted queries dir."""
+    global _registered
+    if _registered is None:
+        queries = {}
+        if PERSISTED_QUERIES_DIR and PERSISTED_QUERIES_DIR.is_dir():
+            for path in sorted(PERSISTED_QUERIES_DIR.glob("*.graphql")):
+                query = path.read_text()
+                queries[query_hash(query)] = query
+        _registered = queries
+    return _registered
+
+
+def persisted_query_key(sha256):
+    return f"compare:persisted_query:{sha256}"
+
+
+def get_persisted_query(sha256):
+    return registered_queries().get(sha256) or cache.get(persisted_query_key(sha256))
+
+
+def register_persisted_query(sha256, query):
+    if query_hash(query) != sha256:
+        raise GraphQLError("provided sha does not match query")
+    # Any client can register queries, so they can't fill the cache for
+    # good. One that expires is sent again in full, as for a new one.
+    cache.set(persisted_query_key(sha256), query, PERSISTED_QUERY_TIMEOUT)
+
+
+"""
+Response cache
+"""
+
+
+def response_key(signature, variables, operation_name):
+    payload = json.dumps(
+        [signature, variables or {}, operation_name], sort_keys=True, default=str
+    )
+    return f"compare:response:{query_hash(payload)}"
+
+
+def get_response(key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if generations.get(entry["generations"]) != entry["generations"]:
+        return None
+    return ExecutionResult(data=entry["data"])
+
+
+def set_response(key, result, labels, before):
+    """Cache ``result``, stamped with the generations read ``before`` executing."""
+    if not result.errors:
+        touched = labels & before.keys()
+        cache.set(
+            key,
+            {
+                "generations": {label: before[label] for label in touched},
+                "data": result.data,
+            },
+            RESPONSE_CACHE_TIMEOUT,
+        )
+
+
+def get_generations():
+    # Read before executing: a write that lands mid-query must leave the
+    # entry stale, not stamped with the new generation.
+    return generations.get(model._meta.label_lower for model in generations.models())
+
+
+class SQLTables:
+    """Execute wrapper collecting the models each query touches."""
+
+    def __init__(self):
+        self.labels = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.labels |= generations.labels_in_sql(sql, context["connection"])
+        return execute(sql, params, many, context)
+
+
+def selects_debug(operation_ast):
+    return any(
+        getattr(selection, "name", None) is not None
+        and selection.name.value == "_debug"
+        for selection in operation_ast.selection_set.selections
+    )
+
+
+def passes_csrf_check(request):
+    """
+    Whether ``request`` passes CsrfViewMiddleware's check. The view is
+    csrf_exempt so that queries work from any origin; mutations, which
+    run as the session's user, still need the token.
+    """
+    middleware = CsrfViewMiddleware(lambda request: None)
+    return middleware.process_view(request, None, (), {}) is None
+
+
+def is_cacheable(operation_ast):
+    return (
+        RESPONSE_CACHE_TIMEOUT
+        and operation_ast is not None
+        and operation_ast.operation == OperationType.QUERY
+        # _debug reports on this very execution
+        and not selects_debug(operation_ast)
+    )
+
+
+class OperationContext:
+    """
+    The context an operation executes with: the request, as far as its
+    resolvers can tell, reading and writing the request's attributes.
+
+    The operations of a batch execute concurrently and share the request's
+    user and loaders, but each has its own ``connection_refilters`` (see
+    ``tools.schema.get_refilters``), keyed by paths that repeat across them.
+    """
+
+    def __init__(self, request):
+        object.__setattr__(self, "request", request)
+        object.__setattr__(self, "connection_refilters", {})
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.request, name, value)
+
+
+class Operation:
+    """A validated operation, ready to execute."""
+
+    def __init__(self, request, schema, entry, operation_ast, execute_options):
+        self.request = request
+        self.schema = schema
+        self.entry = entry
+        self.operation_ast = operation_ast
+        self.execute_options = execute_options
+
+    @property
+    def is_mutation(self):
+        return (
+            self.operation_ast is not None
+            and self.operation_ast.operation == OperationType.MUTATION
+        )
+
+    @property
+    def response_key(self):
+        return response_key(
+            self.entry.signature,
+            self.execute_options["variable_values"],
+            self.execute_options["operation_name"],
+        )
+
+    def execute(self):
+        return execute(self.schema, self.entry.document, **self.execute_options)
+
+
+class GraphQLView(BaseGraphQLView):
+    def get_context(self, request):
+        return OperationContext(super().get_context(request))
+
+    @staticmethod
+    def get_persisted_hash(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions") or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return (extensions.get("persistedQuery") or {}).get("sha256Hash")
+
+    def parse_body(self, request):
+        # A JSON array is a batch of operations, answered by an array in order
+        if self.get_content_type(request) == "application/json":
+            self.batch = request.body.lstrip()[:1] == b"["
+        data = super().parse_body(request)
+        if self.batch and len(data) > MAX_BATCH_SIZE:
+            raise HttpError(
+                HttpResponseBadRequest(
+                    f"Batches are limited to {MAX_BATCH_SIZE} operations."
+                )
+            )
+        return data
+
+    def get_document(self, schema, query):
+        """Return the ``Document`` for ``query``, cached by hash."""
+        key = query_hash(query)
+        entry = documents.get(key)
+        if entry is None:
+            entry = Document(schema, query, self.validation_rules)
+            documents.set(key, entry)
+        return entry
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        """Return ``(json, status code)`` for an execution result."""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def prepare_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Everything before execution: persisted query lookup, parsing,
+        validation and cost analysis.
+
+        Returns an ``Operation``, or the ``ExecutionResult`` (or None) to
+        respond with instead.
+        """
+        sha256 = self.get_persisted_hash(request, data)
+        if sha256:
+            if query:
+                try:
+                    register_persisted_query(sha256, query)
+                except GraphQLError as e:
+                    return ExecutionResult(errors=[e])
+            else:
+                query = get_persisted_query(sha256)
+                if not query:
+                    # The client retries with the full query, which registers it
+                    error = GraphQLError(
+                        "PersistedQueryNotFound",
+                        extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    )
+                    return ExecutionResult(errors=[error])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            entry = self.get_document(schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(entry.document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.MUTATION
+            and not passes_csrf_check(request)
+        ):
+            raise HttpError(
+                HttpResponseForbidden(),
+                "CSRF verification failed. Mutations need the csrftoken "
+                "cookie's value in an X-CSRFToken header.",
+            )
+
+        if entry.errors:
+            return ExecutionResult(data=None, errors=entry.errors)
+
+        if operation_ast is not None:
+            try:
+                cost.check(schema, entry.document, operation_ast, variables)
+            except GraphQLError as e:
+                return ExecutionResult(data=None, errors=[e])
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = (
+                    self.execution_context_class
+                )
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        return Operation(request, schema, entry, operation_ast, execute_options)
+
+    def execute_operation(self, operation):
+        try:
+            if operation.is_mutation and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            ):
+                with transaction.atomic():
+                    result = operation.execute()
+                    if getattr(operation.request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            if is_cacheable(operation.operation_ast):
+                return self.execute_cached(operation)
+
+            return operation.execute()
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def execute_cached(self, operation):
+        """Execute a query through the response cache."""
+        key = operation.response_key
+        result = get_response(key)
+        if result is None:
+            before = get_generations()
+            tables = SQLTables()
+            with sql.observe(tables):
+                result = operation.execute()
+            set_response(key, result, operation.entry.labels | tables.labels, before)
+        return result
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        operation = self.prepare_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not isinstance(operation, Operation):
+            return operation
+        return self.execute_operation(operation)
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQLView for ASGI.
+
+    Queries execute on the event loop. Their resolvers return awaitables
+    wherever they need the database (see ``tools.schema``), so a worker
+    serves other requests while one waits on a query. Mutations, whose
+    transaction can't span awaits, and ``_debug`` queries run synchronously
+    in a worker thread.
+
+    The default cache is read on the event loop, so it mustn't be the
+    database backend (see ``CACHES`` in ``compare.settings``).
+    """
+
+    view_is_async = True
+
+    @method_decorator(ensure_csrf_cookie)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = await self.aget_batch_responses(request, data)
+                result = "[{}]".format(
+                    ",".join([response[0] for response in responses])
+                )
+                status_code = (
+                    responses
+                    and max(responses, key=lambda response: response[1])[1]
+                    or 200
+                )
+            else:
+                result, status_code = await self.aget_response(request, data)
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def aget_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = await self.aexecute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    async def aget_batch_responses(self, request, data):
+        """
+        Execute a batch of operations, returning their responses in order.
+
+        Queries execute concurrently, so the request's DataLoaders batch
+        across all of them. A batch with a mutation executes in order.
+        """
+        operations = []
+        for entry in data:
+            query, variables, operation_name, id = self.get_graphql_params(
+                request, entry
+            )
+            operation = self.prepare_request(
+                request, entry, query, variables, operation_name
+            )
+            operations.append((operation, id))
+
+        async def execute(operation):
+            if not isinstance(operation, Operation):
+                return operation
+            return await self.aexecute_operation(operation)
+
+        if any(
+            isinstance(operation, Operation) and operation.is_mutation
+            for operation, id in operations
+        ):
+            results = [await execute(operation) for operation, id in operations]
+        else:
+            results = await asyncio.gather(
+                *(execute(operation) for operation, id in operations)
+            )
+        return [
+            self.format_response(request, result, id)
+            for result, (operation, id) in zip(results, operations)
+        ]
+
+    async def aexecute_operation(self, operation):
+        if operation.is_mutation or (
+            operation.operation_ast is not None
+            and selects_debug(operation.operation_ast)
+        ):
+            # DjangoDebugMiddleware only sees queries on its own thread
+            return await sync_to_async(self.execute_operation)(operation)
+        try:
+            if is_cacheable(operation.operation_ast):
+                return await self.aexecute_cached(operation)
+            result = operation.execute()
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    async def aexecute_cached(self, operation):
+        key = operation.response_key
+        result = get_response(key)
+        if result is None:
+            before = get_generations()
+            tables = SQLTables()
+            with sql.observe(tables):
+                result = operation.execute()
+                if inspect.isawaitable(result):
+                    result = await result
+            set_response(key, result, operation.entry.labels | tables.labels, before)
+        return result
+
+    async def aexecute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        operation = self.prepare_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not isinstance(operation, Operation):
+            return operation
+        return await self.aexecute_operation(operation)
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+
 from .models import (
     Brand,
     Category,
@@ -87,6 +89,8 @@ class UUIDModelAdmin(admin.ModelAdmin):
     search_fields = ("id",)
     readonly_fields = (
         "id",
+        "content_type",
+        "object_id",
         "brand",
         "category",
         "metric",
@@ -97,21 +101,12 @@ class UUIDModelAdmin(admin.ModelAdmin):
         "weighted_average",
     )
 
+    def get_queryset(self, request):
+        # One query per model on the page, not one per row
+        return super().get_queryset(request).prefetch_related("content_object")
+
     def content_object(self, obj):
-        if obj.brand:
-            return f"Brand: {obj.brand}"
-        if obj.category:
-            return f"Category: {obj.category}"
-        if obj.metric:
-            return f"Metric: {obj.metric}"
-        if obj.content_creator:
-            return f"ContentCreator: {obj.content_creator}"
-        if obj.source:
-            return f"Source: {obj.source}"
-        if obj.tool:
-            return f"Tool: {obj.tool}"
-        if obj.tool_metric:
-            return f"ToolMetric: {obj.tool_metric}"
-        if obj.weighted_average:
-            return f"WeightedAverage: {obj.weighted_average}"
-        return "-"
+        if obj.content_object is None:
+            return "-"
+        model = ContentType.objects.get_for_id(obj.content_type_id).model_class()
+        return f"{model.__name__}: {obj.content_object}"
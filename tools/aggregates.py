@@ -0,0 +1,72 @@
+"""
+Connection aggregates.
+
+``aggregate()`` summarises a numeric field of a connection's filtered
+queryset in the database: one ``GROUP BY`` query returns the count, min,
+max, mean and standard deviation of every group, instead of every row.
+Groups are the values of a ForeignKey path such as ``metric`` or
+``tool__brand``.
+"""
+
+from django.db import models
+from django.db.models import Avg, Count, F, Max, Min, StdDev
+from django.db.models.constants import LOOKUP_SEP
+
+NUMERIC_FIELDS = (models.DecimalField, models.FloatField, models.IntegerField)
+
+# How many ForeignKeys a group path may follow: tool_metric -> tool -> brand
+MAX_DIMENSION_DEPTH = 2
+
+
+def numeric_fields(model):
+    """Names of ``model``'s fields that can be aggregated."""
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if isinstance(field, NUMERIC_FIELDS) and not field.primary_key
+    ]
+
+
+def dimensions(model, depth=MAX_DIMENSION_DEPTH):
+    """``{path: model}`` of the ForeignKey paths ``model`` can be grouped by."""
+    paths = {}
+    for field in model._meta.concrete_fields:
+        if not field.many_to_one:
+            continue
+        paths[field.name] = field.related_model
+        if depth > 1:
+            for path, related_model in dimensions(
+                field.related_model, depth - 1
+            ).items():
+                paths[f"{field.name}{LOOKUP_SEP}{path}"] = related_model
+    return paths
+
+
+def aggregate(queryset, field, group_by=None):
+    """
+    Summarise ``field`` over ``queryset``.
+
+    Returns one ``{"group", "count", "min", "max", "avg", "std_dev"}`` dict
+    per value of the ``group_by`` path, ordered by it, where ``group`` is
+    the primary key the path leads to; or a single dict with a ``group`` of
+    None when not grouping. Each row of ``queryset`` counts once, however
+    many rows its filters joined.
+    """
+    # Filters through to-many relations (a RelatedFilter on tool_metrics)
+    # join the rows they test, so grouping the filtered queryset itself
+    # would count and weigh each row once per joined match
+    queryset = queryset.model._default_manager.filter(
+        pk__in=queryset.order_by().values("pk")
+    )
+    aggregates = {
+        "count": Count(field),
+        "min": Min(field, output_field=models.FloatField()),
+        "max": Max(field, output_field=models.FloatField()),
+        "avg": Avg(field, output_field=models.FloatField()),
+        "std_dev": StdDev(field, output_field=models.FloatField()),
+    }
+    if group_by is None:
+        return [{"group": None, **queryset.aggregate(**aggregates)}]
+    return list(
+        queryset.values(group=F(group_by)).annotate(**aggregates).order_by("group")
+    )
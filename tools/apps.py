@@ -3,3 +3,15 @@ from django.apps import AppConfig
 
 class ToolsConfig(AppConfig):
     name = "tools"
+
+    def ready(self):
+        # Connect the scoring, cache invalidation, row count, SQL observer,
+        # search index and autocomplete receivers
+        from . import (  # noqa: F401
+            autocomplete,
+            counts,
+            generations,
+            scoring,
+            search,
+            sql,
+        )
@@ -0,0 +1,169 @@
+"""
+Autocomplete.
+
+A per-process trigram index over tool names, model numbers and brand
+names, so a suggestion costs a few set lookups and survives typos
+("Makitta" still finds Makita). Text is lowercased, stripped of accents
+and split into words; each word contributes its trigrams padded as
+pg_trgm pads them, two spaces before and one after. The last word of a
+query is still being typed, so it isn't padded at the end.
+
+Saves and deletes in this process update the index once they commit.
+Writes it can't see (other processes, bulk writes) show up when it is
+rebuilt, ``AUTOCOMPLETE_MAX_AGE`` seconds after it was last loaded.
+"""
+
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Brand, Tool
+
+MAX_AGE = getattr(settings, "AUTOCOMPLETE_MAX_AGE", 300)
+
+# Share of a query's trigrams a suggestion must have
+MIN_SIMILARITY = 0.4
+
+# The indexed fields of each model
+FIELDS = {
+    Tool: ("name", "model_number"),
+    Brand: ("name",),
+}
+
+WORDS = re.compile(r"\w+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(WORDS.findall(text.lower()))
+
+
+def trigrams(text, partial=False):
+    """The trigrams of every word of normalized ``text``."""
+    grams = set()
+    words = text.split()
+    for i, word in enumerate(words):
+        padded = f"  {word}" if partial and i == len(words) - 1 else f"  {word} "
+        grams.update(padded[j : j + 3] for j in range(len(padded) - 2))
+    return grams
+
+
+class Index:
+    """
+    ``(model, pk, field) -> text`` entries, found through their trigrams.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.postings = defaultdict(set)
+        self.loaded_at = None
+
+    def add(self, key, text):
+        with self.lock:
+            self.remove(key)
+            normalized = normalize(text)
+            grams = trigrams(normalized)
+            self.entries[key] = (text, normalized, grams)
+            for gram in grams:
+                self.postings[gram].add(key)
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+            for gram in entry[2]:
+                keys = self.postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def update(self, instance):
+        for field in FIELDS[type(instance)]:
+            self.add((type(instance), instance.pk, field), getattr(instance, field))
+
+    def delete(self, model, pk):
+        for field in FIELDS[model]:
+            self.remove((model, pk, field))
+
+    def is_fresh(self):
+        return (
+            self.loaded_at is not None and time.monotonic() - self.loaded_at < MAX_AGE
+        )
+
+    def load(self):
+        # Holding the lock, saves committed meanwhile wait for the new entries
+        with self.lock:
+            self.entries = {}
+            self.postings = defaultdict(set)
+            for model, fields in FIELDS.items():
+                for pk, *values in model._default_manager.values_list("pk", *fields):
+                    for field, value in zip(fields, values):
+                        self.add((model, pk, field), value)
+            self.loaded_at = time.monotonic()
+
+    def suggest(self, prefix, limit):
+        """
+        The ``limit`` best ``(score, model, pk, field, text)`` for ``prefix``.
+
+        Scores are the share of the prefix's trigrams an entry has, plus 1
+        if one of its words starts with the prefix's last word.
+        """
+        if not self.is_fresh():
+            with self.lock:
+                # Unless another thread loaded it while this one waited
+                if not self.is_fresh():
+                    self.load()
+        query = normalize(prefix)
+        grams = trigrams(query, partial=True)
+        if not grams:
+            return []
+        last_word = query.split()[-1]
+        with self.lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.postings.get(gram, ()))
+            candidates = []
+            for key, count in shared.items():
+                similarity = count / len(grams)
+                if similarity < MIN_SIMILARITY:
+                    continue
+                text, normalized, _ = self.entries[key]
+                starts = any(word.startswith(last_word) for word in normalized.split())
+                candidates.append((similarity + starts, key, text))
+        best = heapq.nsmallest(
+            limit, candidates, key=lambda item: (-item[0], len(item[2]), item[2])
+        )
+        return [(score, *key, text) for score, key, text in best]
+
+
+index = Index()
+
+
+def suggest(prefix, limit):
+    return index.suggest(prefix, limit)
+
+
+@receiver(post_save, sender=Tool)
+@receiver(post_save, sender=Brand)
+def update_suggestions(sender, instance, **kwargs):
+    if index.loaded_at is not None:
+        transaction.on_commit(lambda: index.update(instance))
+
+
+@receiver(post_delete, sender=Tool)
+@receiver(post_delete, sender=Brand)
+def delete_suggestions(sender, instance, **kwargs):
+    if index.loaded_at is not None:
+        pk = instance.pk
+        transaction.on_commit(lambda: index.delete(sender, pk))
@@ -0,0 +1,71 @@
+"""
+Side-by-side comparison of tools.
+
+``matrix()`` pivots ``ToolMetric(tool, metric, source, value)`` into one row
+per metric and one column per tool with conditional aggregation, so the
+whole matrix is a single grouped query::
+
+    SELECT metric.*, AVG(value) FILTER (WHERE tool_id = 1), ...
+    FROM metric JOIN tool_metric ...
+    WHERE tool_id IN (1, ...)
+    GROUP BY metric.id
+
+Without a source, a tool's value for a metric is the mean over every
+source that measured it.
+"""
+
+import decimal
+
+from django.db.models import Avg, Q
+
+from .models import Metric, ToolMetric
+
+# Each tool is a column of the query
+MAX_TOOLS = 20
+
+
+def column(i):
+    return f"tool_{i}"
+
+
+def matrix(tool_ids, source_id=None):
+    """
+    The metrics measured for any of ``tool_ids``, each annotated with
+    ``tool_<i>``: the value of the i-th tool, or None if it wasn't measured.
+    """
+    measured = Q(tool_metrics__tool_id__in=tool_ids)
+    if source_id is not None:
+        measured &= Q(tool_metrics__source_id=source_id)
+    # The annotations aggregate over the rows the filter joined
+    return (
+        Metric.objects.filter(measured)
+        .annotate(
+            **{
+                column(i): Avg(
+                    "tool_metrics__value",
+                    filter=Q(tool_metrics__tool_id=tool_id),
+                    output_field=ToolMetric._meta.get_field("value"),
+                )
+                for i, tool_id in enumerate(tool_ids)
+            }
+        )
+        .order_by("category_id", "name")
+    )
+
+
+def rows(tool_ids, source_id=None):
+    """``(metric, [value per tool])`` for every metric in the matrix."""
+    # Averages come back with all the digits the database computed
+    places = decimal.Decimal(1).scaleb(
+        -ToolMetric._meta.get_field("value").decimal_places
+    )
+    return [
+        (
+            metric,
+            [
+                None if value is None else value.quantize(places)
+                for value in (getattr(metric, column(i)) for i in range(len(tool_ids)))
+            ],
+        )
+        for metric in matrix(tool_ids, source_id)
+    ]
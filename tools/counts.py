@@ -0,0 +1,111 @@
+"""
+Connection counts.
+
+``count()`` caches exact counts for ``GRAPHQL_COUNT_TIMEOUT`` seconds, keyed
+by the SQL of the filtered queryset, so repeated page requests with the same
+filter and search arguments COUNT once. ``approximate_count()`` reads a
+maintained row count for unfiltered tables instead of scanning them: it is
+counted once, then adjusted as rows are saved and deleted (through
+signals) and bulk created (by ``UUIDQuerySet.bulk_create()``), and
+recounted every ``GRAPHQL_ROW_COUNT_TIMEOUT`` seconds in case anything else
+wrote to the table.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+TIMEOUT = getattr(settings, "GRAPHQL_COUNT_TIMEOUT", 30)
+
+ROW_COUNT_TIMEOUT = getattr(settings, "GRAPHQL_ROW_COUNT_TIMEOUT", 60 * 60)
+
+APP_LABEL = "tools"
+
+
+def cache_key(queryset):
+    # Ordering doesn't change a count, so it isn't part of the key.
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.sha256(f"{sql}{params!r}".encode()).hexdigest()
+    return f"tools:count:{queryset.model._meta.label_lower}:{digest}"
+
+
+def count(queryset):
+    """Exact ``queryset.count()``, cached for a short time."""
+    key = cache_key(queryset)
+    value = cache.get(key)
+    if value is None:
+        value = queryset.count()
+        cache.set(key, value, TIMEOUT)
+    return value
+
+
+def row_count_key(model, using):
+    return f"tools:rows:{using}:{model._meta.label_lower}"
+
+
+def row_count(model, using=DEFAULT_DB_ALIAS):
+    """The maintained row count of ``model``'s table, counted when missing."""
+    key = row_count_key(model, using)
+    value = cache.get(key)
+    if value is None:
+        value = model._default_manager.using(using).count()
+        cache.add(key, value, ROW_COUNT_TIMEOUT)
+    return value
+
+
+def adjust_row_count(model, delta, using=DEFAULT_DB_ALIAS):
+    """Add ``delta`` to ``model``'s row count once the transaction commits."""
+    key = row_count_key(model, using)
+
+    def adjust():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Not counted yet, or expired: the next read counts
+            pass
+
+    transaction.on_commit(adjust, using=using)
+
+
+def forget_row_count(model, using=DEFAULT_DB_ALIAS):
+    """
+    Recount ``model`` on the next read, after a write that can't tell how
+    many rows it added.
+    """
+    key = row_count_key(model, using)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key), using=using)
+
+
+def approximate_count(queryset):
+    """
+    Estimated ``queryset.count()``.
+
+    Only an unfiltered queryset of a ``tools`` model can use the maintained
+    row count; anything else falls back to the cached exact count.
+    """
+    model = queryset.model
+    if not queryset.query.where and model._meta.app_label == APP_LABEL:
+        return row_count(model, queryset.db)
+    return count(queryset)
+
+
+"""
+Signals
+"""
+
+
+@receiver(post_save)
+def count_saved(sender, instance, created, using, **kwargs):
+    if created and sender._meta.app_label == APP_LABEL:
+        adjust_row_count(sender, 1, using)
+
+
+@receiver(post_delete)
+def count_deleted(sender, instance, using, **kwargs):
+    if sender._meta.app_label == APP_LABEL:
+        adjust_row_count(sender, -1, using)
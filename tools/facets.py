@@ -0,0 +1,88 @@
+"""
+Tool facets.
+
+The counts a tool browser shows next to its filter options. Each facet
+counts the tools matching every filter but its own, so picking one brand
+still shows how many tools the other brands have. A facet is one
+``GROUP BY`` query, cached for ``GRAPHQL_FACETS_TIMEOUT`` seconds keyed by
+its SQL, which is the signature of the filters it ran under.
+"""
+
+import decimal
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+TIMEOUT = getattr(settings, "GRAPHQL_FACETS_TIMEOUT", 30)
+
+# Upper bounds of the price buckets; the last bucket has none
+PRICE_BUCKETS = getattr(settings, "FACET_PRICE_BUCKETS", (50, 100, 250, 500, 1000))
+
+
+def cached(queryset, compute):
+    """``compute(queryset)``, cached by the SQL of ``queryset``."""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha256(f"{sql}{params!r}".encode()).hexdigest()
+    key = f"tools:facets:{queryset.model._meta.label_lower}:{digest}"
+    value = cache.get(key)
+    if value is None:
+        value = compute(queryset)
+        cache.set(key, value, TIMEOUT)
+    return value
+
+
+def without_filter(args, name):
+    """The filter and search of a connection's ``args``, minus ``filter.name``."""
+    return {
+        "filter": {
+            key: value
+            for key, value in (args.get("filter") or {}).items()
+            if key != name
+        },
+        "search": args.get("search"),
+    }
+
+
+def value_counts(queryset, field_name):
+    """``[(pk, count)]`` of the ``field_name`` ForeignKey, most common first."""
+    queryset = (
+        queryset.order_by()
+        .values(field_name)
+        .annotate(count=Count("pk", distinct=True))
+        .order_by("-count", field_name)
+    )
+    return cached(
+        queryset,
+        lambda queryset: [(row[field_name], row["count"]) for row in queryset],
+    )
+
+
+def bucket_counts(queryset, field_name, bounds):
+    """
+    ``[(lower, upper, count)]`` of ``field_name`` for every bucket between
+    ``bounds``, empty ones included. ``lower`` is inclusive and ``upper``
+    exclusive; the first has no lower bound and the last no upper one.
+    """
+    bucket = Case(
+        *(
+            When(**{f"{field_name}__lt": bound}, then=Value(i))
+            for i, bound in enumerate(bounds)
+        ),
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+    queryset = (
+        queryset.order_by()
+        .values(bucket=bucket)
+        .annotate(count=Count("pk", distinct=True))
+    )
+    counts = dict(
+        cached(
+            queryset,
+            lambda queryset: [(row["bucket"], row["count"]) for row in queryset],
+        )
+    )
+    edges = [None, *(decimal.Decimal(str(bound)) for bound in bounds), None]
+    return [(edges[i], edges[i + 1], counts.get(i, 0)) for i in range(len(bounds) + 1)]
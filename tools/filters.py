@@ -1,9 +1,23 @@
 import django_graphene_filters as filters
 
 from . import models
+from . import search
 
 
-class BrandFilter(filters.AdvancedFilterSet):
+class SearchFilterSet(filters.AdvancedFilterSet):
+    """
+    AdvancedFilterSet searching numbers as numbers, and text through its
+    model's full-text index if it has one. See tools.search.
+    """
+
+    def build_search_conditions(self, queryset, search_query):
+        search_fields = self.get_search_fields()
+        if not search_fields or not search_query:
+            return queryset
+        return search.search(queryset, search_fields, search_query)
+
+
+class BrandFilter(SearchFilterSet):
     class Meta:
         model = models.Brand
         fields = {
@@ -13,7 +27,7 @@ class BrandFilter(filters.AdvancedFilterSet):
         }
 
 
-class CategoryFilter(filters.AdvancedFilterSet):
+class CategoryFilter(SearchFilterSet):
     class Meta:
         model = models.Category
         fields = {
@@ -22,7 +36,7 @@ class CategoryFilter(filters.AdvancedFilterSet):
         }
 
 
-class MetricFilter(filters.AdvancedFilterSet):
+class MetricFilter(SearchFilterSet):
     category = filters.RelatedFilter(
         CategoryFilter,
         field_name="category",
@@ -39,7 +53,7 @@ class MetricFilter(filters.AdvancedFilterSet):
         }
 
 
-class ContentCreatorFilter(filters.AdvancedFilterSet):
+class ContentCreatorFilter(SearchFilterSet):
     class Meta:
         model = models.ContentCreator
         fields = {
@@ -48,7 +62,7 @@ class ContentCreatorFilter(filters.AdvancedFilterSet):
         }
 
 
-class SourceFilter(filters.AdvancedFilterSet):
+class SourceFilter(SearchFilterSet):
     category = filters.RelatedFilter(
         CategoryFilter,
         field_name="category",
@@ -67,7 +81,7 @@ class SourceFilter(filters.AdvancedFilterSet):
         }
 
 
-class ToolFilter(filters.AdvancedFilterSet):
+class ToolFilter(SearchFilterSet):
     brand = filters.RelatedFilter(
         BrandFilter,
         field_name="brand",
@@ -97,7 +111,7 @@ class ToolFilter(filters.AdvancedFilterSet):
         }
 
 
-class ToolMetricFilter(filters.AdvancedFilterSet):
+class ToolMetricFilter(SearchFilterSet):
     tool = filters.RelatedFilter(
         ToolFilter,
         field_name="tool",
@@ -121,7 +135,7 @@ class ToolMetricFilter(filters.AdvancedFilterSet):
         }
 
 
-class WeightedAverageFilter(filters.AdvancedFilterSet):
+class WeightedAverageFilter(SearchFilterSet):
     tool = filters.RelatedFilter(
         ToolFilter,
         field_name="tool",
@@ -140,7 +154,7 @@ class WeightedAverageFilter(filters.AdvancedFilterSet):
         }
 
 
-class UUIDModelFilter(filters.AdvancedFilterSet):
+class UUIDModelFilter(SearchFilterSet):
     class Meta:
         model = models.UUIDModel
         fields = {
@@ -0,0 +1,73 @@
+"""
+Per-model generation counters.
+
+Every save or delete of a ``tools`` model bumps that model's generation.
+A cached value records the generations of the models it was built from,
+and is stale once any of them has moved on. Bulk writes skip signals, so
+code doing ``bulk_create``/``bulk_update`` calls ``invalidate()`` itself.
+
+The counters live in the default cache. With several server processes it
+has to be a shared backend, or each process only sees its own writes.
+"""
+
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+APP_LABEL = "tools"
+
+
+def key(label):
+    return f"tools:generation:{label}"
+
+
+def get(labels):
+    """``{label: generation}`` for the model labels given."""
+    keys = {key(label): label for label in labels}
+    values = cache.get_many(keys)
+    return {label: values.get(k, 0) for k, label in keys.items()}
+
+
+def bump(*models):
+    for model in models:
+        k = key(model._meta.label_lower)
+        # Start from the clock, so a counter that was evicted can't come
+        # back at a generation already recorded by a cached value.
+        cache.add(k, time.time_ns(), None)
+        try:
+            cache.incr(k)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(k, time.time_ns(), None)
+
+
+def invalidate(*models):
+    """Bump ``models`` now and again when the current transaction commits."""
+    bump(*models)
+    # A read between the write and the commit could otherwise cache the
+    # old rows under the new generation.
+    transaction.on_commit(lambda: bump(*models))
+
+
+def models():
+    return apps.get_app_config(APP_LABEL).get_models()
+
+
+def labels_in_sql(sql, connection):
+    """Labels of the ``tools`` models whose tables ``sql`` reads or writes."""
+    return {
+        model._meta.label_lower
+        for model in models()
+        if connection.ops.quote_name(model._meta.db_table) in sql
+    }
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_generation(sender, **kwargs):
+    if sender._meta.app_label == APP_LABEL:
+        invalidate(sender)
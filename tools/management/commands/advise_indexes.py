@@ -0,0 +1,367 @@
+import ast
+import json
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from graphene_django.settings import graphene_settings
+
+from tools import filters, orders
+
+# Plan steps worth an index
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+TEMP_SORT = re.compile(
+    r"^USE TEMP B-TREE FOR (?:LAST \d+ TERMS OF |LAST TERM OF )?ORDER BY"
+)
+
+# A line of the django.db.backends log: "(0.001) SELECT ...; args=(1,); alias=default"
+LOGGED_QUERY = re.compile(
+    r"^\(\d+\.\d+\) (?P<sql>.*); args=(?P<args>.*?)(?:; alias=\w+)?$"
+)
+LOGGED_DECIMAL = re.compile(r"Decimal\('([^']*)'\)")
+
+
+def from_table(sql):
+    match = re.search(r' FROM "(\w+)"', sql)
+    return match[1] if match else None
+
+
+def columns_in(sql, table, pattern):
+    """Columns of ``table`` that ``sql`` compares with ``pattern``, in order."""
+    found = re.findall(rf'"{table}"\."(\w+)" {pattern}', sql)
+    return list(dict.fromkeys(found))
+
+
+def unbounded_columns(model):
+    """Columns of ``model`` holding text of any length."""
+    return {
+        field.column
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.TextField)
+        or (isinstance(field, models.CharField) and field.max_length is None)
+    }
+
+
+def candidate(sql, table, pk, unbounded=()):
+    """
+    The columns of an index on ``table`` serving ``sql``: the columns it
+    tests for equality, then the one it compares by range or else the ones
+    it orders by. Columns in ``unbounded`` are left out: an index would copy
+    every value of them whole.
+    """
+    equal = columns_in(sql, table, r"(?:= |IN \()")
+    ranged = columns_in(sql, table, r"(?:>=|<=|>|<|BETWEEN) ")
+    _, _, ordering = sql.partition(" ORDER BY ")
+    ordered = columns_in(ordering, table, r"(?:ASC|DESC)")
+    columns = equal + [
+        column for column in (ranged[:1] or ordered) if column not in equal
+    ]
+    columns = [column for column in columns if column not in unbounded]
+    # SQLite indexes end with the rowid already
+    while columns and columns[-1] == pk:
+        columns.pop()
+    return tuple(columns)
+
+
+def sample(model, field_name):
+    """A value of ``field_name`` to filter on, from the table if it has rows."""
+    value = model._default_manager.values_list(field_name, flat=True).first()
+    if value is not None:
+        return value
+    field = model._meta.get_field(field_name)
+    if isinstance(field, (models.CharField, models.TextField)):
+        return "a"
+    return 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN QUERY PLAN over a captured query log, or over queries "
+        "built from the filtersets and ordersets, and suggest indexes for "
+        "full table scans and temporary sorts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log",
+            help=(
+                "Replay this query log instead: django.db.backends debug log "
+                'lines, JSON lines of {"sql": ..., "params": [...]}, or one SQL '
+                "statement per line"
+            ),
+        )
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Print the plan of every query with an issue",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The advisor reads SQLite query plans.")
+
+        if options["log"]:
+            workload = list(self.read_log(options["log"]))
+            if self.unreadable:
+                self.stderr.write(f"Skipped {self.unreadable} unreadable lines.")
+        else:
+            workload = list(self.synthetic_workload())
+        self.stdout.write(f"Explaining {len(workload)} queries...")
+
+        tables = {model._meta.db_table: model for model in apps.get_models()}
+        suggestions = defaultdict(list)
+        # Columns an index would serve but for their unbounded text
+        unindexed = defaultdict(list)
+        for label, sql, params in workload:
+            try:
+                plan = self.explain(sql, params)
+            except Exception as error:
+                self.stderr.write(f"{label}: {error}")
+                continue
+            issues = self.issues(plan, tables)
+            if not issues:
+                continue
+            self.stdout.write(f"{label}: " + "; ".join(issues))
+            if options["verbose_plans"]:
+                self.stdout.write(f"  {sql}")
+                for detail in plan:
+                    self.stdout.write(f"    {detail}")
+
+            for table in tables:
+                if not self.problems(plan, sql, table):
+                    continue
+                model = tables[table]
+                pk, unbounded = model._meta.pk.column, unbounded_columns(model)
+                for column in candidate(sql, table, pk):
+                    if column in unbounded:
+                        unindexed[table, column].append(label)
+                columns = candidate(sql, table, pk, unbounded)
+                if columns and self.improves(table, columns, sql, params, plan):
+                    suggestions[table, columns].append(label)
+
+        if unindexed:
+            self.stdout.write("")
+            self.stdout.write("Not indexed, as they hold text of any length:")
+            for (table, column), labels in sorted(
+                unindexed.items(), key=lambda item: -len(item[1])
+            ):
+                self.stdout.write(
+                    f"  {tables[table]._meta.label}.{column}  # {len(labels)} queries"
+                )
+
+        indexes = self.suggested_indexes(suggestions, tables)
+        if not indexes:
+            self.stdout.write(self.style.SUCCESS("No indexes to suggest."))
+            return
+
+        # Declared on the models, makemigrations writes the migration and
+        # keeps it in step with them
+        self.stdout.write("")
+        self.stdout.write(
+            "Suggested indexes, to add to each model's Meta.indexes before "
+            "running makemigrations:"
+        )
+        by_model = defaultdict(list)
+        for model, index, labels in indexes:
+            by_model[model].append((index, labels))
+        for model, model_indexes in by_model.items():
+            self.stdout.write("")
+            self.stdout.write(f"  # {model._meta.label}")
+            self.stdout.write("  indexes = [")
+            for index, labels in model_indexes:
+                self.stdout.write(
+                    f"      models.Index(fields={index.fields!r}, "
+                    f"name={index.name!r}),  # {len(labels)} queries"
+                )
+            self.stdout.write("  ]")
+
+    def read_log(self, path):
+        # Lines that can't be read are skipped and counted here
+        self.unreadable = 0
+        with open(path) as log:
+            for number, line in enumerate(log, 1):
+                line = line.strip()
+                label = f"{path}:{number}"
+                if line.startswith("{"):
+                    try:
+                        entry = json.loads(line)
+                        sql, params = entry["sql"], entry.get("params") or ()
+                    except (ValueError, TypeError, KeyError, AttributeError):
+                        self.stderr.write(f"{label}: not a JSON query")
+                        self.unreadable += 1
+                        continue
+                elif match := LOGGED_QUERY.match(line):
+                    sql = match["sql"]
+                    # SQLite compares Decimal('1.00') to a number column as a number
+                    args = LOGGED_DECIMAL.sub(r"'\1'", match["args"])
+                    try:
+                        params = ast.literal_eval(args)
+                    except (ValueError, SyntaxError):
+                        # datetimes, UUIDs and the like
+                        self.stderr.write(f"{label}: can't read the parameters")
+                        self.unreadable += 1
+                        continue
+                else:
+                    sql, params = line.rstrip(";"), ()
+                if sql.upper().startswith("SELECT"):
+                    yield label, sql, params
+
+    def synthetic_workload(self):
+        """
+        The queries connections make through each filterset and orderset:
+        a filter on every declared field, a page in every declared order,
+        and every foreign key filter combined with each of those.
+        """
+        page = graphene_settings.RELAY_CONNECTION_MAX_LIMIT or 100
+        ordersets = {
+            orderset.Meta.model: orderset
+            for orderset in vars(orders).values()
+            if isinstance(orderset, type)
+            and issubclass(orderset, orders.orders.AdvancedOrderSet)
+            and hasattr(orderset, "Meta")
+        }
+        for filterset in vars(filters).values():
+            if not (
+                isinstance(filterset, type)
+                and issubclass(filterset, filters.SearchFilterSet)
+                and filterset._meta.model is not None
+            ):
+                continue
+            model = filterset._meta.model
+            manager = model._default_manager
+            fields = [
+                name for name in filterset._meta.fields if name in self.local(model)
+            ]
+            ranged = [
+                name
+                for name in fields
+                if not isinstance(
+                    model._meta.get_field(name), (models.CharField, models.TextField)
+                )
+            ]
+            foreign_keys = [
+                related.field_name
+                for related in filterset.related_filters.values()
+                # Not the reverse relations
+                if model._meta.get_field(related.field_name).concrete
+            ]
+            orderset = ordersets.get(model)
+            ordering = []
+            if orderset is not None:
+                ordering = list(orderset.Meta.fields)
+                for related in orderset.related_orders.values():
+                    ordering += [
+                        f"{related.field_name}__{name}"
+                        for name in related.orderset.Meta.fields
+                    ]
+            local_ordering = [name for name in ordering if name in self.local(model)]
+
+            queries = {}
+            for name in fields:
+                queries[f"{name}="] = manager.filter(**{name: sample(model, name)})
+            for name in ranged:
+                queries[f"{name}>="] = manager.filter(
+                    **{f"{name}__gte": sample(model, name)}
+                )
+            for name in ordering:
+                queries[f"order {name}"] = manager.order_by(name, "pk")[:page]
+            for key in foreign_keys:
+                value = sample(model, model._meta.get_field(key).attname)
+                for name in local_ordering:
+                    queries[f"{key}= order {name}"] = manager.filter(
+                        **{key: value}
+                    ).order_by(name, "pk")[:page]
+                for name in ranged:
+                    queries[f"{key}= {name}>="] = manager.filter(
+                        **{key: value, f"{name}__gte": sample(model, name)}
+                    )
+
+            for label, queryset in queries.items():
+                sql, params = queryset.query.sql_with_params()
+                yield f"{model.__name__} {label}", sql, params
+
+    @staticmethod
+    def local(model):
+        return {
+            field.name
+            for field in model._meta.concrete_fields
+            if not field.is_relation and not field.primary_key
+        }
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def issues(self, plan, tables):
+        issues = []
+        for detail in plan:
+            if (match := FULL_SCAN.match(detail)) and match[1] in tables:
+                issues.append(f"full scan of {match[1]}")
+            elif TEMP_SORT.match(detail):
+                issues.append("temp b-tree sort")
+        return issues
+
+    def problems(self, plan, sql, table):
+        """How many of the plan's full scans and temporary sorts are on ``table``."""
+        count = sum(
+            1
+            for detail in plan
+            if (match := FULL_SCAN.match(detail)) and match[1] == table
+        )
+        if from_table(sql) == table:
+            # The query's ORDER BY is on the table it selects from
+            count += sum(1 for detail in plan if TEMP_SORT.match(detail))
+        return count
+
+    def existing_indexes(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return [
+            tuple(constraint["columns"])
+            for constraint in constraints.values()
+            if constraint["index"] or constraint["unique"] or constraint["primary_key"]
+        ]
+
+    def improves(self, table, columns, sql, params, plan):
+        """Whether an index on ``columns`` makes the plan better, tried out."""
+        for existing in self.existing_indexes(table):
+            if existing[: len(columns)] == columns:
+                return False
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE INDEX "advisor_candidate" ON "{table}" ({quoted})'
+                )
+                # The planner weighs indexes by their statistics, if the
+                # table has any
+                cursor.execute('ANALYZE "advisor_candidate"')
+            after = self.problems(self.explain(sql, params), sql, table)
+            transaction.set_rollback(True)
+        return after < self.problems(plan, sql, table)
+
+    def suggested_indexes(self, suggestions, tables):
+        """``(model, Index, query labels)``, most useful first."""
+        # An index on (a, b) serves whatever one on (a) would
+        for table, columns in list(suggestions):
+            for other_table, other in suggestions:
+                if (
+                    other_table == table
+                    and len(other) > len(columns)
+                    and other[: len(columns)] == columns
+                ):
+                    suggestions[other_table, other] += suggestions.pop((table, columns))
+                    break
+        indexes = []
+        for (table, columns), labels in suggestions.items():
+            model = tables[table]
+            by_column = {
+                field.column: field.name for field in model._meta.concrete_fields
+            }
+            index = models.Index(fields=[by_column[column] for column in columns])
+            index.set_name_with_model(model)
+            indexes.append((model, index, labels))
+        return sorted(indexes, key=lambda item: -len(item[2]))
@@ -0,0 +1,226 @@
+import csv
+import decimal
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tools import generations, scoring
+from tools.models import Metric, Source, Tool, ToolMetric, UUIDModel
+
+COLUMNS = ("brand", "tool", "metric", "source", "value")
+
+# As ToolMetric.value stores them
+VALUE_PLACES = decimal.Decimal("0.01")
+MAX_VALUE = 10**8
+
+# Marks a name more than one row has, which can't be looked up
+AMBIGUOUS = object()
+
+
+def key(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def lookup_map(rows):
+    """``{key: value}`` of ``(key, value)`` rows, keys that repeat AMBIGUOUS."""
+    found = {}
+    for k, value in rows:
+        found[k] = AMBIGUOUS if found.get(k, value) != value else value
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Import ToolMetric values from CSV or JSON lines of brand, tool, metric, "
+        "source and value, replacing the values already measured"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="File to import, or - for standard input",
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Format of the file (default: from its extension, else csv)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per transaction (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"]
+        if format is None:
+            format = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+        started = time.perf_counter()
+        self.load_lookups()
+        imported = skipped = 0
+        # Scores recompute once, after the last batch
+        with scoring.batch():
+            with self.open(path) as file:
+                rows = self.read_csv(file) if format == "csv" else self.read_jsonl(file)
+                batch = {}
+                for line, row in rows:
+                    tool_metric = self.tool_metric(line, row)
+                    if tool_metric is None:
+                        skipped += 1
+                        continue
+                    # A row repeated within the file: the last one wins
+                    batch[
+                        tool_metric.tool_id,
+                        tool_metric.metric_id,
+                        tool_metric.source_id,
+                    ] = tool_metric
+                    if len(batch) >= options["batch_size"]:
+                        imported += self.save(batch.values())
+                        batch = {}
+                        self.progress(imported, skipped, started)
+                if batch:
+                    imported += self.save(batch.values())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} values, skipped {skipped} rows "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
+
+    def open(self, path):
+        if path == "-":
+            return open(sys.stdin.fileno(), newline="", closefd=False)
+        try:
+            return open(path, newline="", encoding="utf-8-sig")
+        except OSError as error:
+            raise CommandError(error)
+
+    def read_csv(self, file):
+        reader = csv.DictReader(file)
+        missing = set(COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+        # Line 1 is the header
+        for line, row in enumerate(reader, 2):
+            yield line, row
+
+    def read_jsonl(self, file):
+        for line, text in enumerate(file, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as error:
+                self.stderr.write(f"Line {line}: {error}")
+                row = None
+            else:
+                if not isinstance(row, dict):
+                    self.stderr.write(f"Line {line}: not an object")
+                    row = None
+            # None is skipped, as a row that can't be imported
+            yield line, row
+
+    def load_lookups(self):
+        """Map every name a row can use to its pk, once for the whole import."""
+        tools = Tool.objects.values_list(
+            "brand__name", "name", "model_number", "pk", "category_id"
+        )
+        self.tools = lookup_map(
+            [
+                ((key(brand), key(name)), (pk, category_id))
+                for brand, name, model_number, pk, category_id in tools
+            ]
+            + [
+                ((key(brand), key(model_number)), (pk, category_id))
+                for brand, name, model_number, pk, category_id in tools
+            ]
+        )
+        self.metrics = lookup_map(
+            ((category_id, key(name)), pk)
+            for name, category_id, pk in Metric.objects.values_list(
+                "name", "category_id", "pk"
+            )
+        )
+        self.sources = lookup_map(
+            (key(link), pk) for link, pk in Source.objects.values_list("link", "pk")
+        )
+
+    def find(self, line, lookup, k, description):
+        value = lookup.get(k)
+        if value is None:
+            self.stderr.write(f"Line {line}: no {description}")
+        elif value is AMBIGUOUS:
+            self.stderr.write(f"Line {line}: more than one {description}")
+            return None
+        return value
+
+    def tool_metric(self, line, row):
+        """The ToolMetric of a row, or None (and why) if it can't be imported."""
+        if row is None:
+            return None
+        missing = [column for column in COLUMNS if row.get(column) in (None, "")]
+        if missing:
+            self.stderr.write(f"Line {line}: no {', '.join(missing)}")
+            return None
+
+        tool = self.find(
+            line,
+            self.tools,
+            (key(row["brand"]), key(row["tool"])),
+            f"{row['brand']} tool {row['tool']!r}",
+        )
+        source_id = self.find(
+            line, self.sources, key(row["source"]), f"source {row['source']!r}"
+        )
+        if tool is None or source_id is None:
+            return None
+        tool_id, category_id = tool
+        metric_id = self.find(
+            line,
+            self.metrics,
+            (category_id, key(row["metric"])),
+            f"metric {row['metric']!r} in the tool's category",
+        )
+        if metric_id is None:
+            return None
+
+        try:
+            value = decimal.Decimal(str(row["value"]).strip())
+            value = value.quantize(VALUE_PLACES) if value.is_finite() else None
+        except decimal.InvalidOperation:
+            value = None
+        if value is None or abs(value) >= MAX_VALUE:
+            self.stderr.write(f"Line {line}: {row['value']!r} isn't a value")
+            return None
+        return ToolMetric(
+            tool_id=tool_id, metric_id=metric_id, source_id=source_id, value=value
+        )
+
+    @transaction.atomic
+    def save(self, tool_metrics):
+        tool_metrics = list(tool_metrics)
+        # New rows get their UUIDs in one more INSERT
+        ToolMetric.objects.bulk_create(
+            tool_metrics,
+            update_conflicts=True,
+            unique_fields=["tool", "metric", "source"],
+            update_fields=["value"],
+        )
+        # bulk_create sends no signals
+        scoring.schedule({tool_metric.source_id for tool_metric in tool_metrics})
+        generations.invalidate(ToolMetric, UUIDModel)
+        return len(tool_metrics)
+
+    def progress(self, imported, skipped, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{imported} values imported, {skipped} rows skipped "
+            f"({imported / elapsed:.0f} rows/s)"
+        )
@@ -1,9 +1,13 @@
 import decimal
 import random
+import time
 import factory
 from factory.django import DjangoModelFactory
-from django.core.management.base import BaseCommand
+from faker import Faker
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from tools import generations, search
 from tools.models import (
     Brand,
     Category,
@@ -12,8 +16,17 @@ from tools.models import (
     Source,
     Tool,
     ToolMetric,
+    UUIDModel,
 )
 
+UNITS = ("Minutes", "lbs", "MPH", "CFM", "RPM", "Seconds", "Inches/Second", "Inches")
+
+CENT = decimal.Decimal("0.01")
+
+
+def to_decimal(value):
+    return decimal.Decimal(f"{value:.2f}")
+
 
 class BrandFactory(DjangoModelFactory):
     class Meta:
@@ -99,10 +112,216 @@ class ToolMetricFactory(DjangoModelFactory):
 
 
 class Command(BaseCommand):
-    help = "Populate the database with dummy data"
+    help = (
+        "Populate the database with dummy data: a few hand-picked tools, or "
+        "as many generated ones as asked for"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--brands",
+            type=int,
+            help="Generate this many brands instead of the hand-picked data",
+        )
+        parser.add_argument(
+            "--categories",
+            type=int,
+            help="Generate this many categories",
+        )
+        parser.add_argument(
+            "--tools",
+            type=int,
+            help="Generate this many tools",
+        )
+        parser.add_argument(
+            "--sources",
+            type=int,
+            help="Generate this many sources, at least one per category",
+        )
+        parser.add_argument(
+            "--metrics",
+            type=int,
+            default=5,
+            help="Metrics per generated category, at most 100 (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed for generated data: the same seed, the same data",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Generated tools per INSERT (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        scale = ("brands", "categories", "tools", "sources")
+        if all(options[name] is None for name in scale):
+            self.populate_examples()
+            return
+
+        # Every metric weighs at least 0.01 and a category at most 1.00
+        if not 0 <= options["metrics"] <= 100:
+            raise CommandError("--metrics must be between 0 and 100.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.populate_generated(
+                brands=options["brands"] or 3,
+                categories=options["categories"] or 3,
+                tools=options["tools"] or 9,
+                sources=options["sources"] or 0,
+                metrics=options["metrics"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+            )
+            # The bulk writes sent no signals
+            generations.invalidate(
+                Brand,
+                Category,
+                Metric,
+                ContentCreator,
+                Source,
+                Tool,
+                ToolMetric,
+                UUIDModel,
+            )
+            search.rebuild_indexes()
+        call_command("recompute_scores", stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully generated dummy data "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
+
+    def populate_generated(
+        self, brands, categories, tools, sources, metrics, seed, batch_size
+    ):
+        """
+        Build rows in memory from ``seed`` and bulk insert them, their UUIDs
+        with them. Every tool is measured on every metric of its category
+        by one of the category's sources.
+        """
+        rng = random.Random(seed)
+        fake = Faker()
+        fake.seed_instance(seed)
+        words = [fake.word() for _ in range(1000)]
+
+        brands = Brand.objects.bulk_create(
+            [
+                Brand(
+                    name=fake.company(),
+                    link=fake.url(),
+                    year_founded=rng.randint(1850, 2020),
+                )
+                for _ in range(brands)
+            ],
+            batch_size=batch_size,
+        )
+        categories = Category.objects.bulk_create(
+            [
+                Category(
+                    name=f"Cordless {fake.word().title()} {i}",
+                    description=fake.sentence(),
+                )
+                for i in range(1, categories + 1)
+            ],
+            batch_size=batch_size,
+        )
+        self.stdout.write(
+            f"Created {len(brands)} Brands and {len(categories)} Categories"
+        )
+
+        # Up to 1.00 in total per category, as Metric.clean() requires
+        most = 100 // max(1, metrics)
+        category_metrics = Metric.objects.bulk_create(
+            [
+                Metric(
+                    name=f"{fake.word().title()} {i}",
+                    description=fake.sentence(),
+                    unit=rng.choice(UNITS),
+                    weighting=rng.randint(1, most) * CENT,
+                    category=category,
+                )
+                for category in categories
+                for i in range(1, metrics + 1)
+            ],
+            batch_size=batch_size,
+        )
+        # The typical measurement of each metric
+        scales = {metric.pk: 10 ** rng.uniform(0, 4) for metric in category_metrics}
+        metrics_of = {category.pk: [] for category in categories}
+        for metric in category_metrics:
+            metrics_of[metric.category_id].append(metric)
+        self.stdout.write(f"Created {len(category_metrics)} Metrics")
+
+        content_creators = ContentCreator.objects.bulk_create(
+            [
+                ContentCreator(name=fake.name(), link=fake.url())
+                for _ in range(max(1, sources // 10))
+            ],
+            batch_size=batch_size,
+        )
+        category_sources = Source.objects.bulk_create(
+            [
+                Source(
+                    link=f"https://www.youtube.com/watch?v={i:011d}",
+                    category=categories[i % len(categories)],
+                    content_creator=rng.choice(content_creators),
+                )
+                for i in range(max(sources, len(categories)))
+            ],
+            batch_size=batch_size,
+        )
+        sources_of = {category.pk: [] for category in categories}
+        for source in category_sources:
+            sources_of[source.category_id].append(source)
+        self.stdout.write(
+            f"Created {len(content_creators)} ContentCreators "
+            f"and {len(category_sources)} Sources"
+        )
+
+        # A batch of tools at a time, so memory doesn't grow with --tools
+        created = measured = 0
+        while created < tools:
+            batch = Tool.objects.bulk_create(
+                [
+                    Tool(
+                        name=rng.choice(words),
+                        model_number=f"{rng.randrange(10**13):013d}",
+                        description=fake.sentence(),
+                        weight=to_decimal(rng.uniform(1, 20)),
+                        price=to_decimal(rng.uniform(20, 1500)),
+                        noise_level=to_decimal(rng.uniform(50, 110)),
+                        brand_id=rng.choice(brands).pk,
+                        category_id=rng.choice(categories).pk,
+                    )
+                    for _ in range(min(batch_size, tools - created))
+                ]
+            )
+            tool_metrics = ToolMetric.objects.bulk_create(
+                [
+                    ToolMetric(
+                        tool_id=tool.pk,
+                        metric_id=metric.pk,
+                        source_id=source.pk,
+                        value=to_decimal(scales[metric.pk] * rng.uniform(0.5, 1.5)),
+                    )
+                    for tool in batch
+                    for source in [rng.choice(sources_of[tool.category_id])]
+                    for metric in metrics_of[tool.category_id]
+                ]
+            )
+            created += len(batch)
+            measured += len(tool_metrics)
+            self.stdout.write(f"Created {created} Tools and {measured} ToolMetrics")
 
     @transaction.atomic
-    def handle(self, *args, **kwargs):
+    def populate_examples(self):
         self.stdout.write("Creating dummy data...")
 
         # 1. Create Brands
@@ -0,0 +1,100 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from tools import generations, scoring
+from tools.models import (
+    Category,
+    ToolMetric,
+    UUIDModel,
+    WeightedAverage,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild every WeightedAverage score, one category at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--category",
+            action="append",
+            type=int,
+            dest="categories",
+            help="Only rebuild this category id (can be repeated)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per INSERT when writing scores (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        categories = Category.objects.order_by("pk")
+        if options["categories"]:
+            categories = categories.filter(pk__in=options["categories"])
+
+        metrics = scoring.load_metrics()
+        total = 0
+        for category in categories:
+            category_started = time.perf_counter()
+            count = self.rebuild_category(category, metrics, options["batch_size"])
+            total += count
+            self.stdout.write(
+                f"{category}: {count} scores "
+                f"in {time.perf_counter() - category_started:.2f}s"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recomputed {total} scores "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
+
+    @transaction.atomic
+    def rebuild_category(self, category, metrics, batch_size):
+        # One query for the whole tool x metric matrix of the category's
+        # sources, the rows rebuilt and pruned below
+        measurements = scoring.load_measurements(
+            ToolMetric.objects.filter(source__category=category)
+        )
+        # With SCORE_NORMALIZATION, as every incremental recompute after it
+        pairs, scores = scoring.score_measurements(measurements, metrics)
+
+        # New rows get their UUIDs in the same batches
+        WeightedAverage.objects.bulk_create(
+            [
+                WeightedAverage(
+                    source_id=source_id,
+                    tool_id=tool_id,
+                    score=scoring.to_score(score),
+                )
+                for (source_id, tool_id), score in zip(pairs.tolist(), scores.tolist())
+            ],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["tool", "source"],
+            update_fields=["score"],
+        )
+
+        averages = WeightedAverage.objects.filter(source__category=category)
+        # Drop scores whose measurements have all been deleted, or weigh
+        # nothing, which score_measurements() leaves unscored.
+        averages.exclude(
+            Exists(
+                ToolMetric.objects.filter(
+                    tool=OuterRef("tool"),
+                    source=OuterRef("source"),
+                    metric__weighting__gt=0,
+                )
+            )
+        ).delete()
+        # The bulk writes above sent no signals
+        generations.invalidate(WeightedAverage, UUIDModel)
+
+        return len(pairs)
@@ -0,0 +1,127 @@
+from django.db import migrations
+
+# The FTS5 tables tools.search queries, and the triggers keeping them in sync
+# with every write, as of this migration. Each row's rowid is its model's pk.
+# FTS5 keeps extra indexes for prefixes of 2 and 3 characters, so short
+# prefixes are fast.
+OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+
+def simple_index(table, columns):
+    """Statements indexing ``columns`` of ``table`` itself."""
+    fts = f"{table}_fts"
+    names = ", ".join(f'"{column}"' for column in columns)
+    new = ", ".join(f'NEW."{column}"' for column in columns)
+    insert = f'INSERT INTO "{fts}" (rowid, {names}) VALUES (NEW."id", {new});'
+    delete = f'DELETE FROM "{fts}" WHERE rowid = OLD."id";'
+    return [
+        f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, {OPTIONS})',
+        f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table}" BEGIN {insert} END',
+        f'CREATE TRIGGER "{fts}_update" AFTER UPDATE OF {names} ON "{table}" '
+        f"BEGIN {delete} {insert} END",
+        f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table}" BEGIN {delete} END',
+        f'INSERT INTO "{fts}" (rowid, {names}) SELECT "id", {names} FROM "{table}"',
+    ]
+
+
+# Tools index their brand's and category's names too
+TOOL_ROWS = (
+    'SELECT t."id", t."name", t."model_number", b."name", c."name" '
+    'FROM "tools_tool" t '
+    'INNER JOIN "tools_brand" b ON t."brand_id" = b."id" '
+    'INNER JOIN "tools_category" c ON t."category_id" = c."id"'
+)
+TOOL_INSERT = (
+    'INSERT INTO "tools_tool_fts" '
+    '(rowid, "name", "model_number", "brand__name", "category__name") '
+)
+TOOL_STATEMENTS = [
+    'CREATE VIRTUAL TABLE "tools_tool_fts" USING fts5('
+    f'"name", "model_number", "brand__name", "category__name", {OPTIONS})',
+    'CREATE TRIGGER "tools_tool_fts_insert" AFTER INSERT ON "tools_tool" BEGIN '
+    f'{TOOL_INSERT}{TOOL_ROWS} WHERE t."id" = NEW."id"; END',
+    'CREATE TRIGGER "tools_tool_fts_update" AFTER UPDATE OF '
+    '"brand_id", "category_id", "model_number", "name" ON "tools_tool" BEGIN '
+    'DELETE FROM "tools_tool_fts" WHERE rowid = OLD."id"; '
+    f'{TOOL_INSERT}{TOOL_ROWS} WHERE t."id" = NEW."id"; END',
+    'CREATE TRIGGER "tools_tool_fts_delete" AFTER DELETE ON "tools_tool" BEGIN '
+    'DELETE FROM "tools_tool_fts" WHERE rowid = OLD."id"; END',
+    'CREATE TRIGGER "tools_tool_fts_tools_brand_update" '
+    'AFTER UPDATE OF "name" ON "tools_brand" BEGIN '
+    'DELETE FROM "tools_tool_fts" WHERE rowid IN '
+    '(SELECT "id" FROM "tools_tool" WHERE "brand_id" = NEW."id"); '
+    f'{TOOL_INSERT}{TOOL_ROWS} WHERE t."brand_id" = NEW."id"; END',
+    'CREATE TRIGGER "tools_tool_fts_tools_category_update" '
+    'AFTER UPDATE OF "name" ON "tools_category" BEGIN '
+    'DELETE FROM "tools_tool_fts" WHERE rowid IN '
+    '(SELECT "id" FROM "tools_tool" WHERE "category_id" = NEW."id"); '
+    f'{TOOL_INSERT}{TOOL_ROWS} WHERE t."category_id" = NEW."id"; END',
+    f"{TOOL_INSERT}{TOOL_ROWS}",
+]
+
+STATEMENTS = [
+    *simple_index("tools_brand", ["name", "link"]),
+    *simple_index("tools_category", ["name", "description"]),
+    *simple_index("tools_metric", ["name", "description", "unit"]),
+    *simple_index("tools_contentcreator", ["name", "link"]),
+    *simple_index("tools_source", ["link"]),
+    *TOOL_STATEMENTS,
+]
+
+TRIGGERS = [
+    f"{table}_fts_{trigger}"
+    for table in (
+        "tools_brand",
+        "tools_category",
+        "tools_metric",
+        "tools_contentcreator",
+        "tools_source",
+        "tools_tool",
+    )
+    for trigger in ("insert", "update", "delete")
+] + ["tools_tool_fts_tools_brand_update", "tools_tool_fts_tools_category_update"]
+
+TABLES = [
+    "tools_brand_fts",
+    "tools_category_fts",
+    "tools_metric_fts",
+    "tools_contentcreator_fts",
+    "tools_source_fts",
+    "tools_tool_fts",
+]
+
+
+def supports_fts5(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_indexes(apps, schema_editor):
+    # Other databases search with LIKE
+    if not supports_fts5(schema_editor.connection):
+        return
+    for statement in STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for trigger in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tools", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
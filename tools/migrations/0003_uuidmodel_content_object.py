@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The UUIDModel field of each model as of this migration
+TARGETS = {
+    "brand": "brand",
+    "category": "category",
+    "metric": "metric",
+    "contentcreator": "content_creator",
+    "source": "source",
+    "tool": "tool",
+    "toolmetric": "tool_metric",
+    "weightedaverage": "weighted_average",
+}
+
+
+def fill_content_objects(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    UUIDModel = apps.get_model("tools", "UUIDModel")
+    db = schema_editor.connection.alias
+    for model_name, field_name in TARGETS.items():
+        content_type, _ = ContentType.objects.using(db).get_or_create(
+            app_label="tools", model=model_name
+        )
+        UUIDModel.objects.using(db).filter(**{f"{field_name}__isnull": False}).update(
+            content_type=content_type,
+            object_id=models.F(f"{field_name}_id"),
+        )
+    # A UUID for nothing can't be resolved to anything
+    UUIDModel.objects.using(db).filter(content_type__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("tools", "0002_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uuidmodel",
+            name="content_type",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="contenttypes.contenttype",
+            ),
+        ),
+        migrations.AddField(
+            model_name="uuidmodel",
+            name="object_id",
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_content_objects, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="uuidmodel",
+            name="content_type",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="contenttypes.contenttype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uuidmodel",
+            name="object_id",
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
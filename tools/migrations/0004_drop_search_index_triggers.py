@@ -0,0 +1,38 @@
+import importlib
+
+from django.db import migrations
+
+# tools.search keeps the FTS5 tables in sync from Python now. SQLite
+# rebuilds a table to alter one of its columns, and the triggers of 0002
+# either broke the rebuild (those reading another table) or were dropped
+# with the old table without a word.
+search_index = importlib.import_module("tools.migrations.0002_search_index")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for trigger in search_index.TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    tables = schema_editor.connection.introspection.table_names()
+    if not set(search_index.TABLES) <= set(tables):
+        return
+    for statement in search_index.STATEMENTS:
+        if statement.startswith("CREATE TRIGGER"):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tools", "0003_uuidmodel_content_object"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+    ]
@@ -1,18 +1,65 @@
 import decimal
 import uuid
 
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 
+from . import counts
+
+
+class UUIDQuerySet(models.QuerySet):
+    """
+    QuerySet of a model with a ``UUIDModel`` row per instance.
+
+    ``create_uuid_model`` gives saved instances theirs, but ``bulk_create``
+    sends no signals, so it inserts them itself: one more batched INSERT per
+    batch rather than one per row. It adjusts the row counts of
+    ``tools.counts`` too.
+    """
+
+    def bulk_create(self, objs, batch_size=None, **kwargs):
+        objs = super().bulk_create(objs, batch_size=batch_size, **kwargs)
+        UUIDModel.objects.using(self.db).bulk_create(
+            new_uuid_models(self.model, [obj.pk for obj in objs if obj.pk]),
+            batch_size=batch_size,
+            # Rows that already existed (update_conflicts) already have one
+            ignore_conflicts=True,
+        )
+        for model in (self.model, UUIDModel):
+            if kwargs.get("ignore_conflicts") or kwargs.get("update_conflicts"):
+                # Some of the rows may have been there already
+                counts.forget_row_count(model, self.db)
+            else:
+                counts.adjust_row_count(model, len(objs), self.db)
+        if any(obj.pk is None for obj in objs):
+            # ignore_conflicts, or a database that can't return the pks of
+            # the rows it inserted
+            self.add_missing_uuids()
+        return objs
+
+    def add_missing_uuids(self):
+        """Give the rows of this queryset that have no ``UUIDModel`` one."""
+        counts.forget_row_count(UUIDModel, self.db)
+        return UUIDModel.objects.using(self.db).bulk_create(
+            new_uuid_models(
+                self.model,
+                self.filter(uuid__isnull=True).values_list("pk", flat=True),
+            )
+        )
+
 
 class Brand(models.Model):
     name = models.TextField()
     link = models.URLField()
     year_founded = models.PositiveSmallIntegerField()
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Brand"
         verbose_name_plural = "Brands"
@@ -25,6 +72,8 @@ class Category(models.Model):
     name = models.TextField()
     description = models.TextField()
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Category"
         verbose_name_plural = "Categories"
@@ -54,6 +103,8 @@ class Metric(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         unique_together = ("name", "category")
         verbose_name = "Metric"
@@ -89,6 +140,8 @@ class ContentCreator(models.Model):
     name = models.TextField()
     link = models.URLField()
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Content Creator"
         verbose_name_plural = "Content Creators"
@@ -111,6 +164,8 @@ class Source(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Source"
         verbose_name_plural = "Sources"
@@ -156,6 +211,8 @@ class Tool(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Tool"
         verbose_name_plural = "Tools"
@@ -186,11 +243,20 @@ class ToolMetric(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         unique_together = ("tool", "metric", "source")
         verbose_name = "Tool Metric"
         verbose_name_plural = "Tool Metrics"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What tools.scoring compares with to tell whether it moved
+        instance._loaded_source_id = instance.__dict__.get("source_id")
+        return instance
+
     def __str__(self):
         return f"{self.tool.name} - {self.metric.name}: {self.value}"
 
@@ -212,6 +278,8 @@ class WeightedAverage(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UUIDQuerySet.as_manager()
+
     class Meta:
         unique_together = ("tool", "source")
         verbose_name = "Weighted Average"
@@ -277,6 +345,14 @@ class UUIDModel(models.Model):
         null=True,
         on_delete=models.CASCADE,
     )
+    # Which of the above it is, so a UUID resolves without probing them all
+    content_type = models.ForeignKey(
+        ContentType,
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    object_id = models.PositiveBigIntegerField()
+    content_object = GenericForeignKey("content_type", "object_id")
 
     class Meta:
         verbose_name = "UUID"
@@ -286,6 +362,25 @@ class UUIDModel(models.Model):
         return str(self.id)
 
 
+def uuid_field_name(model):
+    """The ``UUIDModel`` field pointing at ``model``."""
+    for field in UUIDModel._meta.concrete_fields:
+        if field.related_model is model:
+            return field.name
+    raise LookupError(f"{model._meta.label} has no UUIDModel field")
+
+
+def new_uuid_models(model, pks):
+    """Unsaved ``UUIDModel`` rows for the ``model`` rows ``pks``."""
+    # Looked up once, not per row: bulk inserts build a lot of these
+    column = f"{uuid_field_name(model)}_id"
+    content_type_id = ContentType.objects.get_for_model(model).pk
+    return [
+        UUIDModel(**{column: pk}, content_type_id=content_type_id, object_id=pk)
+        for pk in pks
+    ]
+
+
 @receiver(post_save, sender=Brand)
 @receiver(post_save, sender=Category)
 @receiver(post_save, sender=Metric)
@@ -296,11 +391,5 @@ class UUIDModel(models.Model):
 @receiver(post_save, sender=WeightedAverage)
 def create_uuid_model(sender, instance, created, **kwargs):
     if created:
-        field_name = sender._meta.model_name
-        if sender == ContentCreator:
-            field_name = "content_creator"
-        elif sender == ToolMetric:
-            field_name = "tool_metric"
-        elif sender == WeightedAverage:
-            field_name = "weighted_average"
-        UUIDModel.objects.create(**{field_name: instance})
+        [uuid_model] = new_uuid_models(sender, [instance.pk])
+        uuid_model.save()
@@ -0,0 +1,142 @@
+"""
+Shape connection querysets to the GraphQL selection set.
+
+Walks the ``edges { node { ... } }`` selection of a connection field and
+applies:
+
+- ``select_related`` for forward ForeignKey / OneToOne fields,
+- ``prefetch_related`` with a ``Prefetch`` for reverse connections that
+  take no filtering or ordering arguments,
+- ``only()`` for the selected columns, so large ``TextField``s such as
+  ``Tool.description`` are only read when asked for.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+# Arguments that only page through a connection. A reverse connection with
+# any other argument re-queries, so prefetching it would be wasted.
+PAGINATION_ARGS = {"first", "last", "before", "after", "offset", "pagination"}
+
+
+def iter_fields(selection_set, info):
+    """Yield the FieldNodes of ``selection_set``, expanding fragments."""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from iter_fields(selection.selection_set, info)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            yield from iter_fields(fragment.selection_set, info)
+
+
+def node_selections(field_nodes, info):
+    """Return the ``node`` FieldNodes under the ``edges`` of a connection."""
+    return [
+        node
+        for field_node in field_nodes
+        for edges in iter_fields(field_node.selection_set, info)
+        if edges.name.value == "edges"
+        for node in iter_fields(edges.selection_set, info)
+        if node.name.value == "node"
+    ]
+
+
+def is_paginated_only(field_node):
+    return all(
+        argument.name.value in PAGINATION_ARGS for argument in field_node.arguments
+    )
+
+
+class Plan:
+    """What a selection needs loaded: columns, joins and prefetches."""
+
+    def __init__(self):
+        self.only = set()
+        # Cleared when a selected field can't be mapped to a column
+        self.restrict = True
+        self.select_related = set()
+        self.prefetch_related = []
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.restrict:
+            queryset = queryset.only(*sorted(self.only) or ["pk"])
+        return queryset
+
+
+def plan(model, selections, info, prefix="", result=None):
+    """Collect what ``selections`` (FieldNodes on ``model``) need loaded."""
+    result = result or Plan()
+    for field_node in (
+        field for selection in selections for field in iter_fields(selection, info)
+    ):
+        name = field_node.name.value
+        if name in ("id", "__typename"):
+            continue
+
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            # Computed on the node type; it may read any column.
+            result.restrict = False
+            continue
+
+        path = f"{prefix}{field.name}"
+        if field.one_to_many or field.many_to_many:
+            if field.one_to_many and is_paginated_only(field_node):
+                child = plan(
+                    field.related_model,
+                    [
+                        node.selection_set
+                        for node in node_selections([field_node], info)
+                    ],
+                    info,
+                )
+                # Prefetching matches rows back to parents through the FK.
+                child.only.add(field.field.name)
+                result.prefetch_related.append(
+                    Prefetch(
+                        path,
+                        queryset=child.apply(
+                            field.related_model._default_manager.all()
+                        ),
+                    )
+                )
+        elif field.is_relation:
+            # Forward FK / OneToOne, or a reverse OneToOne
+            result.select_related.add(path)
+            result.only.add(f"{path}__{field.related_model._meta.pk.name}")
+            if field.concrete:
+                result.only.add(path)
+            plan(
+                field.related_model,
+                [field_node.selection_set],
+                info,
+                prefix=f"{path}__",
+                result=result,
+            )
+        else:
+            result.only.add(path)
+    return result
+
+
+def optimize(queryset, info):
+    """Apply the Plan for the connection field being resolved to ``queryset``."""
+    selections = [
+        node.selection_set for node in node_selections(info.field_nodes, info)
+    ]
+    if not selections:
+        return queryset
+    result = plan(queryset.model, selections, info)
+    # A related manager's queryset reads its FK to attach the parent object.
+    result.only.update(field.name for field in queryset._known_related_objects)
+    return result.apply(queryset)
@@ -0,0 +1,172 @@
+"""
+Keyset (seek) pagination for connections.
+
+Offset cursors make the database skip every earlier row, so deep pages get
+slower and shift when rows are inserted. Keyset cursors hold the ordering
+key of a row instead: the active ``orderBy`` fields plus ``pk`` as a
+tiebreaker. The next page is whatever sorts after that key, so every page
+costs the same as the first.
+
+NULLs sort before every other value, whatever the database's default, so
+a key holding one can be sought past like any other.
+"""
+
+import datetime
+import decimal
+import json
+import uuid
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+
+PREFIX = "keyset:"
+
+
+class PaginationMode(graphene.Enum):
+    OFFSET = "offset"
+    KEYSET = "keyset"
+
+
+def encode(value):
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def to_cursor(values):
+    return base64(PREFIX + json.dumps([encode(value) for value in values]))
+
+
+def from_cursor(cursor, fields):
+    """Return the key a keyset cursor holds for ``fields``."""
+    try:
+        data = unbase64(cursor)
+    except Exception:
+        data = ""
+    if not data.startswith(PREFIX):
+        # Not a keyset cursor, such as an offset one
+        raise GraphQLError("Invalid cursor")
+    try:
+        key = json.loads(data[len(PREFIX) :])
+    except ValueError:
+        raise GraphQLError("Invalid cursor")
+    # A cursor from a page with another orderBy holds another key
+    if (
+        not isinstance(key, list)
+        or len(key) != len(fields)
+        or any(isinstance(value, (list, dict)) for value in key)
+    ):
+        raise GraphQLError("Invalid cursor")
+    return key
+
+
+def ordering(queryset):
+    """The queryset's ordering with ``pk`` appended, so every key is unique."""
+    fields = list(queryset.query.order_by or queryset.model._meta.ordering)
+    pk_names = ("pk", queryset.model._meta.pk.name)
+    if not any(field.lstrip("-") in pk_names for field in fields):
+        fields.append("pk")
+    return fields
+
+
+def order_by(fields):
+    """``fields`` as expressions sorting NULLs first, as ``seek()`` expects."""
+    return [
+        (
+            F(field[1:]).desc(nulls_last=True)
+            if field.startswith("-")
+            else F(field).asc(nulls_first=True)
+        )
+        for field in fields
+    ]
+
+
+def equal(path, value):
+    return Q(**{f"{path}__isnull": True}) if value is None else Q(**{path: value})
+
+
+def past(path, value, descending):
+    """Q for the values of ``path`` sorting after ``value``, or None if none do."""
+    if descending:
+        if value is None:
+            return None
+        return Q(**{f"{path}__lt": value}) | Q(**{f"{path}__isnull": True})
+    if value is None:
+        return Q(**{f"{path}__isnull": False})
+    return Q(**{f"{path}__gt": value})
+
+
+def seek(fields, key, backwards=False):
+    """
+    Q for the rows sorting after ``key`` (or before it, ``backwards``).
+
+    (a, b) > (x, y) is written out as ``a > x OR (a = x AND b > y)``.
+    """
+    condition = Q()
+    for i, field in enumerate(fields):
+        path = field.lstrip("-")
+        term = past(path, key[i], field.startswith("-") != backwards)
+        if term is None:
+            continue
+        for previous, value in zip(fields[:i], key[:i]):
+            term &= equal(previous.lstrip("-"), value)
+        condition |= term
+    # Nothing sorts after a key of NULLs in descending fields
+    return condition if condition else Q(pk__in=[])
+
+
+def reverse(fields):
+    return [field[1:] if field.startswith("-") else f"-{field}" for field in fields]
+
+
+def paginate(queryset, first=None, last=None, after=None, before=None):
+    """
+    Return ``(rows, cursors, has_previous_page, has_next_page)`` for a page.
+
+    ``after``/``before`` are keyset cursors from an earlier page with the
+    same ordering; any other cursor raises "Invalid cursor".
+    """
+    fields = ordering(queryset)
+    queryset = queryset.annotate(
+        **{f"keyset_{i}": F(field.lstrip("-")) for i, field in enumerate(fields)}
+    )
+
+    try:
+        if after:
+            queryset = queryset.filter(seek(fields, from_cursor(after, fields)))
+        if before:
+            queryset = queryset.filter(
+                seek(fields, from_cursor(before, fields), backwards=True)
+            )
+    except (ValidationError, ValueError, TypeError):
+        # A value the field can't hold, such as text for a number
+        raise GraphQLError("Invalid cursor")
+
+    has_previous_page = has_next_page = False
+    if first is None and last is not None:
+        # Walk backwards from the end (or from before), then flip the page
+        rows = list(queryset.order_by(*order_by(reverse(fields)))[: last + 1])
+        has_previous_page = len(rows) > last
+        rows = rows[:last][::-1]
+    else:
+        queryset = queryset.order_by(*order_by(fields))
+        if first is None:
+            rows = list(queryset)
+        else:
+            rows = list(queryset[: first + 1])
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+        if last is not None:
+            has_previous_page = len(rows) > last
+            rows = rows[-last:] if last else []
+
+    cursors = [
+        to_cursor([getattr(row, f"keyset_{i}") for i in range(len(fields))])
+        for row in rows
+    ]
+    return rows, cursors, has_previous_page, has_next_page
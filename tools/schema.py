@@ -1,5 +1,27 @@
+import asyncio
+import functools
+
 import graphene
+from asgiref.sync import sync_to_async
+from django.core.exceptions import NON_FIELD_ERRORS, ObjectDoesNotExist
+from django.db import close_old_connections
+from django.db.models import QuerySet, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphene.utils.dataloader import DataLoader
+from graphene.utils.str_converters import to_camel_case
 from graphene_django import DjangoObjectType
+from graphene_django.converter import get_django_field_description
+from graphene_django.registry import get_global_registry
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from graphql_relay import (
+    cursor_to_offset,
+    from_global_id,
+    get_offset_with_default,
+    offset_to_cursor,
+    to_global_id,
+)
 
 # from graphene_django.types import DjangoObjectType
 
@@ -12,8 +34,269 @@ from django_graphene_filters import (
 
 from . import models
 
+from . import aggregates
+from . import autocomplete
+from . import comparison
+from . import counts
+from . import facets
 from . import filters
+from . import optimizer
 from . import orders
+from . import pagination
+from . import upserts
+from . import uuids
+
+"""
+Async execution
+
+Under the async GraphQL view resolvers run on the event loop, where the ORM
+can't be used. Resolvers that query return awaitables instead: ForeignKeys
+batch through DataLoaders, and anything bigger (filtering, paging,
+counting) runs as one ``sync_to_async`` call.
+
+Queries only read, outside any transaction, so these calls don't need the
+one thread ``sync_to_async`` runs everything on by default: each runs in a
+thread of the executor's pool, with that thread's own connection, and the
+islands of one query (and of concurrent requests) run in parallel.
+Mutations, which write, run in a ``thread_sensitive`` call of their own.
+"""
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def read_only(function):
+    """
+    ``function`` as a coroutine function run in any worker thread, closing
+    that thread's connection afterwards if it's too old to keep, as
+    Django does at the end of a request.
+    """
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def sync_island(resolver):
+    """Run ``resolver`` in a worker thread when executing asynchronously."""
+
+    @functools.wraps(resolver)
+    def wrapper(*args, **kwargs):
+        if in_event_loop():
+            return read_only(resolver)(*args, **kwargs)
+        return resolver(*args, **kwargs)
+
+    return wrapper
+
+
+"""
+Loaders
+"""
+
+
+def get_related(instance, field_name):
+    try:
+        return getattr(instance, field_name)
+    except ObjectDoesNotExist:
+        # A reverse OneToOne with no row behind it
+        return None
+
+
+class RelatedLoader:
+    """
+    Per-request batching for forward ForeignKey fields.
+
+    graphene resolves a page of nodes one node at a time, so ``node.brand``
+    would cost one query per node. Instead, the first time a field is
+    resolved on any node of a page, the loader fetches it for the whole page
+    with a single ``pk__in`` query. The fetched objects become a page of
+    their own, so every level of nesting costs one query.
+    """
+
+    def __init__(self):
+        self.pages = {}
+
+    def add_page(self, instances):
+        instances = list(instances)
+        for instance in instances:
+            self.pages[id(instance)] = instances
+
+    def load(self, instance, field_name):
+        field = instance._meta.get_field(field_name)
+        if not field.is_cached(instance):
+            page = self.pages.get(id(instance), [instance])
+            prefetch_related_objects(
+                [obj for obj in page if not field.is_cached(obj)],
+                field_name,
+            )
+            related = {
+                id(obj): obj
+                for obj in (get_related(obj, field_name) for obj in page)
+                if obj is not None
+            }
+            self.add_page(related.values())
+        return get_related(instance, field_name)
+
+
+class AsyncRelatedLoader:
+    """
+    RelatedLoader for async execution.
+
+    One DataLoader per relation collects the keys every resolver on the
+    event loop asks for in the same tick, and fetches them in one query.
+    """
+
+    def __init__(self):
+        self.loaders = {}
+
+    def load(self, instance, field_name):
+        field = instance._meta.get_field(field_name)
+        if field.is_cached(instance):
+            # select_related by the optimizer
+            return get_related(instance, field_name)
+        if field.concrete:
+            key = getattr(instance, field.attname)
+            lookup = field.target_field.attname
+        else:
+            # Reverse OneToOne
+            key = instance.pk
+            lookup = field.field.attname
+        if key is None:
+            return None
+
+        loader = self.loaders.get(field)
+        if loader is None:
+            loader = self.loaders[field] = DataLoader(
+                functools.partial(self.batch, field.related_model, lookup)
+            )
+        return loader.load(key)
+
+    @staticmethod
+    async def batch(model, lookup, keys):
+        objs = await read_only(list)(
+            model._default_manager.filter(**{f"{lookup}__in": keys})
+        )
+        rows = {getattr(obj, lookup): obj for obj in objs}
+        return [rows.get(key) for key in keys]
+
+
+def get_loader(info):
+    """Return the RelatedLoader shared by everything in this request."""
+    context = info.context
+    loader = getattr(context, "related_loader", None)
+    if loader is None:
+        loader = RelatedLoader()
+        if context is not None:
+            context.related_loader = loader
+    return loader
+
+
+def get_async_loader(info):
+    """Return the AsyncRelatedLoader shared by everything in this request."""
+    context = info.context
+    loader = getattr(context, "async_related_loader", None)
+    if loader is None:
+        loader = AsyncRelatedLoader()
+        if context is not None:
+            context.async_related_loader = loader
+    return loader
+
+
+def get_refilters(info):
+    """
+    ``{path: (refilter, args)}`` of the connections resolved in this
+    operation. Paths repeat across the operations of a batch, so the view
+    gives each operation a context of its own for them.
+
+    ``refilter(args)`` filters the connection's rows again with other
+    arguments, as the connection at ``path`` was filtered with ``args``.
+    """
+    context = info.context
+    refilters = getattr(context, "connection_refilters", None)
+    if refilters is None:
+        refilters = {}
+        if context is not None:
+            context.connection_refilters = refilters
+    return refilters
+
+
+def related(field_name):
+    """Build a resolver that loads ``field_name`` through the request's loader."""
+
+    def resolver(root, info, **kwargs):
+        if in_event_loop():
+            return get_async_loader(info).load(root, field_name)
+        return get_loader(info).load(root, field_name)
+
+    return resolver
+
+
+class Node(graphene.relay.Node):
+    """``graphene.Node``, looked up off the event loop when executing asynchronously."""
+
+    class Meta:
+        name = "Node"
+
+    @classmethod
+    def get_node_from_global_id(cls, info, global_id, only_type=None):
+        return sync_island(super().get_node_from_global_id)(
+            info, global_id, only_type=only_type
+        )
+
+
+class Aggregate(graphene.ObjectType):
+    group = graphene.Field(
+        Node,
+        description="The object this group's rows relate to; null when not grouped.",
+    )
+    count = graphene.Int(
+        required=True,
+        description="Number of rows with a value.",
+    )
+    min = graphene.Float()
+    max = graphene.Float()
+    avg = graphene.Float()
+    std_dev = graphene.Float(description="Population standard deviation.")
+
+
+def aggregates_field(node, fields):
+    """The ``aggregates`` field of ``node``'s connection."""
+    model = node._meta.model
+    args = {
+        "field": graphene.Argument(
+            graphene.Enum(
+                f"{node._meta.name}AggregateField",
+                [(name.upper(), name) for name in fields],
+            ),
+            required=True,
+        ),
+    }
+    dimensions = aggregates.dimensions(model)
+    if dimensions:
+        args["group_by"] = graphene.Argument(
+            graphene.Enum(
+                f"{node._meta.name}GroupBy",
+                [(path.replace(LOOKUP_SEP, "_").upper(), path) for path in dimensions],
+            ),
+        )
+    return graphene.Field(
+        graphene.List(graphene.NonNull(Aggregate), required=True),
+        args=args,
+        description=(
+            "Statistics of a field over every object the filter matches, "
+            "computed in one query; one per group when grouped."
+        ),
+    )
 
 
 class CountableConnection(graphene.relay.Connection):
@@ -28,13 +311,310 @@ class CountableConnection(graphene.relay.Connection):
         description="Count of objects in this edge.",
         required=True,
     )
+    approximate_count = graphene.Int(
+        description=(
+            "Estimated total of objects in this connection: a maintained row "
+            "count when unfiltered."
+        ),
+        required=True,
+    )
 
+    def resolve_edges(root, info, **kwargs):
+        # Every node on this page is loaded together by related() resolvers
+        get_loader(info).add_page(edge.node for edge in root.edges)
+        return root.edges
+
+    @sync_island
     def resolve_count(root, info, **kwargs):
+        # Only COUNTed when selected; see ConnectionField.resolve_connection
+        if root.length is None:
+            root.length = counts.count(root.iterable)
         return root.length
 
+    @sync_island
+    def resolve_approximate_count(root, info, **kwargs):
+        if root.length is not None:
+            return root.length
+        return counts.approximate_count(root.iterable)
+
     def resolve_counts(root, info, **kwargs):
         return len(root.edges)
 
+    @sync_island
+    def resolve_aggregates(root, info, field, group_by=None):
+        model = root._meta.node._meta.model
+        queryset = root.iterable
+        if not isinstance(queryset, QuerySet):
+            # A connection served from its parent's prefetch
+            queryset = model._default_manager.filter(
+                pk__in=[obj.pk for obj in queryset]
+            )
+
+        path = group_by.value if group_by is not None else None
+        rows = aggregates.aggregate(queryset, field.value, path)
+        if path is not None:
+            groups = aggregates.dimensions(model)[path]._default_manager.in_bulk(
+                {row["group"] for row in rows} - {None}
+            )
+            get_loader(info).add_page(groups.values())
+            for row in rows:
+                row["group"] = groups.get(row["group"])
+        return rows
+
+
+class ConnectionField(AdvancedDjangoFilterConnectionField):
+    """
+    AdvancedDjangoFilterConnectionField that only loads what is selected.
+
+    Querysets are shaped by ``optimizer.optimize()``. A reverse connection
+    that was already prefetched by its parent's queryset is served from the
+    prefetch cache, as long as it is only being paged through.
+    """
+
+    # FilterArgumentsFactory rebuilds the whole filter input tree on every
+    # call, so fields for the same node type share the result.
+    filtering_args_by_prefix = {}
+
+    @property
+    def filtering_args(self):
+        prefix = self.filter_input_type_prefix
+        if prefix not in self.filtering_args_by_prefix:
+            self.filtering_args_by_prefix[prefix] = super().filtering_args
+        return self.filtering_args_by_prefix[prefix]
+
+    @property
+    def args(self):
+        return {
+            **super().args,
+            "pagination": graphene.Argument(
+                pagination.PaginationMode,
+                description=(
+                    "OFFSET (default) cursors hold a row's position; KEYSET "
+                    "cursors hold its orderBy values, so deep pages stay fast."
+                ),
+            ),
+        }
+
+    @args.setter
+    def args(self, args):
+        self._base_args = args
+
+    @classmethod
+    def connection_resolver(cls, *args, **kwargs):
+        # Filtering, ordering and paging all query the database
+        return sync_island(super().connection_resolver)(*args, **kwargs)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        """
+        Slice a page out of a queryset without counting it first.
+
+        The page is fetched with one extra row to tell whether there is a
+        next one. The total is only needed up front to page back from the
+        end (``last`` without ``before``); otherwise ``count`` computes it
+        when selected.
+        """
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super().resolve_connection(connection, args, iterable, max_limit)
+
+        first = args.get("first")
+        last = args.get("last")
+        if max_limit is not None and first is None and last is None:
+            first = max_limit
+
+        # Convert offset to an after cursor, as DjangoConnectionField does
+        offset = args.pop("offset", None)
+        if args.get("pagination") == pagination.PaginationMode.KEYSET:
+            if offset:
+                raise GraphQLError("offset can't be used with KEYSET pagination.")
+            return cls.resolve_keyset_connection(
+                connection, iterable, first, last, args.get("after"), args.get("before")
+            )
+        if offset:
+            if args.get("after"):
+                offset += cursor_to_offset(args["after"]) + 1
+            args["after"] = offset_to_cursor(offset - 1)
+
+        length = None
+        lower = get_offset_with_default(args.get("after"), -1) + 1
+        start = lower
+        before = get_offset_with_default(args.get("before"), None)
+        end = before
+        if first is not None:
+            end = start + first if end is None else min(end, start + first)
+        if last is not None:
+            if end is None:
+                end = length = counts.count(iterable)
+            start = max(start, end - last)
+
+        if end is None:
+            rows = list(iterable[start:])
+            has_more = False
+        else:
+            end = max(end, start)
+            rows = list(iterable[start : end + 1])
+            has_more = len(rows) > end - start
+            rows = rows[: end - start]
+        if before is not None:
+            # The extra row only counts if it comes before before; past the
+            # end of the rows there is none to fetch
+            has_more = has_more and end < before
+
+        edges = [
+            connection.Edge(node=row, cursor=offset_to_cursor(start + i))
+            for i, row in enumerate(rows)
+        ]
+        connection = connection_adapter(
+            connection,
+            edges,
+            page_info_adapter(
+                edges[0].cursor if edges else None,
+                edges[-1].cursor if edges else None,
+                last is not None and start > lower,
+                first is not None and has_more,
+            ),
+        )
+        connection.iterable = iterable
+        connection.length = length
+        return connection
+
+    @classmethod
+    def resolve_keyset_connection(
+        cls, connection, iterable, first, last, after, before
+    ):
+        rows, cursors, has_previous_page, has_next_page = pagination.paginate(
+            iterable, first=first, last=last, after=after, before=before
+        )
+        edges = [
+            connection.Edge(node=row, cursor=cursor)
+            for row, cursor in zip(rows, cursors)
+        ]
+        connection = connection_adapter(
+            connection,
+            edges,
+            page_info_adapter(
+                cursors[0] if cursors else None,
+                cursors[-1] if cursors else None,
+                has_previous_page,
+                has_next_page,
+            ),
+        )
+        connection.iterable = iterable
+        connection.length = None
+        return connection
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        def refilter(args):
+            return super(ConnectionField, cls).resolve_queryset(
+                connection, iterable, info, args, filtering_args, filterset_class
+            )
+
+        get_refilters(info)[tuple(info.path.as_list())] = (refilter, args)
+
+        if set(args) <= optimizer.PAGINATION_ARGS and hasattr(iterable, "get_queryset"):
+            queryset = iterable.get_queryset()
+            if queryset._result_cache is not None:
+                return list(queryset)
+
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return optimizer.optimize(queryset, info)
+
+
+def connect_reverse_relations(*nodes):
+    """
+    Serve each node's reverse ForeignKey connections through ConnectionField.
+
+    graphene-django generates these as plain DjangoFilterConnectionFields,
+    which always re-query and so can't use a prefetch.
+    """
+    registry = get_global_registry()
+    for node in nodes:
+        for relation in node._meta.model._meta.related_objects:
+            name = relation.get_accessor_name()
+            related_node = registry.get_type_for_model(relation.related_model)
+            if relation.one_to_many and name in node._meta.fields and related_node:
+                node._meta.fields[name] = ConnectionField(
+                    related_node,
+                    required=True,
+                    description=get_django_field_description(relation.field),
+                )
+
+
+def add_aggregates(*nodes):
+    """
+    Give the connection of each node with numeric fields an ``aggregates`` field.
+
+    graphene-django creates a node's connection before setting its model, so
+    this runs once the nodes exist.
+    """
+    for node in nodes:
+        fields = aggregates.numeric_fields(node._meta.model)
+        if fields:
+            node._meta.connection._meta.fields["aggregates"] = aggregates_field(
+                node, fields
+            )
+
+
+class FacetCount(graphene.ObjectType):
+    node = graphene.Field(Node, required=True)
+    count = graphene.Int(required=True)
+
+
+class FacetRange(graphene.ObjectType):
+    min = graphene.Decimal(description="Inclusive; null for the first range.")
+    max = graphene.Decimal(description="Exclusive; null for the last range.")
+    count = graphene.Int(required=True)
+
+
+def facet_counts(root, info, name):
+    refilter, args = root
+    queryset = refilter(facets.without_filter(args, name))
+    value_counts = facets.value_counts(queryset, name)
+    model = queryset.model._meta.get_field(name).related_model
+    nodes = model._default_manager.in_bulk([pk for pk, count in value_counts])
+    get_loader(info).add_page(nodes.values())
+    return [
+        {"node": nodes[pk], "count": count} for pk, count in value_counts if pk in nodes
+    ]
+
+
+def facet_ranges(root, info, name, bounds):
+    refilter, args = root
+    queryset = refilter(facets.without_filter(args, name))
+    return [
+        {"min": lower, "max": upper, "count": count}
+        for lower, upper, count in facets.bucket_counts(queryset, name, bounds)
+    ]
+
+
+class ToolFacets(graphene.ObjectType):
+    brand = graphene.List(graphene.NonNull(FacetCount), required=True)
+    category = graphene.List(graphene.NonNull(FacetCount), required=True)
+    price = graphene.List(graphene.NonNull(FacetRange), required=True)
+
+    @sync_island
+    def resolve_brand(root, info, **kwargs):
+        return facet_counts(root, info, "brand")
+
+    @sync_island
+    def resolve_category(root, info, **kwargs):
+        return facet_counts(root, info, "category")
+
+    @sync_island
+    def resolve_price(root, info, **kwargs):
+        return facet_ranges(root, info, "price", facets.PRICE_BUCKETS)
+
+
+def resolve_facets(root, info, **kwargs):
+    # The connection this field is on
+    return get_refilters(info)[tuple(info.path.prev.as_list())]
+
 
 """
 Nodes
@@ -44,7 +624,7 @@ Nodes
 class BrandNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.Brand
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.BrandFilter
@@ -55,11 +635,13 @@ class BrandNode(AdvancedDjangoObjectType):
             "year_founded",
         )
 
+    resolve_uuid = related("uuid")
+
 
 class CategoryNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.Category
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.CategoryFilter
@@ -69,11 +651,13 @@ class CategoryNode(AdvancedDjangoObjectType):
             "description",
         )
 
+    resolve_uuid = related("uuid")
+
 
 class MetricNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.Metric
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.MetricFilter
@@ -85,11 +669,14 @@ class MetricNode(AdvancedDjangoObjectType):
             "weighting",
         )
 
+    resolve_category = related("category")
+    resolve_uuid = related("uuid")
+
 
 class ContentCreatorNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.ContentCreator
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.ContentCreatorFilter
@@ -99,22 +686,28 @@ class ContentCreatorNode(AdvancedDjangoObjectType):
             "link",
         )
 
+    resolve_uuid = related("uuid")
+
 
 class SourceNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.Source
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.SourceFilter
         orderset_class = orders.SourceOrder
         search_fields = ("link",)
 
+    resolve_category = related("category")
+    resolve_content_creator = related("content_creator")
+    resolve_uuid = related("uuid")
+
 
 class ToolNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.Tool
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.ToolFilter
@@ -129,67 +722,485 @@ class ToolNode(AdvancedDjangoObjectType):
             "category__name",
         )
 
+    resolve_brand = related("brand")
+    resolve_category = related("category")
+    resolve_uuid = related("uuid")
+
 
 class ToolMetricNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.ToolMetric
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.ToolMetricFilter
         orderset_class = orders.ToolMetricOrder
         search_fields = ("value",)
 
+    resolve_tool = related("tool")
+    resolve_metric = related("metric")
+    resolve_source = related("source")
+    resolve_uuid = related("uuid")
+
 
 class WeightedAverageNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.WeightedAverage
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.WeightedAverageFilter
         orderset_class = orders.WeightedAverageOrder
         search_fields = ("score",)
 
+    resolve_tool = related("tool")
+    resolve_source = related("source")
+    resolve_uuid = related("uuid")
+
 
 class UUIDModelNode(AdvancedDjangoObjectType):
     class Meta:
         model = models.UUIDModel
-        interfaces = (graphene.Node,)
+        interfaces = (Node,)
         connection_class = CountableConnection
         fields = "__all__"
         filterset_class = filters.UUIDModelFilter
         orderset_class = orders.UUIDModelOrder
 
+    resolve_brand = related("brand")
+    resolve_category = related("category")
+    resolve_metric = related("metric")
+    resolve_content_creator = related("content_creator")
+    resolve_source = related("source")
+    resolve_tool = related("tool")
+    resolve_tool_metric = related("tool_metric")
+    resolve_weighted_average = related("weighted_average")
+
+
+ToolNode._meta.connection._meta.fields["facets"] = graphene.Field(
+    ToolFacets,
+    required=True,
+    resolver=resolve_facets,
+    description=(
+        "Tool counts by brand, category and price range. Each facet applies "
+        "every filter of this connection but its own."
+    ),
+)
+
+connect_reverse_relations(
+    BrandNode,
+    CategoryNode,
+    MetricNode,
+    ContentCreatorNode,
+    SourceNode,
+    ToolNode,
+    ToolMetricNode,
+    WeightedAverageNode,
+    UUIDModelNode,
+)
+add_aggregates(
+    BrandNode,
+    CategoryNode,
+    MetricNode,
+    ContentCreatorNode,
+    SourceNode,
+    ToolNode,
+    ToolMetricNode,
+    WeightedAverageNode,
+    UUIDModelNode,
+)
+
+
+"""
+Comparison
+"""
+
+
+def pk_from_global_id(global_id, node):
+    try:
+        type_name, pk = from_global_id(global_id)
+        if type_name == node._meta.name:
+            return node._meta.model._meta.pk.to_python(pk)
+    except Exception:
+        pass
+    raise GraphQLError(f"{global_id!r} is not a {node._meta.name} ID.")
+
+
+class ComparisonRow(graphene.ObjectType):
+    metric = graphene.Field(MetricNode, required=True)
+    values = graphene.List(
+        graphene.Decimal,
+        required=True,
+        description=(
+            "The metric's value for each compared tool, in order; null where "
+            "the tool wasn't measured. Averaged over sources unless one is given."
+        ),
+    )
+
+
+class Comparison(graphene.ObjectType):
+    tools = graphene.List(
+        graphene.NonNull(ToolNode),
+        required=True,
+        description="The compared tools: the columns of every row.",
+    )
+    rows = graphene.List(graphene.NonNull(ComparisonRow), required=True)
+
+    @sync_island
+    def resolve_tools(root, info, **kwargs):
+        tools = models.Tool.objects.in_bulk(root["tool_ids"])
+        return [tools[pk] for pk in root["tool_ids"] if pk in tools]
+
+
+"""
+UUIDs
+"""
+
+MAX_UUIDS = 100
+
+
+"""
+Autocomplete
+"""
+
+MAX_SUGGESTIONS = 50
+
+
+class Suggestion(graphene.ObjectType):
+    id = graphene.ID(
+        required=True,
+        description="ID of the tool or brand suggested.",
+    )
+    text = graphene.String(required=True)
+    field = graphene.String(
+        required=True,
+        description='Where the text is from, such as "Tool.model_number".',
+    )
+    score = graphene.Float(required=True)
+
+
+def suggestions(prefix, limit):
+    registry = get_global_registry()
+    return [
+        {
+            "id": to_global_id(registry.get_type_for_model(model)._meta.name, pk),
+            "text": text,
+            "field": f"{model.__name__}.{field}",
+            "score": score,
+        }
+        for score, model, pk, field, text in autocomplete.suggest(prefix, limit)
+    ]
+
 
 class Query:
-    brand = graphene.Node.Field(BrandNode)
-    brands = AdvancedDjangoFilterConnectionField(BrandNode)
+    brand = Node.Field(BrandNode)
+    brands = ConnectionField(BrandNode)
     #
-    category = graphene.Node.Field(CategoryNode)
-    categories = AdvancedDjangoFilterConnectionField(CategoryNode)
+    category = Node.Field(CategoryNode)
+    categories = ConnectionField(CategoryNode)
     #
-    metric = graphene.Node.Field(MetricNode)
-    metrics = AdvancedDjangoFilterConnectionField(MetricNode)
+    metric = Node.Field(MetricNode)
+    metrics = ConnectionField(MetricNode)
     #
-    content_creator = graphene.Node.Field(ContentCreatorNode)
-    content_creators = AdvancedDjangoFilterConnectionField(ContentCreatorNode)
+    content_creator = Node.Field(ContentCreatorNode)
+    content_creators = ConnectionField(ContentCreatorNode)
     #
-    source = graphene.Node.Field(SourceNode)
-    sources = AdvancedDjangoFilterConnectionField(SourceNode)
+    source = Node.Field(SourceNode)
+    sources = ConnectionField(SourceNode)
     #
-    tool = graphene.Node.Field(ToolNode)
-    tools = AdvancedDjangoFilterConnectionField(ToolNode)
+    tool = Node.Field(ToolNode)
+    tools = ConnectionField(ToolNode)
     #
-    tool_metric = graphene.Node.Field(ToolMetricNode)
-    tool_metrics = AdvancedDjangoFilterConnectionField(ToolMetricNode)
+    tool_metric = Node.Field(ToolMetricNode)
+    tool_metrics = ConnectionField(ToolMetricNode)
     #
-    weighted_average = graphene.Node.Field(WeightedAverageNode)
-    weighted_averages = AdvancedDjangoFilterConnectionField(WeightedAverageNode)
+    weighted_average = Node.Field(WeightedAverageNode)
+    weighted_averages = ConnectionField(WeightedAverageNode)
     #
-    uuid_model = graphene.Node.Field(UUIDModelNode)
+    uuid_model = Node.Field(UUIDModelNode)
     # all_uuid_models = AdvancedDjangoFilterConnectionField(
-    uuid_models = AdvancedDjangoFilterConnectionField(
+    uuid_models = ConnectionField(
         UUIDModelNode,
         # filter_input_type_prefix="UUIDModelFilterSetClass",
     )
+    #
+    compare_tools = graphene.Field(
+        Comparison,
+        required=True,
+        tools=graphene.List(graphene.NonNull(graphene.ID), required=True),
+        source=graphene.ID(),
+        description="Metrics by tools matrix for comparing tools side by side.",
+    )
+    #
+    node_by_uuid = graphene.Field(
+        Node,
+        id=graphene.UUID(required=True),
+        description="The object with this UUID, found through its UUIDModel row.",
+    )
+    nodes_by_uuid = graphene.List(
+        Node,
+        required=True,
+        ids=graphene.List(graphene.NonNull(graphene.UUID), required=True),
+        description=(
+            "The objects with these UUIDs, in order; null where no object has "
+            "the UUID. One query per model the UUIDs belong to."
+        ),
+    )
+    #
+    autocomplete = graphene.List(
+        graphene.NonNull(Suggestion),
+        required=True,
+        prefix=graphene.String(required=True),
+        limit=graphene.Int(default_value=10),
+        description=(
+            "Tools and brands whose name or model number is like prefix, typos "
+            "included, from an in-memory index."
+        ),
+    )
+
+    @sync_island
+    def resolve_compare_tools(root, info, tools, source=None):
+        # Deduplicated, in the order asked for
+        tool_ids = list(dict.fromkeys(pk_from_global_id(id, ToolNode) for id in tools))
+        if len(tool_ids) > comparison.MAX_TOOLS:
+            raise GraphQLError(
+                f"At most {comparison.MAX_TOOLS} tools can be compared at once."
+            )
+        source_id = pk_from_global_id(source, SourceNode) if source else None
+
+        rows = comparison.rows(tool_ids, source_id)
+        # metric { category } loads for every row at once
+        get_loader(info).add_page(metric for metric, values in rows)
+        return {
+            "tool_ids": tool_ids,
+            "rows": [{"metric": metric, "values": values} for metric, values in rows],
+        }
+
+    @sync_island
+    def resolve_node_by_uuid(root, info, id):
+        return uuids.resolve(id)
+
+    @sync_island
+    def resolve_nodes_by_uuid(root, info, ids):
+        if len(ids) > MAX_UUIDS:
+            raise GraphQLError(f"At most {MAX_UUIDS} UUIDs can be resolved at once.")
+        objects = uuids.resolve_many(ids)
+        # Their ForeignKeys load for the whole batch
+        get_loader(info).add_page(objects.values())
+        return [objects.get(id) for id in ids]
+
+    def resolve_autocomplete(root, info, prefix, limit=10):
+        if not 0 < limit <= MAX_SUGGESTIONS:
+            raise GraphQLError(f"limit must be between 1 and {MAX_SUGGESTIONS}.")
+        if autocomplete.index.is_fresh():
+            return suggestions(prefix, limit)
+        # (Re)loading the index queries the database
+        return sync_island(suggestions)(prefix, limit)
+
+
+"""
+Upserts
+"""
+
+
+class FieldError(graphene.ObjectType):
+    field = graphene.String(
+        required=True,
+        description='The input field, or "__all__" for the row as a whole.',
+    )
+    messages = graphene.List(graphene.NonNull(graphene.String), required=True)
+
+
+class UpsertResult(graphene.ObjectType):
+    node = graphene.Field(Node, description="The object written, unless ok is false.")
+    created = graphene.Boolean(required=True)
+    errors = graphene.List(graphene.NonNull(FieldError), required=True)
+
+
+class ToolInput(graphene.InputObjectType):
+    id = graphene.ID(description="The tool to update, else the brand's model number.")
+    name = graphene.String()
+    model_number = graphene.String()
+    description = graphene.String()
+    weight = graphene.Decimal()
+    price = graphene.Decimal()
+    noise_level = graphene.Decimal()
+    brand = graphene.ID()
+    category = graphene.ID()
+
+
+class ToolMetricInput(graphene.InputObjectType):
+    tool = graphene.ID(required=True)
+    metric = graphene.ID(required=True)
+    source = graphene.ID(required=True)
+    value = graphene.Decimal(required=True)
+
+
+class MetricInput(graphene.InputObjectType):
+    id = graphene.ID(description="The metric to update, else the category's name.")
+    name = graphene.String()
+    description = graphene.String()
+    unit = graphene.String()
+    weighting = graphene.Decimal()
+    category = graphene.ID()
+
+
+def check_permission(info, model):
+    """Upserts add and change rows, as the admin does with those permissions."""
+    opts = model._meta
+    user = getattr(info.context, "user", None)
+    if user is None or not user.has_perms(
+        [
+            f"{opts.app_label}.add_{opts.model_name}",
+            f"{opts.app_label}.change_{opts.model_name}",
+        ]
+    ):
+        raise GraphQLError(
+            f"You don't have permission to change {opts.verbose_name_plural}."
+        )
+
+
+def rows_from_input(input, node, ids):
+    """
+    ``(rows, errors)`` of upsert rows for ``upserts``: the fields each input
+    gave, with global IDs turned into pks (ForeignKeys as ``<field>_id``).
+    ``ids`` maps the ForeignKey fields to their node.
+    """
+    rows = []
+    errors = []
+    for data in input:
+        row = {}
+        row_errors = {}
+        for field, value in data.items():
+            try:
+                if field == "id":
+                    row["id"] = pk_from_global_id(value, node)
+                elif field in ids:
+                    row[f"{field}_id"] = pk_from_global_id(value, ids[field])
+                else:
+                    row[field] = value
+            except GraphQLError as error:
+                row_errors[field] = [error.message]
+        rows.append(row)
+        errors.append(row_errors)
+    return rows, errors
+
+
+def upsert(info, model, node, ids, input, write):
+    check_permission(info, model)
+    if len(input) > upserts.MAX_ROWS:
+        raise GraphQLError(f"At most {upserts.MAX_ROWS} rows can be written at once.")
+    rows, errors = rows_from_input(input, node, ids)
+    if any(errors):
+        results = [(None, False, row_errors) for row_errors in errors]
+    else:
+        results = write(rows)
+    # Their ForeignKeys load for the whole batch
+    get_loader(info).add_page(instance for instance, _, _ in results if instance)
+    return {
+        "ok": all(not row_errors for _, _, row_errors in results),
+        "results": [
+            {
+                "node": instance,
+                "created": created,
+                "errors": [
+                    {
+                        "field": (
+                            field if field == NON_FIELD_ERRORS else to_camel_case(field)
+                        ),
+                        "messages": messages,
+                    }
+                    for field, messages in row_errors.items()
+                ],
+            }
+            for instance, created, row_errors in results
+        ],
+    }
+
+
+class UpsertPayload(graphene.ObjectType):
+    ok = graphene.Boolean(
+        required=True,
+        description="Whether the batch was written: one error and none of it is.",
+    )
+    results = graphene.List(
+        graphene.NonNull(UpsertResult),
+        required=True,
+        description="One result per input row, in order.",
+    )
+
+
+class UpsertTools(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(ToolInput), required=True)
+
+    Output = UpsertPayload
+
+    @sync_island
+    def mutate(root, info, input):
+        return upsert(
+            info,
+            models.Tool,
+            ToolNode,
+            {"brand": BrandNode, "category": CategoryNode},
+            input,
+            upserts.upsert_tools,
+        )
+
+
+class UpsertToolMetrics(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(ToolMetricInput), required=True)
+
+    Output = UpsertPayload
+
+    @sync_island
+    def mutate(root, info, input):
+        return upsert(
+            info,
+            models.ToolMetric,
+            ToolMetricNode,
+            {"tool": ToolNode, "metric": MetricNode, "source": SourceNode},
+            input,
+            upserts.upsert_tool_metrics,
+        )
+
+
+class UpsertMetrics(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(MetricInput), required=True)
+
+    Output = UpsertPayload
+
+    @sync_island
+    def mutate(root, info, input):
+        return upsert(
+            info,
+            models.Metric,
+            MetricNode,
+            {"category": CategoryNode},
+            input,
+            upserts.upsert_metrics,
+        )
+
+
+class Mutation:
+    upsert_tools = UpsertTools.Field(
+        description=(
+            "Create or update tools in one transaction. Nothing is written "
+            "unless every row is valid."
+        )
+    )
+    upsert_tool_metrics = UpsertToolMetrics.Field(
+        description=(
+            "Create or replace measurements by tool, metric and source, in one "
+            "transaction. Nothing is written unless every row is valid."
+        )
+    )
+    upsert_metrics = UpsertMetrics.Field(
+        description=(
+            "Create or update metrics in one transaction, keeping each "
+            "category's weightings at most 1.00. Nothing is written unless "
+            "every row is valid."
+        )
+    )
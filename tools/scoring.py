@@ -0,0 +1,298 @@
+"""
+WeightedAverage scoring.
+
+A tool's score for a source is the weighted mean of its metric values, each
+value normalised against the other tools measured by that source.
+A source is a single comparison test, so its tools are only ever scored
+against each other: a write to one ToolMetric can move the score of every
+tool in its source, and of nothing else. The source is therefore the unit
+of recomputation.
+
+Writes don't recompute straight away. They add their source to the
+transaction's ``Recompute``, a single ``on_commit`` callback recomputing
+every source marked in the transaction once it commits; a rollback
+discards it with its sources. Outside a transaction, ``batch()`` holds the
+sources back until its block exits.
+"""
+
+import decimal
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import generations
+from .models import Metric, ToolMetric, UUIDModel, WeightedAverage
+
+# Units where a smaller measurement is the better result.
+LOWER_IS_BETTER_UNITS = ("Seconds",)
+
+# "minmax" scales each metric onto the range of its source; "zscore" uses
+# standard deviations from the source's mean, clipped to +/- 3.
+NORMALIZATION = getattr(settings, "SCORE_NORMALIZATION", "minmax")
+
+SCORE_PLACES = decimal.Decimal("0.01")
+
+_state = threading.local()
+
+
+def _pending():
+    if not hasattr(_state, "pending"):
+        _state.pending = set()
+        _state.depth = 0
+    return _state.pending
+
+
+def load_measurements(queryset):
+    """
+    Run ``queryset`` straight into an (n x 4) float array of
+    ``source_id, tool_id, metric_id, value`` rows, without building a
+    Python object per row.
+    """
+    queryset = queryset.values_list("source_id", "tool_id", "metric_id", "value")
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return np.array(cursor.fetchall(), dtype=float).reshape(-1, 4)
+
+
+def normalize(values, group_starts, method=None):
+    """
+    Scale each column of ``values`` into 0..1 within each group of rows.
+
+    Groups are runs of rows starting at the offsets in ``group_starts``.
+    Missing values are NaN and stay NaN.
+    """
+    method = method or NORMALIZATION
+    measured = ~np.isnan(values)
+    counts = np.diff(np.append(group_starts, len(values)))
+
+    def per_group(ufunc, data):
+        # Reduce each group, then repeat the result back onto its rows.
+        reduced = ufunc.reduceat(data, group_starts, axis=0)
+        return np.repeat(reduced, counts, axis=0)
+
+    if method == "minmax":
+        # fmin/fmax skip NaN
+        lowest = per_group(np.fmin, values)
+        spread = per_group(np.fmax, values) - lowest
+        normalized = np.where(spread > 0, (values - lowest) / spread, 1.0)
+    elif method == "zscore":
+        sizes = per_group(np.add, measured.astype(float))
+        mean = per_group(np.add, np.where(measured, values, 0.0)) / sizes
+        deviation = np.where(measured, values - mean, 0.0)
+        std = np.sqrt(per_group(np.add, deviation**2) / sizes)
+        z = np.where(std > 0, deviation / std, 0.0)
+        normalized = np.clip(0.5 + z / 6, 0.0, 1.0)
+    else:
+        raise ValueError(f"Unknown normalization: {method}")
+
+    return np.where(measured, normalized, np.nan)
+
+
+def score_measurements(measurements, metrics, method=None):
+    """
+    Score every (tool, source) pair in ``measurements``.
+
+    ``measurements`` comes from ``load_measurements()`` and ``metrics`` maps
+    each metric id to its ``(weighting, unit)``. Returns an (m x 2) array of
+    ``source_id, tool_id`` pairs and an array of their scores (0..100).
+    A pair measured only on metrics weighted 0 has nothing to average and
+    is left out.
+    """
+    if not len(measurements):
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+
+    ids = measurements[:, :3].astype(np.int64)
+    # Pack (source_id, tool_id) into one sortable key; sorting by it keeps
+    # each source's pairs together as a run of rows.
+    stride = ids[:, 1].max() + 1
+    keys, rows = np.unique(ids[:, 0] * stride + ids[:, 1], return_inverse=True)
+    pairs = np.column_stack(np.divmod(keys, stride))
+    metric_ids, columns = np.unique(ids[:, 2], return_inverse=True)
+
+    values = np.full((len(pairs), len(metric_ids)), np.nan)
+    values[rows, columns] = measurements[:, 3]
+
+    weights = np.array([float(metrics[pk][0]) for pk in metric_ids])
+    lower_is_better = np.array(
+        [metrics[pk][1] in LOWER_IS_BETTER_UNITS for pk in metric_ids]
+    )
+
+    group_starts = np.flatnonzero(np.diff(pairs[:, 0], prepend=-1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = normalize(values, group_starts, method)
+        normalized = np.where(lower_is_better, 1 - normalized, normalized)
+
+        measured = ~np.isnan(normalized)
+        scores = 100 * (np.where(measured, normalized, 0.0) @ weights)
+        totals = measured @ weights
+        scores /= totals
+
+    scored = totals > 0
+    return pairs[scored], scores[scored]
+
+
+def to_score(value):
+    return decimal.Decimal(f"{value:.2f}").quantize(SCORE_PLACES)
+
+
+def load_metrics(metric_ids=None):
+    """Return ``{metric_id: (weighting, unit)}`` for ``score_measurements()``."""
+    queryset = Metric.objects.all()
+    if metric_ids is not None:
+        queryset = queryset.filter(pk__in=metric_ids)
+    return {
+        pk: (weighting, unit)
+        for pk, weighting, unit in queryset.values_list("pk", "weighting", "unit")
+    }
+
+
+@transaction.atomic
+def recompute_sources(source_ids):
+    """Rebuild the WeightedAverage rows of the given sources."""
+    source_ids = set(source_ids)
+    if not source_ids:
+        return
+
+    measurements = load_measurements(
+        ToolMetric.objects.filter(source_id__in=source_ids)
+    )
+    metrics = load_metrics(np.unique(measurements[:, 2]).astype(int).tolist())
+    pairs, scores = score_measurements(measurements, metrics)
+
+    existing = {
+        (average.source_id, average.tool_id): average
+        for average in WeightedAverage.objects.filter(source_id__in=source_ids)
+    }
+
+    added = []
+    changed = []
+    for (source_id, tool_id), value in zip(pairs.tolist(), scores.tolist()):
+        score = to_score(value)
+        average = existing.pop((source_id, tool_id), None)
+        if average is None:
+            added.append(
+                WeightedAverage(tool_id=tool_id, source_id=source_id, score=score)
+            )
+        elif average.score != score:
+            average.score = score
+            changed.append(average)
+
+    if added:
+        # With their UUIDs, in two INSERTs
+        WeightedAverage.objects.bulk_create(added)
+        generations.invalidate(WeightedAverage, UUIDModel)
+    if changed:
+        WeightedAverage.objects.bulk_update(changed, ["score"])
+        generations.invalidate(WeightedAverage)
+    # Whatever is left no longer has any weighted metrics behind it.
+    if existing:
+        WeightedAverage.objects.filter(
+            pk__in=[average.pk for average in existing.values()]
+        ).delete()
+
+
+class Recompute:
+    """The ``on_commit`` callback recomputing the sources of a transaction."""
+
+    def __init__(self, source_ids):
+        self.source_ids = set(source_ids)
+
+    def __call__(self):
+        recompute_sources(self.source_ids)
+
+
+def get_recompute(using=DEFAULT_DB_ALIAS):
+    """The current transaction's ``Recompute``, if it has one yet."""
+    for savepoint_ids, callback, *robust in connections[using].run_on_commit:
+        if isinstance(callback, Recompute):
+            return callback
+    return None
+
+
+def schedule(source_ids, using=DEFAULT_DB_ALIAS):
+    """Mark sources as needing a recompute once the current transaction commits."""
+    if getattr(_state, "depth", 0):
+        _pending().update(source_ids)
+        return
+    source_ids = set(source_ids)
+    if not source_ids:
+        return
+    recompute = get_recompute(using)
+    if recompute is not None:
+        recompute.source_ids |= source_ids
+    else:
+        # Outside a transaction, this runs it now
+        transaction.on_commit(Recompute(source_ids), using=using)
+
+
+@contextmanager
+def batch():
+    """
+    Hold back recomputes until the block exits.
+
+    Only needed for writes made outside a transaction, e.g.::
+
+        with scoring.batch():
+            for row in rows:
+                ToolMetric.objects.create(**row)
+    """
+    _pending()
+    _state.depth += 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if not _state.depth:
+            source_ids = set(_state.pending)
+            _state.pending.clear()
+            schedule(source_ids)
+
+
+"""
+Signals
+"""
+
+
+@receiver(pre_save, sender=ToolMetric)
+def schedule_moved_tool_metric(sender, instance, using, update_fields=None, **kwargs):
+    # Moving a measurement to another source changes the old source too.
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {"source", "source_id"} & update_fields:
+        return
+    loaded = getattr(instance, "_loaded_source_id", None)
+    if loaded is None:
+        # Built by hand, or loaded without its source: ask the database
+        schedule(
+            ToolMetric.objects.filter(pk=instance.pk)
+            .exclude(source_id=instance.source_id)
+            .values_list("source_id", flat=True),
+            using,
+        )
+    elif loaded != instance.source_id:
+        schedule([loaded], using)
+
+
+@receiver(post_save, sender=ToolMetric)
+@receiver(post_delete, sender=ToolMetric)
+def schedule_tool_metric(sender, instance, using, **kwargs):
+    schedule([instance.source_id], using)
+    instance._loaded_source_id = instance.source_id
+
+
+@receiver(post_save, sender=Metric)
+def schedule_metric(sender, instance, created, **kwargs):
+    # A new metric has no measurements yet; an edited one may have a new
+    # weighting or unit.
+    if not created:
+        schedule(
+            ToolMetric.objects.filter(metric=instance)
+            .values_list("source_id", flat=True)
+            .distinct()
+        )
@@ -0,0 +1,367 @@
+"""
+Search.
+
+django_graphene_filters matches each term of a node's ``search`` argument
+against every one of its ``search_fields`` with ``icontains``: a chain of
+``LIKE '%term%'`` scans, across joins for fields like ``brand__name``, and
+through numbers cast to text, that no index can serve. ``search()`` types
+the terms instead.
+
+Numeric terms (``12.5``, ``100-200``, ``<5``) become range predicates on
+the numeric search fields, and match the text search fields too: model
+numbers like ``2767-20`` are text.
+
+Text terms go to the text search fields. Models in ``INDEXED_FIELDS`` have
+an SQLite FTS5 table, ``<db_table>_fts``, holding the text of those fields
+with the model's pk as rowid. ``update_index()`` rewrites the rows of the
+instances given, and of the instances indexing their fields through a
+relation (a tool holds its brand's name). Saves and deletes call it
+through signals; bulk writes send none, so the code doing them calls it
+itself, as it calls ``generations.invalidate()``. (Triggers on the tables
+would go without it, but SQLite's table rebuilds on ALTER TABLE break
+them.) Terms match as prefixes through the index, and rows rank by bm25.
+Anything without a usable index (another database, an SQLite without FTS5,
+text search fields other than the indexed ones) falls back to ``LIKE``.
+"""
+
+import decimal
+import functools
+import math
+import re
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .aggregates import NUMERIC_FIELDS
+
+# The text search fields of each node, by model label. Their FTS5 tables
+# are created by migrations, so changing them takes a new one.
+INDEXED_FIELDS = {
+    "tools.Brand": ("name", "link"),
+    "tools.Category": ("name", "description"),
+    "tools.Metric": ("name", "description", "unit"),
+    "tools.ContentCreator": ("name", "link"),
+    "tools.Source": ("link",),
+    "tools.Tool": ("name", "model_number", "brand__name", "category__name"),
+}
+
+WORD = re.compile(r"\w")
+
+# As django_graphene_filters reads search fields: "^name" is istartswith
+LOOKUP_PREFIXES = {
+    "^": "istartswith",
+    "=": "iexact",
+    "@": "search",
+    "$": "iregex",
+}
+
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+RANGE = re.compile(rf"({NUMBER.pattern})(?:-|\.\.)({NUMBER.pattern})")
+COMPARISON = re.compile(rf"(<=|>=|<|>)({NUMBER.pattern})")
+COMPARISONS = {"<": "lt", "<=": "lte", ">": "gt", ">=": "gte"}
+
+# Matches no row, and starts an OR of conditions. (pk__in=[] would make
+# Django skip the whole query, so it wouldn't have any SQL to cache by.)
+NOTHING = Q(pk__isnull=True)
+
+
+def get_field(model, path):
+    """The field at the end of a ``__`` path."""
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def is_numeric(model, path):
+    return isinstance(get_field(model, path), NUMERIC_FIELDS)
+
+
+def quote(name):
+    return '"%s"' % name
+
+
+class Index:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.table = f"{model._meta.db_table}_fts"
+
+    def matching(self, expression):
+        """Subquery of the pks matching an FTS5 query ``expression``."""
+        return RawSQL(
+            f"SELECT rowid FROM {quote(self.table)} WHERE {quote(self.table)} MATCH %s",
+            (expression,),
+        )
+
+    def rank(self, expression):
+        """bm25 rank of each row for ``expression``: lower is better."""
+        table = quote(self.model._meta.db_table)
+        pk = quote(self.model._meta.pk.column)
+        return RawSQL(
+            f"SELECT rank FROM {quote(self.table)} "
+            f"WHERE {quote(self.table)} MATCH %s AND rowid = {table}.{pk}",
+            (expression,),
+            output_field=FloatField(),
+        )
+
+    def update(self, pks=None, using=DEFAULT_DB_ALIAS):
+        """Rewrite the rows of ``pks`` from the model's table, or all rows."""
+        table = quote(self.table)
+        queryset = self.model._default_manager.using(using).values_list(
+            "pk", *self.fields
+        )
+        if pks is None:
+            delete, params = f"DELETE FROM {table}", []
+        else:
+            pks = list(pks)
+            if not pks:
+                return
+            queryset = queryset.filter(pk__in=pks)
+            placeholders = ", ".join(["%s"] * len(pks))
+            delete, params = f"DELETE FROM {table} WHERE rowid IN ({placeholders})", pks
+        sql, select_params = queryset.order_by().query.sql_with_params()
+        columns = ", ".join(quote(field) for field in self.fields)
+        with connections[using].cursor() as cursor:
+            cursor.execute(delete, params)
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {columns}) {sql}", select_params
+            )
+
+
+_available = {}
+
+
+def is_available(index, using=DEFAULT_DB_ALIAS):
+    key = (using, index.table)
+    if key not in _available:
+        connection = connections[using]
+        _available[key] = connection.vendor == "sqlite" and (
+            index.table in connection.introspection.table_names()
+        )
+    return _available[key]
+
+
+def get_index(model, text_fields, using=DEFAULT_DB_ALIAS):
+    """The index serving ``text_fields`` of ``model``, if there is a usable one."""
+    fields = INDEXED_FIELDS.get(model._meta.label)
+    if fields is None:
+        return None
+    if any(lookup != "icontains" for path, lookup in text_fields):
+        return None
+    if {path for path, lookup in text_fields} != set(fields):
+        return None
+    index = Index(model, fields)
+    return index if is_available(index, using) else None
+
+
+def dependents(model):
+    """``(model, relation)`` of each index holding fields of ``model``'s rows."""
+    for label, fields in INDEXED_FIELDS.items():
+        dependent = apps.get_model(label)
+        for path in fields:
+            relation, _, name = path.rpartition(LOOKUP_SEP)
+            if relation and get_field(dependent, path).model is model:
+                yield dependent, relation
+                break
+
+
+def update_index(model, pks=None, using=DEFAULT_DB_ALIAS):
+    """
+    Bring the indexes up to date with the rows of ``model`` whose pks are
+    ``pks`` (all of them if None), deleted ones included.
+    """
+    fields = INDEXED_FIELDS.get(model._meta.label)
+    if fields is not None:
+        index = Index(model, fields)
+        if is_available(index, using):
+            index.update(pks, using)
+    for dependent, relation in dependents(model):
+        index = Index(dependent, INDEXED_FIELDS[dependent._meta.label])
+        if not is_available(index, using):
+            continue
+        if pks is None:
+            index.update(None, using)
+        else:
+            index.update(
+                dependent._default_manager.using(using)
+                .filter(**{f"{relation}__in": list(pks)})
+                .values_list("pk", flat=True),
+                using,
+            )
+
+
+def rebuild_indexes(using=DEFAULT_DB_ALIAS):
+    """Rewrite every index from its table."""
+    for label in INDEXED_FIELDS:
+        index = Index(apps.get_model(label), INDEXED_FIELDS[label])
+        if is_available(index, using):
+            index.update(None, using)
+
+
+def phrase(term):
+    """An FTS5 prefix query for ``term``, or None if it has no words to match."""
+    if not WORD.search(term):
+        return None
+    return '"%s"*' % term.replace('"', '""')
+
+
+def split_prefix(search_field):
+    """``(path, lookup)`` of a search field, which may start with a lookup prefix."""
+    if search_field[:1] in LOOKUP_PREFIXES:
+        return search_field[1:], LOOKUP_PREFIXES[search_field[0]]
+    return search_field, "icontains"
+
+
+def parse_number(term):
+    """
+    ``{lookup: Decimal}`` for a numeric term: ``12.5`` (exact), ``100-200``
+    or ``100..200`` (inclusive range), ``<5``, ``<=5``, ``>5`` or ``>=5``.
+    None if ``term`` isn't one.
+    """
+    if match := NUMBER.fullmatch(term):
+        return {"exact": decimal.Decimal(match[0])}
+    if match := RANGE.fullmatch(term):
+        low, high = sorted(decimal.Decimal(bound) for bound in match.groups())
+        return {"gte": low, "lte": high}
+    if match := COMPARISON.fullmatch(term):
+        return {COMPARISONS[match[1]]: decimal.Decimal(match[2])}
+    return None
+
+
+def integer_lookup(lookup, value):
+    """``(lookup, value)`` for an integer column, or None if nothing can match."""
+    if value == value.to_integral_value():
+        return lookup, int(value)
+    if lookup == "exact":
+        return None
+    if lookup in ("gt", "gte"):
+        return "gte", math.ceil(value)
+    return "lte", math.floor(value)
+
+
+def number_condition(model, numeric_fields, lookups):
+    """Rows where one of ``numeric_fields`` satisfies every lookup."""
+    condition = NOTHING
+    for path in numeric_fields:
+        field_lookups = {}
+        for lookup, value in lookups.items():
+            if isinstance(get_field(model, path), models.IntegerField):
+                integer = integer_lookup(lookup, value)
+                if integer is None:
+                    break
+                lookup, value = integer
+            field_lookups[f"{path}__{lookup}"] = value
+        else:
+            condition |= Q(**field_lookups)
+    return condition
+
+
+def text_condition(term, text_fields):
+    condition = NOTHING
+    for path, lookup in text_fields:
+        condition |= Q(**{f"{path}__{lookup}": term})
+    return condition
+
+
+def search(queryset, search_fields, query):
+    """
+    Filter ``queryset`` to the rows where every term of ``query`` matches
+    one of ``search_fields``.
+
+    Every term matches text fields: through the model's index when it has
+    one, ranking the rows by bm25, otherwise with ``LIKE``. Numbers, ranges
+    and comparisons (see ``parse_number()``) also match numeric fields with
+    range predicates, ranked after the rows whose text matched.
+    """
+    model = queryset.model
+    numeric_fields = []
+    text_fields = []
+    for search_field in search_fields:
+        path, lookup = split_prefix(search_field)
+        if is_numeric(model, path):
+            numeric_fields.append(path)
+        else:
+            text_fields.append((path, lookup))
+    index = get_index(model, text_fields, queryset.db)
+
+    conditions = Q()
+    phrases = []
+    # The text conditions of the terms that matched numeric fields too
+    text_matches = NOTHING
+    for term in query.split():
+        lookups = parse_number(term)
+        condition = NOTHING
+        if lookups is not None and numeric_fields:
+            condition = number_condition(model, numeric_fields, lookups)
+        # The index doesn't see the operator of a comparison
+        expression = None
+        if index is not None and not COMPARISON.fullmatch(term):
+            expression = phrase(term)
+        if expression is not None:
+            phrases.append(expression)
+            condition |= Q(pk__in=index.matching(expression))
+        else:
+            # Punctuation or no index: only LIKE can find it
+            text = text_condition(term, text_fields)
+            condition |= text
+            if lookups is not None and numeric_fields:
+                text_matches |= text
+        conditions &= condition
+
+    queryset = queryset.filter(conditions)
+    if phrases:
+        # Rows matching more terms rank higher; rows no term matched in the
+        # index (only in numeric fields) rank last
+        rank = Coalesce(
+            index.rank(" OR ".join(phrases)), Value(0.0), output_field=FloatField()
+        )
+    elif text_matches != NOTHING:
+        rank = Case(
+            When(text_matches, then=Value(-1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    else:
+        return queryset
+    return queryset.annotate(search_rank=rank).order_by("search_rank", "pk")
+
+
+"""
+Signals
+"""
+
+
+@functools.cache
+def watched_fields(model):
+    """
+    Names of the fields of ``model`` some index holds, directly or through
+    a relation, as ``save(update_fields=...)`` may name them.
+    """
+    names = set()
+    for label, fields in INDEXED_FIELDS.items():
+        indexed = apps.get_model(label)
+        for path in fields:
+            if indexed is model:
+                field = model._meta.get_field(path.split(LOOKUP_SEP)[0])
+            elif get_field(indexed, path).model is model:
+                field = get_field(indexed, path)
+            else:
+                continue
+            names.update((field.name, field.attname))
+    return frozenset(names)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_saved_index(sender, instance, using, update_fields=None, **kwargs):
+    fields = watched_fields(sender)
+    if not fields or (update_fields is not None and not fields & update_fields):
+        return
+    update_index(sender, [instance.pk], using)
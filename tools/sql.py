@@ -0,0 +1,49 @@
+"""
+Observe the SQL a block of code runs, on any thread.
+
+``connection.execute_wrapper()`` only sees queries on the calling thread's
+connection, but asynchronous GraphQL execution runs the ORM in worker
+threads through ``sync_to_async``. That copies context variables, so
+``observe()`` keeps its wrappers in one, and a single wrapper installed on
+every connection applies them.
+"""
+
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_wrappers = ContextVar("sql_wrappers", default=())
+
+
+def dispatch(execute, sql, params, many, context):
+    wrappers = _wrappers.get()
+    # Compose them as Django composes execute_wrappers: first is outermost
+    for wrapper in reversed(wrappers):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install(sender=None, connection=connection, **kwargs):
+    if dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch)
+
+
+@contextmanager
+def observe(wrapper):
+    """
+    Call ``wrapper`` as an execute wrapper for every query run in this context.
+
+    That includes queries run by ``sync_to_async`` functions called from it.
+    """
+    # This thread's connection may have opened before the receiver was
+    install(connection=connection)
+    token = _wrappers.set(_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
@@ -1,3 +1,1672 @@
-from django.test import TestCase
+import decimal
+import hashlib
+import io
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from graphql import GraphQLError, parse
+from graphql_relay import offset_to_cursor, to_global_id
+from graphql_relay.utils import base64
+
+from compare import cost, views
+from compare.schema import schema
+from compare.views import GraphQLView
+
+from . import autocomplete, counts, scoring, sql, upserts
+from . import schema as tool_schema
+from . import search as search_module
+from .management.commands.advise_indexes import candidate, unbounded_columns
+from .models import (
+    Brand,
+    Category,
+    ContentCreator,
+    Metric,
+    Source,
+    Tool,
+    ToolMetric,
+    UUIDModel,
+    WeightedAverage,
+)
+from .pagination import order_by, paginate
+
+
+class Fixture:
+    """
+    Three brands with one tool in each of two categories, every tool
+    measured on both metrics of its category (weighted 0.40 each) by the
+    category's source.
+    """
+
+    @classmethod
+    def create_fixture(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "-")
+        cls.brands = [
+            Brand.objects.create(name=name, link="https://example.com", year_founded=1)
+            for name in ("DeWalt", "Makita", "Ryobi")
+        ]
+        creator = ContentCreator.objects.create(
+            name="ProjectFarm", link="https://example.com"
+        )
+        cls.categories = []
+        cls.metrics = {}
+        cls.sources = {}
+        for name in ("Drill", "Saw"):
+            category = Category.objects.create(name=name, description=name)
+            cls.categories.append(category)
+            cls.metrics[category] = [
+                Metric.objects.create(
+                    name=f"{name} {unit}",
+                    description=unit,
+                    unit=unit,
+                    weighting=decimal.Decimal("0.40"),
+                    category=category,
+                )
+                for unit in ("RPM", "Seconds")
+            ]
+            cls.sources[category] = Source.objects.create(
+                link=f"https://example.com/{name}",
+                category=category,
+                content_creator=creator,
+            )
+        cls.tools = []
+        for i, brand in enumerate(cls.brands):
+            for category in cls.categories:
+                tool = Tool.objects.create(
+                    name=f"{brand.name} {category.name}",
+                    model_number=f"{brand.name[0]}{category.name[0]}{i}",
+                    description=category.name,
+                    price=decimal.Decimal(100 * (i + 1)),
+                    brand=brand,
+                    category=category,
+                )
+                cls.tools.append(tool)
+                for j, metric in enumerate(cls.metrics[category]):
+                    ToolMetric.objects.create(
+                        tool=tool,
+                        metric=metric,
+                        source=cls.sources[category],
+                        value=decimal.Decimal(10 * (i + 1) + j),
+                    )
+
+    def setUp(self):
+        cache.clear()
+
+    def execute(self, query, variables=None, user=None):
+        result = schema.execute(
+            query,
+            variable_values=variables,
+            context_value=SimpleNamespace(user=user or AnonymousUser()),
+        )
+        self.assertIsNone(result.errors)
+        return result.data
+
+    @contextmanager
+    def assertQueries(self, expected):
+        """assertNumQueries, counting the queries of every thread."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with sql.observe(record):
+            yield
+        self.assertEqual(len(queries), expected, queries)
+
+
+class SchemaTestCase(Fixture, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+        # The fixture never commits, so its scoring.Recompute would collect
+        # the sources of every test's writes too, instead of a test's own
+        connection.run_on_commit = [
+            entry
+            for entry in connection.run_on_commit
+            if not isinstance(entry[1], scoring.Recompute)
+        ]
+
+
+class AsyncSchemaTestCase(Fixture, TransactionTestCase):
+    """
+    For requests to the async GraphQL view. Its queries read in worker
+    threads, with connections of their own that can't see what a TestCase
+    hasn't committed, so the fixture is committed for each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.create_fixture()
+
+
+class AggregateTests(SchemaTestCase):
+    def test_grouped_through_to_many_filter(self):
+        # Every tool matches through both of its measurements
+        data = self.execute("""{
+                tools(filter: {toolMetrics: {value: {gte: "0"}}}) {
+                    aggregates(field: PRICE, groupBy: BRAND) {
+                        group { ... on BrandNode { name } }
+                        count
+                        avg
+                        stdDev
+                    }
+                }
+            }""")
+        rows = data["tools"]["aggregates"]
+        self.assertEqual(
+            [(row["group"]["name"], row["count"], row["avg"]) for row in rows],
+            [("DeWalt", 2, 100.0), ("Makita", 2, 200.0), ("Ryobi", 2, 300.0)],
+        )
+        self.assertEqual({row["stdDev"] for row in rows}, {0.0})
+
+    def test_ungrouped_through_to_many_filter(self):
+        data = self.execute("""{
+                tools(filter: {toolMetrics: {value: {gte: "0"}}}) {
+                    aggregates(field: PRICE) { count avg }
+                }
+            }""")
+        self.assertEqual(data["tools"]["aggregates"], [{"count": 6, "avg": 200.0}])
+
+
+class ExportTests(SchemaTestCase):
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_csv(self):
+        lines = self.export("/export/tool-metrics.csv?tool__brand__name=DeWalt")
+        self.assertEqual(lines[0].split(",")[:3], ["id", "tool_id", "tool__name"])
+        self.assertEqual(len(lines), 1 + 4)
+
+    def test_through_to_many_filter(self):
+        # Every tool has two measurements, both of which match
+        lines = self.export("/export/tool-metrics.csv?tool__tool_metrics__value__gte=0")
+        ids = [line.split(",")[0] for line in lines[1:]]
+        self.assertEqual(len(ids), ToolMetric.objects.count())
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_invalid_filter(self):
+        response = self.client.get("/export/tool-metrics.csv?value__gte=x")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("errors", response.json())
+
+
+class KeysetPaginationTests(SchemaTestCase):
+    query = """
+        query ($after: String, $before: String, $first: Int, $last: Int) {
+            tools(
+                pagination: KEYSET
+                orderBy: [{price: DESC}]
+                after: $after
+                before: $before
+                first: $first
+                last: $last
+            ) {
+                edges { cursor node { modelNumber } }
+                pageInfo { hasNextPage hasPreviousPage }
+            }
+        }
+    """
+
+    def page(self, **variables):
+        return self.execute(self.query, variables)["tools"]
+
+    def test_round_trip(self):
+        expected = list(
+            Tool.objects.order_by("-price", "pk").values_list("model_number", flat=True)
+        )
+        seen = []
+        after = None
+        while True:
+            page = self.page(first=4, after=after)
+            seen += [edge["node"]["modelNumber"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["edges"][-1]["cursor"]
+        self.assertEqual(seen, expected)
+
+        # And back from the last cursor followed, the fourth row's
+        page = self.page(last=2, before=after)
+        self.assertEqual(
+            [edge["node"]["modelNumber"] for edge in page["edges"]], expected[1:3]
+        )
+        self.assertTrue(page["pageInfo"]["hasPreviousPage"])
+
+    def test_null_values(self):
+        # Only the tools' UUIDs have a tool
+        self.assertTrue(UUIDModel.objects.filter(tool__isnull=True).exists())
+        for fields in (["tool"], ["-tool"]):
+            queryset = UUIDModel.objects.order_by(*fields)
+            expected = [
+                uuid.pk for uuid in queryset.order_by(*order_by(fields + ["pk"]))
+            ]
+            seen = []
+            after = None
+            while True:
+                rows, cursors, _, has_next_page = paginate(
+                    queryset, first=5, after=after
+                )
+                seen += [row.pk for row in rows]
+                if not has_next_page:
+                    break
+                after = cursors[-1]
+            self.assertEqual(seen, expected)
+
+    def test_invalid_cursors(self):
+        other = self.execute(
+            "{ tools(pagination: KEYSET, first: 1) { edges { cursor } } }"
+        )["tools"]["edges"][0]["cursor"]
+        for cursor in (
+            "garbage",
+            offset_to_cursor(2),
+            base64("keyset:[1, "),
+            base64('keyset:{"price": 1}'),
+            base64('keyset:["x", 1]'),
+            # Ordered by pk alone
+            other,
+        ):
+            with self.subTest(cursor=cursor):
+                result = schema.execute(
+                    self.query,
+                    variable_values={"after": cursor, "first": 2},
+                    context_value=SimpleNamespace(user=AnonymousUser()),
+                )
+                self.assertEqual(
+                    [error.message for error in result.errors], ["Invalid cursor"]
+                )
+
+    def test_offset(self):
+        result = schema.execute(
+            "{ tools(pagination: KEYSET, offset: 2) { edges { cursor } } }",
+            context_value=SimpleNamespace(user=AnonymousUser()),
+        )
+        self.assertIn("offset", result.errors[0].message)
+
+
+class OffsetPaginationTests(SchemaTestCase):
+    query = """
+        query ($after: String, $before: String, $first: Int) {
+            tools(after: $after, before: $before, first: $first) {
+                edges { cursor }
+                pageInfo { hasNextPage }
+            }
+        }
+    """
+
+    def page_info(self, **variables):
+        return self.execute(self.query, variables)["tools"]["pageInfo"]
+
+    def test_has_next_page_before(self):
+        # Six tools, at offsets 0 to 5
+        for before, first, has_next_page in (
+            (5, 2, True),
+            (3, 3, False),
+            (3, 5, False),
+            (50, 5, False),
+            (50, 10, False),
+        ):
+            with self.subTest(before=before, first=first):
+                self.assertEqual(
+                    self.page_info(
+                        after=offset_to_cursor(0),
+                        before=offset_to_cursor(before),
+                        first=first,
+                    ),
+                    {"hasNextPage": has_next_page},
+                )
+
+
+class RelatedLoaderTests(SchemaTestCase):
+    query = """
+        query ($ids: [UUID!]!) {
+            nodesByUuid(ids: $ids) {
+                ... on ToolMetricNode {
+                    tool { brand { name } }
+                    metric { category { name } }
+                }
+            }
+        }
+    """
+
+    def test_one_query_per_level(self):
+        tool_metrics = ToolMetric.objects.select_related("uuid")
+        for tool_metrics in (tool_metrics[:2], tool_metrics):
+            ids = [str(tool_metric.uuid.pk) for tool_metric in tool_metrics]
+            # The UUIDs and the tool metrics, then tool, brand, metric and
+            # category whatever the number of tool metrics
+            with self.assertNumQueries(2 + 4):
+                data = self.execute(self.query, {"ids": ids})
+            self.assertEqual(
+                [node["tool"]["brand"]["name"] for node in data["nodesByUuid"]],
+                [tool_metric.tool.brand.name for tool_metric in tool_metrics],
+            )
+
+
+class OptimizerTests(SchemaTestCase):
+    def test_select_related(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute("""{
+                    toolMetrics {
+                        edges { node {
+                            tool { name brand { name } }
+                            metric { name category { name } }
+                        } }
+                    }
+                }""")
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(data["toolMetrics"]["edges"]), 12)
+        self.assertEqual(
+            {
+                edge["node"]["metric"]["category"]["name"]
+                for edge in data["toolMetrics"]["edges"]
+            },
+            {"Drill", "Saw"},
+        )
+
+    def test_only_selected_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.execute("{ tools { edges { node { name } } } }")
+        self.assertNotIn('"description"', queries[0]["sql"])
+        with CaptureQueriesContext(connection) as queries:
+            self.execute("{ tools { edges { node { name description } } } }")
+        self.assertIn('"tools_tool"."description"', queries[0]["sql"])
+
+    def test_prefetched_reverse_connections(self):
+        query = """
+            query ($first: Int) {
+                brands { edges { node {
+                    name
+                    tools(first: $first) { edges { node { name } } }
+                } } }
+            }
+        """
+        # The brands, and one query for the tools of all of them
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+        self.assertEqual(
+            [
+                [edge["node"]["name"] for edge in brand["node"]["tools"]["edges"]]
+                for brand in data["brands"]["edges"]
+            ],
+            [
+                ["DeWalt Drill", "DeWalt Saw"],
+                ["Makita Drill", "Makita Saw"],
+                ["Ryobi Drill", "Ryobi Saw"],
+            ],
+        )
+        with self.assertNumQueries(2):
+            data = self.execute(query, {"first": 1})
+        self.assertEqual(
+            [len(brand["node"]["tools"]["edges"]) for brand in data["brands"]["edges"]],
+            [1, 1, 1],
+        )
+
+    def test_filtered_reverse_connections(self):
+        # Filtering re-queries each brand's tools, so they aren't prefetched
+        with self.assertNumQueries(1 + 3):
+            self.execute("""{
+                    brands { edges { node {
+                        tools(name: "DeWalt Drill") { edges { node { name } } }
+                    } } }
+                }""")
+
+
+class UpsertTests(SchemaTestCase):
+    def test_metric_with_measurements_keeps_its_category(self):
+        drill, saw = self.categories
+        metric = self.metrics[drill][0]
+        [(instance, created, errors)] = upserts.upsert_metrics(
+            [{"id": metric.pk, "category_id": saw.pk}]
+        )
+        self.assertEqual(
+            errors["category"], ["A metric with measurements can't change category."]
+        )
+        metric.refresh_from_db()
+        self.assertEqual(metric.category, drill)
+
+    def test_tool_with_measurements_keeps_its_category(self):
+        drill, saw = self.categories
+        tool = self.tools[0]
+        [(instance, created, errors)] = upserts.upsert_tools(
+            [{"id": tool.pk, "category_id": saw.pk}]
+        )
+        self.assertEqual(
+            errors["category"], ["A tool with measurements can't change category."]
+        )
+        tool.refresh_from_db()
+        self.assertEqual(tool.category, drill)
+
+        # Without them it can
+        tool.tool_metrics.all().delete()
+        [(instance, created, errors)] = upserts.upsert_tools(
+            [{"id": tool.pk, "category_id": saw.pk}]
+        )
+        self.assertEqual(errors, {})
+        tool.refresh_from_db()
+        self.assertEqual(tool.category, saw)
+
+    def test_move_metric(self):
+        drill, saw = self.categories
+        metric = Metric.objects.create(
+            name="Torque", description="Nm", unit="Nm", category=drill
+        )
+        with mock.patch("tools.scoring.schedule") as schedule:
+            [(instance, created, errors)] = upserts.upsert_metrics(
+                [{"id": metric.pk, "category_id": saw.pk}]
+            )
+        self.assertEqual(errors, {})
+        metric.refresh_from_db()
+        self.assertEqual(metric.category, saw)
+        scheduled = {pk for call in schedule.call_args_list for pk in call.args[0]}
+        self.assertEqual(scheduled, {self.sources[drill].pk, self.sources[saw].pk})
+
+    def upsert_tools(self, input, user=None):
+        result = schema.execute(
+            """
+            mutation ($input: [ToolInput!]!) {
+                upsertTools(input: $input) {
+                    ok
+                    results {
+                        created
+                        errors { field messages }
+                        node { ... on ToolNode { modelNumber price } }
+                    }
+                }
+            }
+            """,
+            variable_values={"input": input},
+            context_value=SimpleNamespace(user=user or self.user),
+        )
+        return result.errors or result.data["upsertTools"]
+
+    def test_upsert_tools(self):
+        tool = self.tools[0]
+        brand = to_global_id("BrandNode", self.brands[0].pk)
+        category = to_global_id("CategoryNode", self.categories[0].pk)
+        payload = self.upsert_tools(
+            [
+                {"id": to_global_id("ToolNode", tool.pk), "price": "150.00"},
+                # The brand's model number finds the tool
+                {"brand": brand, "modelNumber": "DS0", "price": "250.00"},
+                {
+                    "brand": brand,
+                    "category": category,
+                    "name": "DeWalt Grinder",
+                    "modelNumber": "DG0",
+                    "description": "Grinder",
+                    "price": "99.00",
+                },
+            ]
+        )
+        self.assertTrue(payload["ok"])
+        self.assertEqual(
+            [(row["created"], row["node"]) for row in payload["results"]],
+            [
+                (False, {"modelNumber": tool.model_number, "price": "150.00"}),
+                (False, {"modelNumber": "DS0", "price": "250.00"}),
+                (True, {"modelNumber": "DG0", "price": "99.00"}),
+            ],
+        )
+        tool.refresh_from_db()
+        self.assertEqual(tool.price, decimal.Decimal("150.00"))
+        self.assertTrue(UUIDModel.objects.filter(tool__model_number="DG0").exists())
+
+    def test_invalid_row_writes_nothing(self):
+        tools = Tool.objects.count()
+        payload = self.upsert_tools(
+            [
+                {"id": to_global_id("ToolNode", self.tools[0].pk), "price": "1.00"},
+                {
+                    "brand": to_global_id("BrandNode", self.brands[0].pk),
+                    "name": "Nameless",
+                    "modelNumber": "X1",
+                    "description": "X",
+                },
+                # The same tool again
+                {"id": to_global_id("ToolNode", self.tools[0].pk), "price": "2.00"},
+            ]
+        )
+        self.assertFalse(payload["ok"])
+        self.assertEqual(
+            [row["errors"] for row in payload["results"]],
+            [
+                [],
+                [{"field": "category", "messages": ["This field is required."]}],
+                [{"field": "__all__", "messages": ["Same object as row 0."]}],
+            ],
+        )
+        self.assertIsNone(payload["results"][0]["node"])
+        self.assertEqual(Tool.objects.count(), tools)
+        self.tools[0].refresh_from_db()
+        self.assertEqual(self.tools[0].price, decimal.Decimal("100.00"))
+
+    def test_write_error_rolls_back(self):
+        tools = Tool.objects.count()
+        with mock.patch.object(
+            type(Tool.objects), "bulk_update", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                upserts.upsert_tools(
+                    [
+                        {"id": self.tools[0].pk, "price": decimal.Decimal("1.00")},
+                        {
+                            "brand_id": self.brands[0].pk,
+                            "category_id": self.categories[0].pk,
+                            "name": "New",
+                            "model_number": "N1",
+                            "description": "New",
+                        },
+                    ]
+                )
+        self.assertEqual(Tool.objects.count(), tools)
+
+    def test_permission(self):
+        [error] = self.upsert_tools(
+            [{"id": to_global_id("ToolNode", self.tools[0].pk), "price": "1.00"}],
+            user=AnonymousUser(),
+        )
+        self.assertEqual(error.message, "You don't have permission to change Tools.")
+
+    def test_weighting_totals(self):
+        drill, saw = self.categories
+        first, second = self.metrics[drill]
+        # Raising one weighting while lowering another: 0.60 + 0.20 + 0.20
+        results = upserts.upsert_metrics(
+            [
+                {"id": first.pk, "weighting": decimal.Decimal("0.60")},
+                {"id": second.pk, "weighting": decimal.Decimal("0.20")},
+                {
+                    "category_id": drill.pk,
+                    "name": "Torque",
+                    "description": "Torque",
+                    "unit": "Nm",
+                    "weighting": decimal.Decimal("0.20"),
+                },
+            ]
+        )
+        self.assertEqual([errors for _, _, errors in results], [{}, {}, {}])
+
+        results = upserts.upsert_metrics(
+            [
+                {"id": second.pk, "weighting": decimal.Decimal("0.25")},
+                {"id": self.metrics[saw][0].pk, "weighting": decimal.Decimal("0.60")},
+            ]
+        )
+        self.assertEqual(
+            [errors for _, _, errors in results],
+            [
+                {
+                    "weighting": [
+                        "Total weighting of the category would be 1.05; "
+                        "it cannot exceed 1.00."
+                    ]
+                },
+                {},
+            ],
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.weighting, decimal.Decimal("0.20"))
+        self.assertEqual(
+            Metric.objects.get(pk=self.metrics[saw][0].pk).weighting,
+            decimal.Decimal("0.40"),
+        )
+
+    def test_tool_metrics_of_another_category(self):
+        drill, saw = self.categories
+        [(_, _, errors)] = upserts.upsert_tool_metrics(
+            [
+                {
+                    "tool_id": self.tools[0].pk,
+                    "metric_id": self.metrics[saw][0].pk,
+                    "source_id": self.sources[drill].pk,
+                    "value": decimal.Decimal("1.00"),
+                }
+            ]
+        )
+        self.assertEqual(errors, {"metric": ["Not of the tool's category."]})
+
+    def test_tool_metrics_rescore(self):
+        drill, saw = self.categories
+        tool = self.tools[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = upserts.upsert_tool_metrics(
+                [
+                    {
+                        "tool_id": tool.pk,
+                        "metric_id": metric.pk,
+                        "source_id": self.sources[drill].pk,
+                        "value": decimal.Decimal("1000.00"),
+                    }
+                    for metric in self.metrics[drill]
+                ]
+            )
+        self.assertEqual([created for _, created, _ in results], [False, False])
+        scores = WeightedAverage.objects.filter(source=self.sources[drill])
+        # Best on RPM, worst on Seconds
+        self.assertEqual(
+            scores.get(tool=tool).score,
+            decimal.Decimal("50.00"),
+        )
+        self.assertEqual(scores.count(), 3)
+
+
+class ImportToolMetricsTests(SchemaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        drill = cls.categories[0]
+        # Named as DeWalt's other drill, so only its model number finds it
+        cls.unmeasured = Tool.objects.create(
+            name="DeWalt Drill",
+            model_number="DD9",
+            description="Drill",
+            brand=cls.brands[0],
+            category=drill,
+        )
+
+    def import_file(self, text, suffix):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix) as file:
+            file.write(text)
+            file.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with mock.patch.object(
+                scoring, "recompute_sources", wraps=scoring.recompute_sources
+            ) as recompute:
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command(
+                        "import_tool_metrics", file.name, stdout=stdout, stderr=stderr
+                    )
+        return stdout.getvalue(), stderr.getvalue(), recompute
+
+    def value(self, model_number, metric):
+        return ToolMetric.objects.get(
+            tool__model_number=model_number, metric__name=metric
+        ).value
+
+    def test_csv(self):
+        before = ToolMetric.objects.count()
+        stdout, stderr, recompute = self.import_file(
+            "brand,tool,metric,source,value\n"
+            # Updates, by model number and by a differently spaced name
+            "DeWalt,DS0,Saw RPM,https://example.com/Saw,50\n"
+            "makita , Makita  Drill,drill rpm,https://example.com/Drill,60\n"
+            # A new measurement, of the tool only its model number finds
+            "DeWalt,DD9,Drill RPM,https://example.com/Drill,70\n"
+            # Repeated: the last one wins
+            "DeWalt,DD9,Drill RPM,https://example.com/Drill,71\n"
+            "DeWalt,DeWalt Drill,Drill RPM,https://example.com/Drill,1\n"
+            "Stanley,DD0,Drill RPM,https://example.com/Drill,1\n"
+            "DeWalt,DD0,Saw RPM,https://example.com/Drill,1\n"
+            "DeWalt,DD0,Drill RPM,https://example.com/Nowhere,1\n"
+            "DeWalt,DD0,Drill RPM,https://example.com/Drill,many\n"
+            "DeWalt,DD0,Drill RPM,https://example.com/Drill,\n",
+            ".csv",
+        )
+        # The repeated row counts once
+        self.assertIn("Imported 3 values, skipped 6 rows", stdout)
+        self.assertEqual(
+            stderr.splitlines(),
+            [
+                "Line 6: more than one DeWalt tool 'DeWalt Drill'",
+                "Line 7: no Stanley tool 'DD0'",
+                "Line 8: no metric 'Saw RPM' in the tool's category",
+                "Line 9: no source 'https://example.com/Nowhere'",
+                "Line 10: 'many' isn't a value",
+                "Line 11: no value",
+            ],
+        )
+        self.assertEqual(self.value("DS0", "Saw RPM"), 50)
+        self.assertEqual(self.value("MD1", "Drill RPM"), 60)
+        self.assertEqual(self.value("DD9", "Drill RPM"), 71)
+        # Only DD9's measurement is new, and it has a UUID
+        self.assertEqual(ToolMetric.objects.count(), before + 1)
+        self.assertFalse(ToolMetric.objects.filter(uuid__isnull=True).exists())
+        # Both sources rescored, once
+        recompute.assert_called_once_with(
+            {self.sources[category].pk for category in self.categories}
+        )
+        self.assertTrue(WeightedAverage.objects.filter(tool=self.unmeasured).exists())
+
+    def test_jsonl(self):
+        rows = [
+            {
+                "brand": "Ryobi",
+                "tool": "RD2",
+                "metric": "Drill Seconds",
+                "source": "https://example.com/Drill",
+                "value": 4.5,
+            },
+            {"brand": "Ryobi", "tool": "RD2"},
+            [],
+        ]
+        stdout, stderr, recompute = self.import_file(
+            "\n".join(json.dumps(row) for row in rows) + "\n{\n\n", ".jsonl"
+        )
+        self.assertIn("Imported 1 values, skipped 3 rows", stdout)
+        self.assertEqual(
+            [line.split(":")[0] for line in stderr.splitlines()],
+            ["Line 2", "Line 3", "Line 4"],
+        )
+        self.assertEqual(self.value("RD2", "Drill Seconds"), decimal.Decimal("4.50"))
+        recompute.assert_called_once_with({self.sources[self.categories[0]].pk})
+
+
+class RowCountTests(SchemaTestCase):
+    def approximate_count(self, model):
+        return counts.approximate_count(model.objects.all())
+
+    def test_follows_writes(self):
+        self.assertEqual(self.approximate_count(Tool), 6)
+        self.assertEqual(self.approximate_count(ToolMetric), 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            tool = Tool.objects.create(
+                name="Impact Driver",
+                model_number="DI0",
+                description="Impact Driver",
+                brand=self.brands[0],
+                category=self.categories[0],
+            )
+            Tool.objects.filter(model_number="RS2").delete()
+        # Without counting again
+        with self.assertNumQueries(0):
+            self.assertEqual(self.approximate_count(Tool), 6)
+            self.assertEqual(self.approximate_count(ToolMetric), 10)
+
+        # Bulk creates
+        with self.captureOnCommitCallbacks(execute=True):
+            upserts.upsert_tools(
+                [
+                    {
+                        "name": name,
+                        "model_number": name,
+                        "description": name,
+                        "brand_id": self.brands[1].pk,
+                        "category_id": self.categories[1].pk,
+                    }
+                    for name in ("A", "B")
+                ]
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.approximate_count(Tool), 8)
+
+        # An upsert can't tell how many rows it added, so it's counted again
+        self.assertEqual(self.approximate_count(ToolMetric), 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            upserts.upsert_tool_metrics(
+                [
+                    {
+                        "tool_id": tool.pk,
+                        "metric_id": self.metrics[self.categories[0]][0].pk,
+                        "source_id": self.sources[self.categories[0]].pk,
+                        "value": decimal.Decimal(1),
+                    }
+                ]
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.approximate_count(ToolMetric), 11)
+
+    def test_rolled_back_writes(self):
+        self.assertEqual(self.approximate_count(Brand), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Brand.objects.create(name="Stanley", link="-", year_founded=1)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(self.approximate_count(Brand), 3)
+
+    def test_filtered(self):
+        self.assertEqual(
+            counts.approximate_count(Tool.objects.filter(price__gte=200)), 4
+        )
+
+
+class UUIDQuerySetTests(SchemaTestCase):
+    def assertOneUUIDEach(self, model):
+        self.assertFalse(model.objects.filter(uuid__isnull=True).exists())
+        # The UUIDModel fields are one-to-one, so no row has two either
+        self.assertEqual(
+            UUIDModel.objects.filter(
+                **{f"{model._meta.model_name}__isnull": False}
+            ).count(),
+            model.objects.count(),
+        )
+
+    def test_bulk_create(self):
+        brands = Brand.objects.bulk_create(
+            [Brand(name="Stanley", link="-", year_founded=1)]
+        )
+        self.assertEqual(brands[0].uuid.content_object, brands[0])
+        self.assertOneUUIDEach(Brand)
+
+    def test_update_conflicts(self):
+        uuid = self.brands[0].uuid.pk
+        Brand.objects.bulk_create(
+            [
+                Brand(pk=self.brands[0].pk, name="Dewalt", link="-", year_founded=1),
+                Brand(name="Stanley", link="-", year_founded=1),
+            ],
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["name"],
+        )
+        self.assertEqual(Brand.objects.get(uuid=uuid).name, "Dewalt")
+        self.assertOneUUIDEach(Brand)
+
+    def test_ignore_conflicts(self):
+        Brand.objects.bulk_create(
+            [
+                Brand(pk=self.brands[0].pk, name="Dewalt", link="-", year_founded=1),
+                Brand(name="Stanley", link="-", year_founded=1),
+            ],
+            ignore_conflicts=True,
+        )
+        self.assertEqual(Brand.objects.get(pk=self.brands[0].pk).name, "DeWalt")
+        self.assertTrue(Brand.objects.filter(name="Stanley").exists())
+        self.assertOneUUIDEach(Brand)
+
+    def test_add_missing_uuids(self):
+        UUIDModel.objects.filter(tool__in=self.tools[:2]).delete()
+        self.assertEqual(len(Tool.objects.add_missing_uuids()), 2)
+        self.assertEqual(Tool.objects.add_missing_uuids(), [])
+        self.assertOneUUIDEach(Tool)
+        self.assertEqual(
+            Tool.objects.get(pk=self.tools[0].pk).uuid.content_object, self.tools[0]
+        )
+
+
+class ResponseCacheTests(AsyncSchemaTestCase):
+    query = "{ tools(orderBy: [{price: DESC}], first: 1) { edges { node { price } } } }"
+
+    def post(self, query, variables=None):
+        response = self.client.post(
+            "/graphql/",
+            {"query": query, "variables": variables or {}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def price(self):
+        data = self.post(self.query)["data"]
+        return data["tools"]["edges"][0]["node"]["price"]
+
+    def test_write_invalidates(self):
+        self.assertEqual(self.price(), "300.00")
+        # Served from the cache
+        with self.assertQueries(0):
+            self.assertEqual(self.price(), "300.00")
+
+        self.client.force_login(self.user)
+        payload = self.post(
+            """
+            mutation ($input: [ToolInput!]!) {
+                upsertTools(input: $input) { ok }
+            }
+            """,
+            {
+                "input": [
+                    {
+                        "id": to_global_id("ToolNode", self.tools[0].pk),
+                        "price": "999.00",
+                    }
+                ]
+            },
+        )
+        self.assertEqual(payload, {"data": {"upsertTools": {"ok": True}}})
+        self.assertEqual(self.price(), "999.00")
+
+
+class AsyncViewTests(AsyncSchemaTestCase):
+    async def test_nested_query(self):
+        query = """{
+            tools(orderBy: [{price: DESC}], first: 3) {
+                count
+                edges { node { modelNumber brand { name } category { name } } }
+            }
+        }"""
+        threads = set()
+
+        def record(*args, **kwargs):
+            threads.add(threading.current_thread())
+
+        with mock.patch.object(tool_schema, "close_old_connections", record):
+            response = await self.async_client.post(
+                "/graphql/", {"query": query}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        tools = response.json()["data"]["tools"]
+        self.assertEqual(tools["count"], 6)
+        self.assertEqual(
+            [
+                (
+                    edge["node"]["modelNumber"],
+                    edge["node"]["brand"]["name"],
+                    edge["node"]["category"]["name"],
+                )
+                for edge in tools["edges"]
+            ],
+            [
+                ("RD2", "Ryobi", "Drill"),
+                ("RS2", "Ryobi", "Saw"),
+                ("MD1", "Makita", "Drill"),
+            ],
+        )
+        # The reads ran in the executor's threads: not on the event loop,
+        # nor on the one thread of thread-sensitive calls
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+class CsrfTests(AsyncSchemaTestCase):
+    mutation = """
+        mutation ($input: [ToolInput!]!) { upsertTools(input: $input) { ok } }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def post(self, query, variables=None, **headers):
+        return self.client.post(
+            "/graphql/",
+            {"query": query, "variables": variables or {}},
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_mutations_need_the_token(self):
+        variables = {
+            "input": [
+                {"id": to_global_id("ToolNode", self.tools[0].pk), "price": "1.00"}
+            ]
+        }
+        response = self.post(self.mutation, variables)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("CSRF", response.json()["errors"][0]["message"])
+        self.assertEqual(Tool.objects.get(pk=self.tools[0].pk).price, 100)
+
+        # The view sets the cookie
+        self.client.get("/graphql/", headers={"Accept": "text/html"})
+        token = self.client.cookies["csrftoken"].value
+        response = self.post(self.mutation, variables, X_CSRFToken=token)
+        self.assertEqual(response.json(), {"data": {"upsertTools": {"ok": True}}})
+        self.assertEqual(Tool.objects.get(pk=self.tools[0].pk).price, 1)
+
+    def test_queries_dont(self):
+        response = self.post("{ tools(first: 1) { edges { node { name } } } }")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("errors", response.json())
+
+
+class CompareToolsTests(SchemaTestCase):
+    query = """
+        query ($tools: [ID!]!, $source: ID) {
+            compareTools(tools: $tools, source: $source) {
+                tools { name }
+                rows { metric { name } values }
+            }
+        }
+    """
+
+    def compare(self, tools, source=None):
+        data = self.execute(
+            self.query,
+            {
+                "tools": [to_global_id("ToolNode", tool.pk) for tool in tools],
+                "source": source and to_global_id("SourceNode", source.pk),
+            },
+        )["compareTools"]
+        return [tool["name"] for tool in data["tools"]], [
+            (row["metric"]["name"], row["values"]) for row in data["rows"]
+        ]
+
+    def test_matrix(self):
+        drill, saw, other_drill = self.tools[0], self.tools[1], self.tools[2]
+        # The matrix, and the tools
+        with self.assertNumQueries(2):
+            tools, rows = self.compare([saw, drill, other_drill, drill])
+        # Deduplicated, in the order asked for
+        self.assertEqual(tools, ["DeWalt Saw", "DeWalt Drill", "Makita Drill"])
+        # By category, then name; null where a tool wasn't measured
+        self.assertEqual(
+            rows,
+            [
+                ("Drill RPM", [None, "10.00", "20.00"]),
+                ("Drill Seconds", [None, "11.00", "21.00"]),
+                ("Saw RPM", ["10.00", None, None]),
+                ("Saw Seconds", ["11.00", None, None]),
+            ],
+        )
+
+    def test_source(self):
+        drill = self.categories[0]
+        tool = self.tools[0]
+        source = Source.objects.create(
+            link="https://example.com/other",
+            category=drill,
+            content_creator=ContentCreator.objects.get(),
+        )
+        ToolMetric.objects.create(
+            tool=tool,
+            metric=self.metrics[drill][0],
+            source=source,
+            value=decimal.Decimal(13),
+        )
+        # Averaged over both sources without one
+        self.assertEqual(
+            self.compare([tool])[1],
+            [("Drill RPM", ["11.50"]), ("Drill Seconds", ["11.00"])],
+        )
+        self.assertEqual(self.compare([tool], source)[1], [("Drill RPM", ["13.00"])])
+        self.assertEqual(
+            self.compare([tool], self.sources[drill])[1],
+            [("Drill RPM", ["10.00"]), ("Drill Seconds", ["11.00"])],
+        )
+
+
+class AutocompleteTests(SchemaTestCase):
+    def setUp(self):
+        super().setUp()
+        # An index of this test's data, loaded on first use
+        patcher = mock.patch.object(autocomplete, "index", autocomplete.Index())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def suggest(self, prefix, limit=10):
+        data = self.execute(
+            "query ($prefix: String!, $limit: Int) {"
+            " autocomplete(prefix: $prefix, limit: $limit) { text field score } }",
+            {"prefix": prefix, "limit": limit},
+        )
+        return [
+            (suggestion["text"], suggestion["field"], round(suggestion["score"], 2))
+            for suggestion in data["autocomplete"]
+        ]
+
+    def test_typos(self):
+        # 5 of the 7 trigrams of "makitta"; the shortest first
+        self.assertEqual(
+            self.suggest("Makitta"),
+            [
+                ("Makita", "Brand.name", 0.71),
+                ("Makita Saw", "Tool.name", 0.71),
+                ("Makita Drill", "Tool.name", 0.71),
+            ],
+        )
+        self.assertEqual(self.suggest("ryöbi", limit=1), [("Ryobi", "Brand.name", 2.0)])
+
+    def test_prefixes(self):
+        # The last word is still being typed: "dr" may be "Drill"
+        self.assertEqual(
+            self.suggest("makita dr"),
+            [
+                ("Makita Drill", "Tool.name", 2.0),
+                ("Makita", "Brand.name", 0.78),
+                ("Makita Saw", "Tool.name", 0.78),
+            ],
+        )
+        self.assertEqual(
+            self.suggest("ms", limit=1), [("MS1", "Tool.model_number", 2.0)]
+        )
+
+
+class ScoringTests(SchemaTestCase):
+    def test_zero_weightings(self):
+        drill, saw = self.categories
+        source = self.sources[drill]
+        scoring.recompute_sources([source.pk])
+        self.assertEqual(WeightedAverage.objects.filter(source=source).count(), 3)
+
+        # Metric.clean() doesn't allow it, but nothing else stops it
+        Metric.objects.filter(category=drill).update(weighting=0)
+        scoring.recompute_sources([source.pk])
+        self.assertFalse(WeightedAverage.objects.filter(source=source).exists())
+
+    def test_zero_weightings_rebuild(self):
+        drill, saw = self.categories
+        call_command("recompute_scores", stdout=io.StringIO())
+        self.assertEqual(WeightedAverage.objects.count(), 6)
+
+        Metric.objects.filter(category=drill).update(weighting=0)
+        call_command("recompute_scores", stdout=io.StringIO())
+        self.assertEqual(
+            set(WeightedAverage.objects.values_list("source", flat=True)),
+            {self.sources[saw].pk},
+        )
+
+    def test_rebuild_category_by_source(self):
+        drill, saw = self.categories
+        source = self.sources[saw]
+        # A measurement in a source of another category than its metric's
+        ToolMetric.objects.create(
+            tool=self.tools[0],
+            metric=self.metrics[drill][0],
+            source=source,
+            value=decimal.Decimal("5.00"),
+        )
+        call_command("recompute_scores", f"--category={saw.pk}", stdout=io.StringIO())
+        rebuilt = set(
+            WeightedAverage.objects.filter(source=source).values_list("tool", "score")
+        )
+        WeightedAverage.objects.all().delete()
+        scoring.recompute_sources([source.pk])
+        self.assertEqual(
+            set(
+                WeightedAverage.objects.filter(source=source).values_list(
+                    "tool", "score"
+                )
+            ),
+            rebuilt,
+        )
+        self.assertEqual(len(rebuilt), 4)
+
+
+class ScheduleTests(SchemaTestCase):
+    def recomputes(self, callbacks):
+        return [
+            callback.source_ids
+            for callback in callbacks
+            if isinstance(callback, scoring.Recompute)
+        ]
+
+    def test_one_recompute_per_transaction(self):
+        tool_metrics = list(ToolMetric.objects.all())
+        with self.captureOnCommitCallbacks() as callbacks:
+            for tool_metric in tool_metrics:
+                tool_metric.value += 1
+                tool_metric.save()
+        self.assertEqual(
+            self.recomputes(callbacks), [set(self.sources[c].pk for c in self.sources)]
+        )
+
+    def test_save_without_select(self):
+        drill, saw = self.categories
+        tool_metric = ToolMetric.objects.filter(source=self.sources[drill]).first()
+        tool_metric.value += 1
+        # Only the UPDATE
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(1):
+                tool_metric.save()
+            # Moving it rescores the source it left
+            tool_metric.source = self.sources[saw]
+            with self.assertNumQueries(1):
+                tool_metric.save()
+        self.assertEqual(
+            self.recomputes(callbacks), [{self.sources[drill].pk, self.sources[saw].pk}]
+        )
+
+    def test_rolled_back_writes(self):
+        drill, saw = self.categories
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    ToolMetric.objects.filter(source=self.sources[drill]).first().save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            self.assertIsNone(scoring.get_recompute())
+            ToolMetric.objects.filter(source=self.sources[saw]).first().save()
+        self.assertEqual(self.recomputes(callbacks), [{self.sources[saw].pk}])
+
+
+class CostTests(TestCase):
+    def check(self, query, variables=None):
+        document = parse(query)
+        [operation] = document.definitions
+        cost.check(schema.graphql_schema, document, operation, variables)
+
+    def assertRejected(self, query, code, variables=None):
+        with self.assertRaises(GraphQLError) as context:
+            self.check(query, variables)
+        self.assertEqual(context.exception.extensions["code"], code)
+        return context.exception
+
+    def test_depth(self):
+        fields = ["tools(first: 1)", "edges", "node"] + ["brand", "uuid"] * 6
+        query = "id"
+        for field in reversed(fields):
+            query = f"{field} {{ {query} }}"
+        # The operation's level and one per field: 16
+        self.assertRejected(f"{{ {query} }}", "QUERY_TOO_DEEP")
+        # Without the last uuid: 15
+        self.check(f"{{ {query.replace('uuid { id }', 'id')} }}")
+
+    # The filter input types end their cycles at the limit of 4, so the
+    # schema can't express more joins than that
+    @mock.patch.object(cost, "MAX_JOINS", 3)
+    def test_joins(self):
+        query = """
+            query ($filter: ToolNodeToolFilterFilterInputType) {
+                tools(filter: $filter) { edges { node { name } } }
+            }
+        """
+        three = {"toolMetrics": {"tool": {"toolMetrics": {"value": {"gte": "0"}}}}}
+        self.check(query, {"filter": three})
+        # Combinators don't join
+        self.check(query, {"filter": {"and": [three], "not": three}})
+        self.assertRejected(
+            query,
+            "QUERY_TOO_MANY_JOINS",
+            {
+                "filter": {
+                    "toolMetrics": {
+                        "tool": {"toolMetrics": {"tool": {"name": {"exact": "x"}}}}
+                    }
+                }
+            },
+        )
+
+    def test_cost(self):
+        query = """
+            query ($first: Int) {
+                tools(first: $first) { edges { node {
+                    toolMetrics(first: 100) { edges { node {
+                        tool { name }
+                        metric { name }
+                    } } }
+                } } }
+            }
+        """
+        # A tool costs 3 (tools, edges, node) plus 100 tool metrics of 5
+        # (toolMetrics, edges, node, tool, metric)
+        self.check(query, {"first": 99})
+        error = self.assertRejected(query, "QUERY_TOO_EXPENSIVE", {"first": 100})
+        self.assertEqual(error.extensions["cost"], 100 * (3 + 100 * 5))
+
+
+class AdviseIndexesTests(TestCase):
+    def advise(self, *lines):
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as log:
+            log.write("\n".join(lines))
+            log.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command(
+                "advise_indexes", f"--log={log.name}", stdout=stdout, stderr=stderr
+            )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_unreadable_lines(self):
+        stdout, stderr = self.advise(
+            json.dumps(
+                {
+                    "sql": 'SELECT * FROM "tools_tool" WHERE "tools_tool"."price" >= %s',
+                    "params": [1],
+                }
+            ),
+            '{"sql": "SELECT 1", ',
+            '{"params": [1]}',
+            "(0.001) SELECT 1; args=(datetime.date(2020, 1, 1),); alias=default",
+        )
+        self.assertIn("Explaining 1 queries", stdout)
+        self.assertIn("Skipped 3 unreadable lines.", stderr)
+
+    def test_no_text_indexes(self):
+        sql = (
+            'SELECT * FROM "tools_tool" WHERE "tools_tool"."name" = %s '
+            'AND "tools_tool"."brand_id" = %s ORDER BY "tools_tool"."price" ASC'
+        )
+        unbounded = unbounded_columns(Tool)
+        self.assertEqual(unbounded, {"name", "model_number", "description"})
+        self.assertEqual(
+            candidate(sql, "tools_tool", "id", unbounded), ("brand_id", "price")
+        )
+        self.assertEqual(
+            candidate(
+                'SELECT * FROM "tools_tool" WHERE "tools_tool"."name" = %s',
+                "tools_tool",
+                "id",
+                unbounded,
+            ),
+            (),
+        )
+        # Reported instead
+        stdout, _ = self.advise(
+            'SELECT * FROM "tools_tool" WHERE "tools_tool"."description" = \'Drill\''
+        )
+        self.assertIn("tools.Tool.description  # 1 queries", stdout)
+        self.assertIn("No indexes to suggest.", stdout)
+
+
+class SearchTests(SchemaTestCase):
+    def search(self, text):
+        data = self.execute(
+            "query ($text: String) {"
+            " tools(search: $text) { edges { node { modelNumber } } } }",
+            {"text": text},
+        )
+        return sorted(edge["node"]["modelNumber"] for edge in data["tools"]["edges"])
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.search("mak"), ["MD1", "MS1"])
+        self.assertEqual(self.search("stan"), [])
+        # A renamed brand is renamed in its tools' rows too
+        brand = self.brands[2]
+        brand.name = "Stanley"
+        brand.save()
+        self.assertEqual(self.search("stan"), ["RD2", "RS2"])
+        Tool.objects.get(model_number="RD2").delete()
+        self.assertEqual(self.search("stan"), ["RS2"])
+
+    def test_index_follows_bulk_writes(self):
+        results = upserts.upsert_tools(
+            [
+                {"id": self.tools[0].pk, "name": "Hammer"},
+                {
+                    "name": "Hammer",
+                    "model_number": "HX9",
+                    "description": "Hammer",
+                    "brand_id": self.brands[1].pk,
+                    "category_id": self.categories[0].pk,
+                },
+            ]
+        )
+        self.assertEqual([errors for _, _, errors in results], [{}, {}])
+        # Only measured tools are listed, so ask the index directly
+        tools = search_module.search(
+            Tool.objects.all(), search_module.INDEXED_FIELDS["tools.Tool"], "hammer"
+        )
+        self.assertEqual(
+            sorted(tools.values_list("model_number", flat=True)), ["DD0", "HX9"]
+        )
+
+
+class NumericSearchTests(SchemaTestCase):
+    # As ToolNode's, less weight: 0 for every tool here
+    fields = ("name", "model_number", "price", "brand__name", "category__name")
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Tool.objects.create(
+            name="Impact Driver",
+            model_number="2767-20",
+            description="Impact Driver",
+            price=decimal.Decimal(150),
+            brand=cls.brands[1],
+            category=cls.categories[0],
+        )
+
+    def search(self, text, model=Tool, fields=None, field="model_number"):
+        queryset = search_module.search(
+            model.objects.all(), fields or self.fields, text
+        )
+        return list(queryset.values_list(field, flat=True))
+
+    def test_model_number(self):
+        # Its model number first, then every tool priced 20 to 2767
+        found = self.search("2767-20")
+        self.assertEqual(found[0], "2767-20")
+        self.assertEqual(sorted(found[1:]), ["DD0", "DS0", "MD1", "MS1", "RD2", "RS2"])
+        # And without the index, matching with LIKE
+        found = self.search("2767-20", fields=("model_number", "price"))
+        self.assertEqual(found[0], "2767-20")
+        self.assertEqual(len(found), 7)
+
+    def test_exact_numbers(self):
+        self.assertEqual(sorted(self.search("200")), ["MD1", "MS1"])
+        self.assertEqual(self.search("2767"), ["2767-20"])
+        self.assertEqual(self.search("250"), [])
+
+    def test_ranges(self):
+        self.assertEqual(sorted(self.search("150-200")), ["2767-20", "MD1", "MS1"])
+        self.assertEqual(sorted(self.search("200..150")), ["2767-20", "MD1", "MS1"])
+
+    def test_comparisons(self):
+        self.assertEqual(sorted(self.search("<150")), ["DD0", "DS0"])
+        self.assertEqual(sorted(self.search(">=300")), ["RD2", "RS2"])
+        # Alongside a text term
+        self.assertEqual(self.search("ryobi <=300 drill"), ["RD2"])
+
+    def test_integer_columns(self):
+        fields = ("name", "link", "year_founded")
+        Brand.objects.filter(name="Ryobi").update(year_founded=1990)
+
+        def search(text):
+            return sorted(self.search(text, Brand, fields, "name"))
+
+        self.assertEqual(search("1990"), ["Ryobi"])
+        # No integer is 1990.5
+        self.assertEqual(search("1990.5"), [])
+        self.assertEqual(search("1989.5-1990.5"), ["Ryobi"])
+        self.assertEqual(search(">1.5"), ["Ryobi"])
+        self.assertEqual(search("<=1.5"), ["DeWalt", "Makita"])
+
+
+class UUIDTests(SchemaTestCase):
+    query = """
+        query ($ids: [UUID!]!) {
+            nodesByUuid(ids: $ids) {
+                ... on BrandNode { name }
+                ... on ToolNode { name }
+            }
+        }
+    """
+
+    def test_node_by_uuid(self):
+        query = (
+            "query ($id: UUID!) { nodeByUuid(id: $id) { ... on ToolNode { name } } }"
+        )
+        tool = self.tools[0]
+        id = str(tool.uuid.pk)
+        # The UUID, then the tool
+        with self.assertNumQueries(2):
+            data = self.execute(query, {"id": id})
+        self.assertEqual(data["nodeByUuid"], {"name": tool.name})
+        data = self.execute(query, {"id": "00000000-0000-0000-0000-000000000000"})
+        self.assertIsNone(data["nodeByUuid"])
+
+    def test_nodes_by_uuid(self):
+        ids = [
+            str(self.tools[1].uuid.pk),
+            "00000000-0000-0000-0000-000000000000",
+            str(self.brands[2].uuid.pk),
+            str(self.tools[0].uuid.pk),
+        ]
+        # The UUIDs, then one query per model
+        with self.assertNumQueries(1 + 2):
+            data = self.execute(self.query, {"ids": ids})
+        self.assertEqual(
+            data["nodesByUuid"],
+            [{"name": "DeWalt Saw"}, None, {"name": "Ryobi"}, {"name": "DeWalt Drill"}],
+        )
+
+
+class UUIDMigrationTests(TransactionTestCase):
+    before = [("tools", "0002_search_index")]
+    after = [("tools", "0003_uuidmodel_content_object")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_fills_in_content_objects(self):
+        apps = self.migrate(self.before)
+        Brand = apps.get_model("tools", "Brand")
+        Category = apps.get_model("tools", "Category")
+        UUIDModel = apps.get_model("tools", "UUIDModel")
+        brand = Brand.objects.create(name="DeWalt", link="-", year_founded=1)
+        category = Category.objects.create(name="Drill", description="Drill")
+        brand_uuid = UUIDModel.objects.create(brand=brand).pk
+        category_uuid = UUIDModel.objects.create(category=category).pk
+        UUIDModel.objects.create()
+
+        apps = self.migrate(self.after)
+        ContentType = apps.get_model("contenttypes", "ContentType")
+        UUIDModel = apps.get_model("tools", "UUIDModel")
+        self.assertEqual(
+            sorted(
+                UUIDModel.objects.values_list("pk", "content_type__model", "object_id")
+            ),
+            sorted(
+                [
+                    (brand_uuid, "brand", brand.pk),
+                    (category_uuid, "category", category.pk),
+                ]
+            ),
+        )
+        self.assertTrue(
+            ContentType.objects.filter(app_label="tools", model="brand").exists()
+        )
+
+
+class SearchSchemaChangeTests(TransactionTestCase):
+    def test_alter_indexed_tables(self):
+        brand = Brand.objects.create(
+            name="DeWalt", link="https://example.com", year_founded=1
+        )
+        category = Category.objects.create(name="Drill", description="Drill")
+        tool = Tool.objects.create(
+            name="Drill",
+            model_number="DCD1",
+            description="Drill",
+            price=decimal.Decimal(100),
+            brand=brand,
+            category=category,
+        )
+        # SQLite copies each table into a new one to alter a column
+        with connection.schema_editor() as editor:
+            for model, name in ((Tool, "description"), (ContentCreator, "name")):
+                old = model._meta.get_field(name)
+                new = old.clone()
+                new.set_attributes_from_name(name)
+                new.model, new.null = model, True
+                editor.alter_field(model, old, new)
+                editor.alter_field(model, new, old)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            self.assertEqual(cursor.fetchall(), [])
+
+        # And the indexes still follow every write
+        def search(model, text):
+            return list(
+                search_module.search(
+                    model.objects.all(),
+                    search_module.INDEXED_FIELDS[model._meta.label],
+                    text,
+                ).values_list("pk", flat=True)
+            )
+
+        brand.name = "Stanley"
+        brand.save()
+        self.assertEqual(search(Tool, "stanley"), [tool.pk])
+        creator = ContentCreator.objects.create(
+            name="ProjectFarm", link="https://example.com"
+        )
+        self.assertEqual(search(ContentCreator, "project"), [creator.pk])
+        creator.delete()
+        self.assertEqual(search(ContentCreator, "project"), [])
+        tool.delete()
+        self.assertEqual(search(Tool, "stanley"), [])
+
+
+class BatchTests(AsyncSchemaTestCase):
+    def test_concurrent_facets(self):
+        # The same connection path in each operation, filtered differently
+        query = """
+            query ($brand: String) {
+                tools(filter: {brand: {name: {exact: $brand}}}) {
+                    facets { category { count } price { count } }
+                }
+            }
+        """
+        brands = ["DeWalt", "Makita", "Ryobi", "Nobody"] * 2
+        response = self.client.post(
+            "/graphql/",
+            [{"query": query, "variables": {"brand": brand}} for brand in brands],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        for brand, result in zip(brands, response.json()):
+            with self.subTest(brand=brand):
+                facets = result["data"]["tools"]["facets"]
+                expected = 0 if brand == "Nobody" else 2
+                self.assertEqual(
+                    sum(facet["count"] for facet in facets["category"]), expected
+                )
+                self.assertEqual(
+                    sum(facet["count"] for facet in facets["price"]), expected
+                )
+
+    def test_operation_contexts(self):
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        view = GraphQLView()
+        first, second = view.get_context(request), view.get_context(request)
+        self.assertIsNot(first.connection_refilters, second.connection_refilters)
+        # Everything else is the request's
+        self.assertEqual(first.user, self.user)
+        first.related_loader = loader = object()
+        self.assertIs(second.related_loader, loader)
+        self.assertIs(request.related_loader, loader)
+
+
+class PersistedQueryTests(AsyncSchemaTestCase):
+    query = "{ tools(first: 1) { edges { node { modelNumber } } } }"
+
+    def post(self, **data):
+        return self.client.post("/graphql/", data, content_type="application/json")
+
+    def persisted(self, sha256):
+        return {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+
+    def test_registered_query_expires(self):
+        sha256 = hashlib.sha256(self.query.encode()).hexdigest()
+        response = self.post(query=self.query, extensions=self.persisted(sha256))
+        self.assertIn("data", response.json())
+        self.assertIn("data", self.post(extensions=self.persisted(sha256)).json())
+
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.post(query=self.query, extensions=self.persisted(sha256))
+        [timeout] = [
+            call.args[2]
+            for call in cache_set.call_args_list
+            if call.args[0] == views.persisted_query_key(sha256)
+        ]
+        self.assertEqual(timeout, views.PERSISTED_QUERY_TIMEOUT)
+
+        cache.delete(views.persisted_query_key(sha256))
+        [error] = self.post(extensions=self.persisted(sha256)).json()["errors"]
+        self.assertEqual(error["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+
+class PopulateDummyDataTests(TestCase):
+    def test_metrics(self):
+        with self.assertRaisesMessage(CommandError, "--metrics"):
+            call_command("populate_dummy_data", "--tools=3", "--metrics=101")
+        self.assertFalse(Metric.objects.exists())
+
+        call_command(
+            "populate_dummy_data",
+            "--tools=3",
+            "--categories=1",
+            "--metrics=100",
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(Metric.objects.count(), 100)
+        self.assertEqual(
+            Metric.objects.aggregate(total=Sum("weighting"))["total"],
+            decimal.Decimal("1.00"),
+        )
@@ -0,0 +1,418 @@
+"""
+Batched upserts.
+
+Each ``upsert_*()`` takes a batch of rows, dicts of field values with
+ForeignKeys as ``<name>_id``, validates the whole batch and writes it in one
+transaction with bulk operations: a query per table to look up what the
+rows refer to, one INSERT and one UPDATE. It returns ``(instance, created,
+errors)`` for each row, in order, where ``errors`` is ``{field: [messages]}``.
+A batch with any errors writes nothing.
+
+Bulk writes send no signals, so the upserts do what the signals would:
+UUIDs (through ``UUIDQuerySet``), generations, score recomputes and the
+search and autocomplete indexes.
+"""
+
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
+from django.db.models import Sum
+
+from . import autocomplete, generations, scoring, search
+from .models import Brand, Category, Metric, Source, Tool, ToolMetric, UUIDModel
+
+MAX_ROWS = getattr(settings, "GRAPHQL_MAX_UPSERT_ROWS", 5000)
+
+MAX_WEIGHTING = decimal.Decimal("1.00")
+
+
+class Batch:
+    """The rows of an upsert, with the errors found in each."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.errors = [{} for _ in self.rows]
+        self.instances = [None] * len(self.rows)
+        self.created = [False] * len(self.rows)
+
+    def error(self, i, field, message):
+        messages = self.errors[i].setdefault(field, [])
+        if message not in messages:
+            messages.append(message)
+
+    def check_required(self, fields):
+        """Report new rows without a value for each of ``fields``."""
+        for i, instance in enumerate(self.instances):
+            for field in fields:
+                if self.created[i] and getattr(instance, field) is None:
+                    self.error(i, field.removesuffix("_id"), "This field is required.")
+
+    def check_exists(self, field, model):
+        """Report rows whose ``field`` names a ``model`` row that doesn't exist."""
+        name = field.removesuffix("_id")
+        pks = {row[field] for row in self.rows if row.get(field) is not None}
+        found = set(
+            model._default_manager.filter(pk__in=pks).values_list("pk", flat=True)
+        )
+        for i, row in enumerate(self.rows):
+            if row.get(field) is not None and row[field] not in found:
+                self.error(i, name, f"No {model._meta.verbose_name} {row[field]}.")
+
+    def check_unique(self, keys):
+        """Report rows with the same key as an earlier row of the batch."""
+        seen = {}
+        for i, key in enumerate(keys):
+            if key is None:
+                continue
+            if key in seen:
+                self.error(i, NON_FIELD_ERRORS, f"Same object as row {seen[key]}.")
+            else:
+                seen[key] = i
+
+    def clean_fields(self, exclude=()):
+        """Validate every instance's fields, as a model form would."""
+        for i, instance in enumerate(self.instances):
+            try:
+                instance.clean_fields(exclude=exclude)
+            except ValidationError as error:
+                for field, messages in error.message_dict.items():
+                    for message in messages:
+                        self.error(i, field, message)
+
+    @property
+    def is_valid(self):
+        return not any(self.errors)
+
+    def results(self):
+        if not self.is_valid:
+            return [(None, False, errors) for errors in self.errors]
+        return list(zip(self.instances, self.created, self.errors))
+
+
+def apply(instance, row, fields):
+    for field in fields:
+        if field in row:
+            setattr(instance, field, row[field])
+
+
+def write(batch, model, fields):
+    """Insert the batch's new instances and update the others' ``fields``."""
+    added = [
+        instance for instance, created in zip(batch.instances, batch.created) if created
+    ]
+    changed = [
+        instance
+        for instance, created in zip(batch.instances, batch.created)
+        if not created
+    ]
+    if added:
+        model.objects.bulk_create(added)
+    if changed and fields:
+        model.objects.bulk_update(changed, fields)
+    # The bulk writes sent no signals
+    generations.invalidate(model, UUIDModel)
+    search.update_index(model, [instance.pk for instance in batch.instances])
+
+
+"""
+Tools
+"""
+
+TOOL_FIELDS = (
+    "name",
+    "model_number",
+    "description",
+    "weight",
+    "price",
+    "noise_level",
+    "brand_id",
+    "category_id",
+)
+
+
+@transaction.atomic
+def upsert_tools(rows):
+    """
+    Create or update tools. A row updates the tool with its ``id``, or else
+    the tool of its brand with its model number, and creates one if there
+    is none. Fields a row leaves out keep their value. As for metrics, a
+    tool with measurements can't move to another category.
+    """
+    batch = Batch(rows)
+    batch.check_exists("brand_id", Brand)
+    batch.check_exists("category_id", Category)
+
+    by_pk = Tool.objects.in_bulk([row["id"] for row in batch.rows if "id" in row])
+    by_model_number = {
+        (tool.brand_id, tool.model_number): tool
+        for tool in Tool.objects.filter(
+            brand_id__in={row.get("brand_id") for row in batch.rows},
+            model_number__in={row.get("model_number") for row in batch.rows},
+        )
+    }
+    # The category of each updated tool now
+    before = {}
+    for i, row in enumerate(batch.rows):
+        if "id" in row:
+            tool = by_pk.get(row["id"])
+            if tool is None:
+                batch.error(i, "id", f"No tool {row['id']}.")
+        else:
+            tool = by_model_number.get((row.get("brand_id"), row.get("model_number")))
+        if tool is None:
+            tool = Tool()
+            batch.created[i] = True
+        else:
+            before.setdefault(tool.pk, tool.category_id)
+        apply(tool, row, TOOL_FIELDS)
+        batch.instances[i] = tool
+    batch.check_unique(
+        tool.pk if tool.pk else (tool.brand_id, tool.model_number)
+        for tool in batch.instances
+    )
+    batch.check_required(["brand_id", "category_id"])
+    # ForeignKeys are checked above, with a query per model
+    batch.clean_fields(exclude=["brand", "category"])
+    # Its measurements are of metrics and sources of the category it's in
+    measured = set(
+        ToolMetric.objects.filter(
+            tool_id__in=[
+                tool.pk
+                for tool in batch.instances
+                if tool.pk in before and tool.category_id != before[tool.pk]
+            ]
+        ).values_list("tool_id", flat=True)
+    )
+    for i, tool in enumerate(batch.instances):
+        if tool.pk in measured:
+            batch.error(
+                i, "category", "A tool with measurements can't change category."
+            )
+
+    if batch.is_valid:
+        fields = sorted(
+            {field for row in batch.rows for field in row} & set(TOOL_FIELDS)
+        )
+        write(batch, Tool, [field.removesuffix("_id") for field in fields])
+        if autocomplete.index.loaded_at is not None:
+            tools = batch.instances
+            transaction.on_commit(lambda: [autocomplete.index.update(t) for t in tools])
+    return batch.results()
+
+
+"""
+Measurements
+"""
+
+
+@transaction.atomic
+def upsert_tool_metrics(rows):
+    """
+    Create or update measurements, by their tool, metric and source. The
+    metric and the source must be of the tool's category.
+    """
+    batch = Batch(rows)
+    categories = {}
+    for field, model in (
+        ("tool_id", Tool),
+        ("metric_id", Metric),
+        ("source_id", Source),
+    ):
+        pks = {row[field] for row in batch.rows if row.get(field) is not None}
+        categories[field] = dict(
+            model._default_manager.filter(pk__in=pks).values_list("pk", "category_id")
+        )
+        for i, row in enumerate(batch.rows):
+            if row.get(field) is not None and row[field] not in categories[field]:
+                batch.error(
+                    i,
+                    field.removesuffix("_id"),
+                    f"No {model._meta.verbose_name} {row[field]}.",
+                )
+
+    for i, row in enumerate(batch.rows):
+        category_id = categories["tool_id"].get(row.get("tool_id"))
+        if category_id is None:
+            continue
+        for field in ("metric_id", "source_id"):
+            other = categories[field].get(row.get(field))
+            if other is not None and other != category_id:
+                batch.error(i, field.removesuffix("_id"), "Not of the tool's category.")
+
+    keys = [
+        (row.get("tool_id"), row.get("metric_id"), row.get("source_id"))
+        for row in batch.rows
+    ]
+    existing = {
+        (tool_id, metric_id, source_id)
+        for tool_id, metric_id, source_id in ToolMetric.objects.filter(
+            tool_id__in={key[0] for key in keys},
+            metric_id__in={key[1] for key in keys},
+            source_id__in={key[2] for key in keys},
+        ).values_list("tool_id", "metric_id", "source_id")
+    }
+    for i, (row, key) in enumerate(zip(batch.rows, keys)):
+        batch.instances[i] = ToolMetric(
+            tool_id=key[0], metric_id=key[1], source_id=key[2], value=row.get("value")
+        )
+        batch.created[i] = key not in existing
+    batch.check_unique(keys)
+    for i, row in enumerate(batch.rows):
+        for field in ("tool_id", "metric_id", "source_id"):
+            if row.get(field) is None:
+                batch.error(i, field.removesuffix("_id"), "This field is required.")
+    batch.clean_fields(exclude=["tool", "metric", "source"])
+
+    if batch.is_valid:
+        # New and existing rows alike: one INSERT ... ON CONFLICT DO UPDATE
+        ToolMetric.objects.bulk_create(
+            batch.instances,
+            update_conflicts=True,
+            unique_fields=["tool", "metric", "source"],
+            update_fields=["value"],
+        )
+        generations.invalidate(ToolMetric, UUIDModel)
+        scoring.schedule({key[2] for key in keys})
+    return batch.results()
+
+
+"""
+Metrics
+"""
+
+METRIC_FIELDS = ("name", "description", "unit", "weighting", "category_id")
+
+
+@transaction.atomic
+def upsert_metrics(rows):
+    """
+    Create or update metrics. A row updates the metric with its ``id``, or
+    else the metric of its category with its name, and creates one if there
+    is none. As ``Metric.clean()`` requires, the weightings of each category
+    can't add up to more than 1.00 once the batch is written; the totals
+    are computed once per category, not per row. A metric with
+    measurements can't move to another category, which its measurements'
+    tools and sources are not of.
+    """
+    batch = Batch(rows)
+    batch.check_exists("category_id", Category)
+
+    by_pk = Metric.objects.in_bulk([row["id"] for row in batch.rows if "id" in row])
+    by_name = {
+        (metric.category_id, metric.name): metric
+        for metric in Metric.objects.filter(
+            category_id__in={row.get("category_id") for row in batch.rows},
+            name__in={row.get("name") for row in batch.rows},
+        )
+    }
+    # The weighting each updated metric adds to its category now
+    before = {}
+    for i, row in enumerate(batch.rows):
+        if "id" in row:
+            metric = by_pk.get(row["id"])
+            if metric is None:
+                batch.error(i, "id", f"No metric {row['id']}.")
+        else:
+            metric = by_name.get((row.get("category_id"), row.get("name")))
+        if metric is None:
+            metric = Metric()
+            batch.created[i] = True
+        elif metric.pk not in before:
+            before[metric.pk] = (metric.category_id, metric.weighting)
+        apply(metric, row, METRIC_FIELDS)
+        batch.instances[i] = metric
+    batch.check_unique(
+        metric.pk if metric.pk else (metric.category_id, metric.name)
+        for metric in batch.instances
+    )
+    # unique_together, within the batch and against the table
+    batch.check_unique((metric.category_id, metric.name) for metric in batch.instances)
+    # Rows updated by id may take a name their rows didn't look up
+    taken = {
+        (category_id, name): pk
+        for category_id, name, pk in Metric.objects.filter(
+            category_id__in={metric.category_id for metric in batch.instances},
+            name__in={metric.name for metric in batch.instances},
+        ).values_list("category_id", "name", "pk")
+    }
+    for i, metric in enumerate(batch.instances):
+        other = taken.get((metric.category_id, metric.name))
+        if other is not None and other != metric.pk:
+            batch.error(i, "name", "The category already has a metric with this name.")
+    batch.check_required(["category_id"])
+    batch.clean_fields(exclude=["category"])
+    check_weightings(batch, before)
+    moved = {
+        metric.pk: (before[metric.pk][0], metric.category_id)
+        for metric in batch.instances
+        if metric.pk in before and metric.category_id != before[metric.pk][0]
+    }
+    # Its measurements are of tools and sources of the category it's in
+    measured = set(
+        ToolMetric.objects.filter(metric_id__in=moved).values_list(
+            "metric_id", flat=True
+        )
+    )
+    for i, metric in enumerate(batch.instances):
+        if metric.pk in measured:
+            batch.error(
+                i, "category", "A metric with measurements can't change category."
+            )
+
+    if batch.is_valid:
+        fields = sorted(
+            {field for row in batch.rows for field in row} & set(METRIC_FIELDS)
+        )
+        write(batch, Metric, [field.removesuffix("_id") for field in fields])
+        if {"weighting", "unit"} & set(fields) and before:
+            # An edited weighting or unit changes the scores of its sources
+            scoring.schedule(
+                ToolMetric.objects.filter(metric_id__in=before)
+                .values_list("source_id", flat=True)
+                .distinct()
+            )
+        if moved:
+            # And a moved one those of the categories it left and joined
+            scoring.schedule(
+                Source.objects.filter(
+                    category_id__in={pk for pks in moved.values() for pk in pks}
+                ).values_list("pk", flat=True)
+            )
+    return batch.results()
+
+
+def check_weightings(batch, before):
+    """Report the rows of every category whose weightings would exceed 1.00."""
+    metrics = [
+        (i, metric)
+        for i, metric in enumerate(batch.instances)
+        if isinstance(metric.weighting, decimal.Decimal)
+        and metric.category_id is not None
+    ]
+    category_ids = {metric.category_id for i, metric in metrics}
+    category_ids |= {category_id for category_id, weighting in before.values()}
+    totals = {
+        category_id: total.quantize(MAX_WEIGHTING)
+        for category_id, total in Metric.objects.filter(category_id__in=category_ids)
+        .values("category_id")
+        .annotate(total=Sum("weighting"))
+        .values_list("category_id", "total")
+    }
+    # Take out the batch's metrics as they are, put them back in as they will be
+    for category_id, weighting in before.values():
+        totals[category_id] -= weighting
+    for i, metric in metrics:
+        totals[metric.category_id] = (
+            totals.get(metric.category_id, 0) + metric.weighting
+        )
+    for i, metric in metrics:
+        total = totals[metric.category_id]
+        if total > MAX_WEIGHTING:
+            batch.error(
+                i,
+                "weighting",
+                f"Total weighting of the category would be {total}; "
+                f"it cannot exceed {MAX_WEIGHTING}.",
+            )
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("export/<slug:name>.<slug:format>", views.export, name="export"),
+]
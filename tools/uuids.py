@@ -0,0 +1,36 @@
+"""
+UUID resolution.
+
+A ``UUIDModel`` row records the model and pk it is for in ``content_type``
+and ``object_id``. Resolving a UUID is a lookup by primary key, and a batch
+of UUIDs costs that one query plus one ``pk__in`` query per model they
+point at.
+"""
+
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+
+from .models import UUIDModel
+
+
+def resolve_many(ids):
+    """``{uuid: instance}`` of the ``ids`` that belong to an object."""
+    pks = defaultdict(dict)
+    for uuid, content_type_id, object_id in UUIDModel.objects.filter(
+        pk__in=ids
+    ).values_list("pk", "content_type_id", "object_id"):
+        pks[content_type_id][object_id] = uuid
+
+    objects = {}
+    for content_type_id, uuids in pks.items():
+        # ContentTypes are cached, so this doesn't query
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for pk, instance in model._default_manager.in_bulk(uuids).items():
+            objects[uuids[pk]] = instance
+    return objects
+
+
+def resolve(id):
+    """The object with UUID ``id``, or None."""
+    return resolve_many([id]).get(id)
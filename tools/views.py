@@ -1,3 +1,139 @@
-from django.shortcuts import render
+"""
+Streaming exports.
 
-# Create your views here.
+``/export/tool-metrics.csv`` (or ``.ndjson``, or ``weighted-averages``)
+streams every matching row straight from a database cursor
+(``.iterator(chunk_size=...)``), so an export of any size runs in
+constant memory. Query parameters filter it as the GraphQL connection's
+filterset does, e.g. ``?value__gte=10&tool__brand__name=DeWalt``.
+"""
+
+import csv
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+
+from . import filters, models
+
+CHUNK_SIZE = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+EXPORTS = {
+    "tool-metrics": (
+        models.ToolMetric,
+        filters.ToolMetricFilter,
+        (
+            "id",
+            "tool_id",
+            "tool__name",
+            "metric_id",
+            "metric__name",
+            "metric__unit",
+            "source_id",
+            "source__link",
+            "value",
+        ),
+    ),
+    "weighted-averages": (
+        models.WeightedAverage,
+        filters.WeightedAverageFilter,
+        (
+            "id",
+            "tool_id",
+            "tool__name",
+            "source_id",
+            "source__link",
+            "score",
+        ),
+    ),
+}
+
+
+class Echo:
+    """File-like object whose ``write`` returns what it was given, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), default=str) + "\n"
+
+
+FORMATS = {
+    "csv": (csv_lines, "text/csv"),
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+}
+
+
+@functools.cache
+def flat_filterset(filterset_class):
+    """
+    ``filterset_class`` accepting its related lookups as flat query
+    parameters (``tool__brand__name``), which the GraphQL input nests.
+    """
+    # An AdvancedFilterSet only expands its RelatedFilters in get_filters()
+    flat = type(filterset_class.__name__, (filterset_class,), {})
+    flat.base_filters = filterset_class.get_filters()
+    return flat
+
+
+def chunks(lines, size=CHUNK_SIZE):
+    """Join ``lines`` into chunks of ``size``, so each write is worth making."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+async def aiterate(iterator):
+    # Under ASGI, Django buffers a sync iterator whole before sending it.
+    # Pulling chunk by chunk from the request's thread keeps the cursor on
+    # its connection.
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
+
+
+def export(request, name, format):
+    if name not in EXPORTS or format not in FORMATS:
+        raise Http404(f"No {name}.{format} export.")
+    model, filterset_class, fields = EXPORTS[name]
+    lines, content_type = FORMATS[format]
+
+    filterset = flat_filterset(filterset_class)(
+        request.GET, queryset=model.objects.all()
+    )
+    if not filterset.is_valid():
+        return JsonResponse({"errors": filterset.errors}, status=400)
+    # Filters through to-many relations join a row per match; export each
+    # filtered row once
+    rows = (
+        model.objects.filter(pk__in=filterset.qs.values("pk"))
+        .order_by("pk")
+        .values_list(*fields)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    content = chunks(lines(fields, rows))
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{name}.{format}"'
+    return response